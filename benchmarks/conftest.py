@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import pygeomhpges
+import pytest
+
+from revertex import kernels
+
+
+@pytest.fixture(scope="session")
+def make_hpges(test_data_configs):
+    """Make an array of detectors, alternating the test detectors.
+
+    Every detector is a separate object, so nothing is cached between them.
+    """
+
+    def _make(n_det, configs=("V99000A", "B99000A")):
+        hpges, positions = {}, {}
+        for idx in range(n_det):
+            config = configs[idx % len(configs)]
+            name = f"{config}_{idx:03d}"
+            hpges[name] = pygeomhpges.make_hpge(
+                f"{test_data_configs}/{config}.yaml", name=name, registry=None
+            )
+            # a grid of strings, 10 cm apart
+            positions[name] = [100.0 * (idx % 10), 100.0 * (idx // 10), 0.0]
+
+        return hpges, positions
+
+    return _make
+
+
+@pytest.fixture(params=[False, True], ids=["numpy", "jit"])
+def jit(request, monkeypatch):
+    """Run a benchmark with the NumPy implementation and with the Numba kernels."""
+    if request.param and not kernels.HAS_NUMBA:
+        pytest.skip("numba is not installed")
+    monkeypatch.setattr(kernels, "ENABLED", request.param)
+    return request.param
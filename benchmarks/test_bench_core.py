@@ -0,0 +1,130 @@
+"""Benchmarks of the conversion and writing of the generated vertices.
+
+Run with ``pytest benchmarks --benchmark-json=bench.json``.
+"""
+
+from __future__ import annotations
+
+import tracemalloc
+
+import awkward as ak
+import lh5
+import numpy as np
+import pytest
+
+from revertex.core import convert_output_kin, convert_output_pos
+from revertex.sinks import BackgroundWriter
+
+N_VTX = 1_000_000
+
+
+def _bytes_per_vertex(func, *args, **kwargs) -> float:
+    """Peak memory allocated by `func` per vertex."""
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak / N_VTX
+
+
+def _convert_and_write(positions, out_file, *, via_awkward=False):
+    if via_awkward:
+        # the path before the columnar fast path, with strided column views
+        positions = ak.Array(
+            {"xloc": positions[:, 0], "yloc": positions[:, 1], "zloc": positions[:, 2]}
+        )
+    lh5.write(convert_output_pos(positions), "vtx/pos", out_file, wo_mode="of")
+
+
+@pytest.fixture
+def positions_c():
+    return np.random.default_rng(1).uniform(size=(N_VTX, 3))
+
+
+@pytest.fixture
+def positions_f(positions_c):
+    return np.asfortranarray(positions_c)
+
+
+def test_convert_pos_awkward(benchmark, positions_c, tmp_path):
+    out_file = tmp_path / "vtx.lh5"
+
+    benchmark.extra_info["bytes_per_vertex"] = _bytes_per_vertex(
+        _convert_and_write, positions_c, out_file, via_awkward=True
+    )
+    benchmark(_convert_and_write, positions_c, out_file, via_awkward=True)
+
+
+@pytest.mark.parametrize("order", ["C", "F"])
+def test_convert_pos_columnar(benchmark, positions_c, positions_f, order, tmp_path):
+    positions = positions_f if order == "F" else positions_c
+    out_file = tmp_path / "vtx.lh5"
+
+    benchmark.extra_info["bytes_per_vertex"] = _bytes_per_vertex(
+        _convert_and_write, positions, out_file
+    )
+    benchmark(_convert_and_write, positions, out_file)
+
+    if order == "F":
+        out = convert_output_pos(positions)
+        assert np.shares_memory(out["xloc"].nda, positions)
+
+
+@pytest.mark.parametrize("jagged", [False, True])
+def test_convert_kin(benchmark, jagged):
+    rng = np.random.default_rng(1)
+    cols = {f: rng.uniform(size=N_VTX) for f in ["px", "py", "pz", "ekin", "time"]}
+    cols["g4_pid"] = np.full(N_VTX, 13)
+
+    arr = ak.Array(cols)
+    if jagged:
+        arr = ak.unflatten(arr, np.full(N_VTX // 2, 2))
+
+    out = benchmark(convert_output_kin, arr)
+    assert out["n_part"].nda.sum() == N_VTX
+
+
+@pytest.mark.parametrize("presized", [False, True])
+def test_background_writer(benchmark, positions_f, tmp_path, presized):
+    n_chunks = 100
+    chunk = convert_output_pos(positions_f[: N_VTX // n_chunks])
+
+    def _write():
+        n_rows = N_VTX if presized else None
+        with BackgroundWriter(tmp_path / "vtx.lh5", n_rows=n_rows) as writer:
+            for _ in range(n_chunks):
+                writer.write(chunk, "vtx/pos")
+
+    benchmark(_write)
+
+
+@pytest.mark.parametrize("precision", ["float32", "float64"])
+@pytest.mark.parametrize("compression", ["none", "gzip", "lzf", "zstd"])
+def test_write_compressed(benchmark, tmp_path, precision, compression):
+    # positions with a realistic spread of values (in mm)
+    positions = np.asfortranarray(
+        np.random.default_rng(1).normal(scale=100, size=(N_VTX, 3))
+    )
+    n_chunks = 10
+    out_file = tmp_path / "vtx.lh5"
+
+    def _write():
+        with BackgroundWriter(out_file, n_rows=N_VTX) as writer:
+            for chunk in np.array_split(positions, n_chunks):
+                writer.write(
+                    convert_output_pos(
+                        chunk, precision=precision, compression=compression
+                    ),
+                    "vtx/pos",
+                )
+
+    benchmark(_write)
+
+    benchmark.extra_info["bytes_per_vertex"] = out_file.stat().st_size / N_VTX
+
+    # no statistics with --benchmark-disable, e.g. in the CI smoke run
+    if benchmark.stats is not None:
+        benchmark.extra_info["vertices_per_second"] = N_VTX / benchmark.stats["mean"]
@@ -0,0 +1,63 @@
+"""Benchmarks of the reading of the detector placements from the geometry."""
+
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from pyg4ometry import geant4
+
+from revertex import utils
+
+# the number of HPGe detectors in LEGEND-1000
+N_DET = 400
+N_STRINGS = 40
+
+
+@pytest.fixture(scope="module")
+def strings_registry():
+    """A geometry of strings of detectors, rotated in a cryostat."""
+    reg = geant4.Registry()
+
+    world_s = geant4.solid.Orb("world_s", 10_000, registry=reg)
+    world_l = geant4.LogicalVolume(world_s, "G4_Galactic", "world_l", registry=reg)
+    reg.setWorld(world_l)
+
+    lar_s = geant4.solid.Tubs("lar_s", 0, 5000, 5000, 0, 2 * np.pi, registry=reg)
+    lar_l = geant4.LogicalVolume(lar_s, "G4_lAr", "lar_l", registry=reg)
+    geant4.PhysicalVolume([0, 0, 0.1], [0, 0, 0], lar_l, "lar", world_l, registry=reg)
+
+    det_s = geant4.solid.Tubs("det_s", 0, 40, 80, 0, 2 * np.pi, registry=reg)
+    names = []
+    for string in range(N_STRINGS):
+        string_s = geant4.solid.Tubs(
+            f"string_{string}_s", 0, 50, 2000, 0, 2 * np.pi, registry=reg
+        )
+        string_l = geant4.LogicalVolume(
+            string_s, "G4_lAr", f"string_{string}_l", registry=reg
+        )
+        phi = 2 * np.pi * string / N_STRINGS
+        geant4.PhysicalVolume(
+            [0, 0, phi],
+            [3000 * np.cos(phi), 3000 * np.sin(phi), 0],
+            string_l,
+            f"string_{string}",
+            lar_l,
+            registry=reg,
+        )
+
+        for pos in range(N_DET // N_STRINGS):
+            name = f"det_{string:02d}_{pos:02d}"
+            det_l = geant4.LogicalVolume(det_s, "G4_Ge", f"{name}_l", registry=reg)
+            geant4.PhysicalVolume(
+                [0, 0, 0], [0, 0, 100 * pos], det_l, name, string_l, registry=reg
+            )
+            names.append(name)
+
+    return reg, names
+
+
+def test_global_transforms(benchmark, strings_registry):
+    reg, names = strings_registry
+
+    transforms = benchmark(utils.get_global_transforms, reg, names)
+    assert len(transforms) == N_DET
@@ -0,0 +1,74 @@
+"""Benchmarks of the parsing of the output of the external generators.
+
+The outputs of musun-gs and SaG4n are synthetic, with random values in the
+format of the real files, so no container is needed.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from revertex.generators import alpha_n, musun_gs
+
+N_EVENTS = 100_000
+
+
+@pytest.fixture(scope="module")
+def musun_output(tmp_path_factory):
+    rng = np.random.default_rng(1)
+
+    # format(i9,i3,f10.1,3f8.1,3f10.6) of musun-gs
+    direction = rng.normal(size=(N_EVENTS, 3))
+    direction /= np.linalg.norm(direction, axis=1, keepdims=True)
+    data = np.column_stack(
+        [
+            np.arange(1, N_EVENTS + 1),
+            rng.choice([10, 11], size=N_EVENTS),
+            rng.exponential(300, size=N_EVENTS),
+            rng.uniform(-2000, 2000, size=(N_EVENTS, 3)),
+            direction,
+        ]
+    )
+
+    path = tmp_path_factory.mktemp("musun") / "muons.out"
+    fmt = ["%9d", "%3d", "%10.1f"] + ["%8.1f"] * 3 + ["%10.6f"] * 3
+    np.savetxt(path, data, fmt=fmt, delimiter="")
+    return path
+
+
+@pytest.fixture(scope="module")
+def sag4n_output(tmp_path_factory):
+    rng = np.random.default_rng(1)
+
+    # one neutron per event, with a gamma for a third of them
+    evtid = np.arange(N_EVENTS)
+    has_gamma = rng.uniform(size=N_EVENTS) < 1 / 3
+    evtid = np.sort(np.concatenate([evtid, evtid[has_gamma]]))
+    particle = np.where(np.diff(evtid, prepend=-1) == 0, "gamma", "neutron")
+    values = rng.uniform(size=(len(evtid), 8))
+
+    path = tmp_path_factory.mktemp("sag4n") / "sag4n.out"
+    with path.open("w") as f:
+        f.write("# synthetic SaG4n output\n")
+        f.write("EventNumber particle ekin weight x y z px py pz\n")
+        for idx, part, row in zip(evtid, particle, values, strict=True):
+            f.write(f"{idx} {part} " + " ".join(f"{v:.6g}" for v in row) + "\n")
+
+    return path
+
+
+def test_parse_musun_output(benchmark, musun_output):
+    kin, pos = benchmark(musun_gs._parse_output, musun_output)
+    assert len(kin) == len(pos) == N_EVENTS
+
+
+def test_read_sag4n_output(benchmark, sag4n_output):
+    input_data = {
+        "output_file_sag4n": sag4n_output,
+        "n_events": N_EVENTS,
+        "source_chain": "Th232",
+    }
+
+    output = benchmark(alpha_n.read_sag4n_output, input_data)
+    assert np.sum(output["evts"]["particle"] == "neutron") == N_EVENTS
@@ -0,0 +1,126 @@
+"""Benchmarks of the sampling functions and the HPGe vertex generators.
+
+Run with ``pytest benchmarks --benchmark-json=bench.json``, and compare the
+results of two commits with ``pytest-benchmark compare``.
+"""
+
+from __future__ import annotations
+
+import hist
+import numpy as np
+import pytest
+
+from revertex import sampling, utils
+from revertex.generators import borehole, shell, surface
+
+N_VTX = 1_000_000
+
+# the HPGe generators set up every detector, so fewer vertices are enough
+N_VTX_HPGE = 100_000
+
+
+@pytest.mark.usefixtures("jit")
+@pytest.mark.parametrize("reuse", [False, True])
+def test_sample_cylinder(benchmark, reuse):
+    # as in the rejection sampling loops, which reuse the proposal buffer
+    out = np.empty((N_VTX, 3), order="F") if reuse else None
+
+    coords = benchmark(
+        sampling.sample_cylinder, (10, 40), (0, 80), N_VTX, seed=1, out=out
+    )
+    assert coords.shape == (N_VTX, 3)
+
+
+@pytest.mark.parametrize("ndim", [1, 2])
+def test_sample_histogram(benchmark, ndim):
+    rng = np.random.default_rng(1)
+
+    if ndim == 1:
+        histo = hist.Hist.new.Reg(1000, 0, 10).Double()
+        histo.fill(rng.exponential(size=N_VTX))
+    else:
+        histo = hist.Hist.new.Reg(100, 0, 10).Reg(100, 0, 10).Double()
+        histo.fill(rng.exponential(size=N_VTX), rng.uniform(0, 10, size=N_VTX))
+
+    benchmark(sampling.sample_histogram, histo, N_VTX, seed=1)
+
+
+@pytest.mark.parametrize("n_bins", [100, 100_000])
+@pytest.mark.parametrize("reuse", [False, True])
+def test_histogram_sampler(benchmark, n_bins, reuse):
+    # a finely binned spectrum, sampled in chunks as in the beta generator
+    histo = hist.Hist.new.Reg(n_bins, 0, 10).Double()
+    histo.fill(np.random.default_rng(1).exponential(size=N_VTX))
+    sampler = sampling.HistogramSampler(histo)
+
+    def _sample():
+        if reuse:
+            return sampler.sample(N_VTX, seed=1)
+        return sampling.sample_histogram(histo, N_VTX, seed=1)
+
+    assert len(benchmark(_sample)) == N_VTX
+
+
+@pytest.mark.usefixtures("jit")
+def test_sample_proportional_radius(benchmark):
+    rng = np.random.default_rng(1)
+    r0, r1 = rng.uniform(0, 40, size=N_VTX), rng.uniform(0, 40, size=N_VTX)
+
+    r = benchmark(sampling.sample_proportional_radius, r0, r1, size=N_VTX, seed=1)
+    assert len(r) == N_VTX
+
+
+@pytest.mark.usefixtures("jit")
+@pytest.mark.parametrize("n_det", [1, 10, 100])
+def test_sample_hpge_surface(benchmark, make_hpges, n_det):
+    hpges, positions = make_hpges(n_det)
+
+    coords = benchmark(
+        surface.sample_hpge_surface,
+        N_VTX_HPGE,
+        seed=1,
+        hpges=hpges,
+        positions=positions,
+        surface_type="nplus",
+    )
+    assert coords.shape == (N_VTX_HPGE, 3)
+
+
+@pytest.mark.parametrize("n_det", [1, 10, 100])
+def test_sample_hpge_shell(benchmark, make_hpges, n_det):
+    hpges, positions = make_hpges(n_det)
+
+    coords = benchmark(
+        shell.sample_hpge_shell,
+        N_VTX_HPGE,
+        seed=1,
+        hpges=hpges,
+        positions=positions,
+        distance=1,
+        surface_type="nplus",
+    )
+    assert coords.shape == (N_VTX_HPGE, 3)
+
+
+@pytest.mark.parametrize("n_det", [1, 10, 100])
+def test_sample_hpge_borehole(benchmark, make_hpges, n_det):
+    # only the inverted coaxial detectors have a borehole
+    hpges, positions = make_hpges(n_det, configs=("V99000A",))
+
+    coords = benchmark(
+        borehole.sample_hpge_borehole,
+        N_VTX_HPGE,
+        seed=1,
+        hpges=hpges,
+        positions=positions,
+    )
+    assert coords.shape == (N_VTX_HPGE, 3)
+
+
+def test_borehole_weights(benchmark, make_hpges):
+    # computed for every chunk of the borehole sampling, from the cached
+    # volumes after the first one
+    hpges, _ = make_hpges(100, configs=("V99000A",))
+
+    weights = benchmark(utils.get_borehole_weights, hpges)
+    assert len(weights) == 100
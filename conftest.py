@@ -0,0 +1,13 @@
+"""Fixtures shared by the tests and the benchmarks."""
+
+from __future__ import annotations
+
+import pytest
+from legendtestdata import LegendTestData
+
+
+@pytest.fixture(scope="session")
+def test_data_configs():
+    ldata = LegendTestData()
+    ldata.checkout("8247690")
+    return ldata.get_path("legend/metadata/hardware/detectors/germanium/diodes")
@@ -1,7 +1,27 @@
 from __future__ import annotations
 
-from revertex import core, plot, sampling, utils
+import importlib
 
 from ._version import version as __version__
 
-__all__ = ["__version__", "cli", "core", "generators", "plot", "sampling", "utils"]
+__all__ = [
+    "__version__",
+    "cache",
+    "cli",
+    "core",
+    "generators",
+    "plot",
+    "sampling",
+    "sinks",
+    "utils",
+]
+
+
+def __getattr__(name: str):
+    # the submodules are imported on first use, so that e.g. the command line
+    # interface does not pay for the geometry packages it does not need
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
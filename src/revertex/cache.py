@@ -0,0 +1,257 @@
+"""On-disk cache of the detectors read from the GDML geometry.
+
+Reading the detectors of a geometry (parsing the GDML, building the
+:class:`pygeomhpges.HPGe` objects and resolving their placements) can take
+longer than generating the vertices of a job. The :class:`GeometryCache`
+stores the result, with the sampling tables of the detectors (see
+:class:`.utils.DetectorSamplingCache`), so the next runs on the same
+geometry do not parse the GDML.
+
+The entries are keyed by the content of the GDML file and the versions of
+revertex and :mod:`pygeomhpges`, so they are never stale: a modified
+geometry or a new version of the packages gives a new entry. The least
+recently used entries are removed when the cache grows over its size cap.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+from revertex import utils
+
+log = logging.getLogger(__name__)
+
+# the size cap of the cache, in bytes
+DEFAULT_MAX_SIZE = 512 * 1024**2
+
+# bumped when the content of the entries changes
+_FORMAT = 2
+
+
+def default_cache_dir() -> Path:
+    """The directory of the cache.
+
+    ``$REVERTEX_CACHE_DIR`` if set, otherwise ``revertex`` in
+    ``$XDG_CACHE_HOME`` (by default ``~/.cache``).
+    """
+    if "REVERTEX_CACHE_DIR" in os.environ:
+        return Path(os.environ["REVERTEX_CACHE_DIR"])
+
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "revertex"
+
+
+def file_hash(path: str | Path) -> str:
+    """The SHA-256 hash of the content of a file."""
+    sha = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        while block := f.read(1024**2):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class GeometryCache:
+    """Cache of the detectors of GDML geometries, in a directory.
+
+    Every entry holds, for the detectors read from a geometry, their
+    metadata (from which the :class:`pygeomhpges.HPGe` objects are rebuilt),
+    their global placements (see :func:`.utils.get_hpges`) and their
+    sampling tables. It also holds the names of all the physical volumes,
+    so the detector patterns can be matched without the geometry.
+
+    Several runs can share the cache, e.g. concurrent jobs of a workflow:
+    the entries are written atomically, and the entries removed by another
+    run are skipped.
+
+    The entries are read with :mod:`pickle`, which can execute arbitrary
+    code, so the cache directory must not be writable by untrusted users.
+
+    Parameters
+    ----------
+    directory
+        The directory of the cache, see :func:`default_cache_dir`.
+    max_size
+        The size cap of the cache in bytes, the least recently used entries
+        are removed above it.
+    """
+
+    def __init__(
+        self, directory: str | Path | None = None, max_size: int = DEFAULT_MAX_SIZE
+    ):
+        self.directory = (
+            Path(directory) if directory is not None else default_cache_dir()
+        )
+        self.max_size = max_size
+
+    def key(self, gdml: str | Path) -> str:
+        """The key of the entry of a geometry."""
+        import pygeomhpges  # noqa: PLC0415
+
+        from revertex import __version__  # noqa: PLC0415
+
+        versions = f"{_FORMAT}:{__version__}:{pygeomhpges.__version__}"
+        return hashlib.sha256(f"{file_hash(gdml)}:{versions}".encode()).hexdigest()
+
+    def path(self, key: str) -> Path:
+        """The file of an entry."""
+        return self.directory / f"{key}.pkl"
+
+    def read_hpges(
+        self,
+        gdml: str | Path,
+        detectors: str | list[str],
+        surface_types: tuple[str | None, ...] = (None,),
+    ) -> tuple[dict, dict]:
+        """Read the HPGe objects and placements of the `detectors` in a geometry.
+
+        They are read from the cache if all the detectors are in the entry of
+        the geometry. Otherwise the GDML is parsed, and the detectors with
+        their sampling tables for `surface_types` are added to the entry.
+
+        Returns
+        -------
+        the HPGe objects and their placements, as :func:`.utils.get_hpges`.
+        """
+        key = self.key(gdml)
+        entry = self._load(key)
+
+        if entry is not None:
+            det_list = utils.expand_regex(entry["volumes"], list(detectors))
+
+            if all(name in entry["detectors"] for name in det_list):
+                log.info("Read the detectors of %s from the cache", gdml)
+                return self._restore(entry, det_list)
+
+        # the geometry packages are slow to import, only import them when needed
+        import pyg4ometry  # noqa: PLC0415
+
+        reg = pyg4ometry.gdml.Reader(str(gdml)).getRegistry()
+        hpges, pos = utils.get_hpges(reg, detectors)
+
+        if entry is None:
+            entry = {"volumes": list(reg.physicalVolumeDict), "detectors": {}}
+
+        for name, hpge in hpges.items():
+            entry["detectors"][name] = {
+                "metadata": hpge.metadata,
+                "placement": pos[name],
+                "tables": {
+                    surface_type: utils.DetectorSamplingCache.get(hpge, surface_type)
+                    for surface_type in surface_types
+                },
+            }
+
+        self._store(key, entry)
+        return hpges, pos
+
+    def _restore(self, entry: dict, det_list: list[str]) -> tuple[dict, dict]:
+        """Rebuild the detectors of an entry, with their sampling tables."""
+        import pygeomhpges  # noqa: PLC0415
+
+        hpges, pos = {}, {}
+        for name in det_list:
+            det = entry["detectors"][name]
+            hpges[name] = pygeomhpges.make_hpge(det["metadata"], registry=None)
+            pos[name] = det["placement"]
+
+            for surface_type, tables in det["tables"].items():
+                utils.DetectorSamplingCache.put(hpges[name], surface_type, tables)
+
+        return hpges, pos
+
+    def _load(self, key: str) -> dict | None:
+        """Load an entry, None if it is not in the cache or cannot be read."""
+        path = self.path(key)
+
+        try:
+            with path.open("rb") as f:
+                entry = pickle.load(f)
+        except OSError:
+            # not in the cache, or the cache cannot be read (e.g. permissions)
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            log.warning("Removing the unreadable cache entry %s (%s)", path, e)
+            path.unlink(missing_ok=True)
+            return None
+
+        # the access time is not updated on every file system, the entries are
+        # ordered by their modification time instead. The entry may have been
+        # evicted by a concurrent run in the meantime, it is not recreated.
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+        return entry
+
+    def _store(self, key: str, entry: dict) -> None:
+        """Write an entry, atomically, and evict the least recently used ones.
+
+        The cache only speeds up the next runs, so an entry that cannot be
+        written (e.g. to a read-only directory) is skipped with a warning.
+        """
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+            # written to a temporary file first, so a concurrent run never
+            # reads a partial entry
+            with tempfile.NamedTemporaryFile(
+                dir=self.directory, suffix=".tmp", delete=False
+            ) as f:
+                try:
+                    pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+                except BaseException:
+                    Path(f.name).unlink()
+                    raise
+            Path(f.name).replace(self.path(key))
+        except OSError as e:
+            log.warning("Could not write the cache entry to %s (%s)", self.directory, e)
+            return
+
+        self.evict()
+
+    def _stat_entries(self) -> list[tuple[Path, os.stat_result]]:
+        """The entries and their status, from the least to the most recently used.
+
+        The entries removed by a concurrent run while they are listed are
+        skipped.
+        """
+        if not self.directory.is_dir():
+            return []
+
+        entries = []
+        for path in self.directory.glob("*.pkl"):
+            try:
+                entries.append((path, path.stat()))
+            except FileNotFoundError:
+                continue
+
+        return sorted(entries, key=lambda entry: entry[1].st_mtime)
+
+    def entries(self) -> list[Path]:
+        """The files of the entries, from the least to the most recently used."""
+        return [path for path, _ in self._stat_entries()]
+
+    def size(self) -> int:
+        """The total size of the entries, in bytes."""
+        return sum(stat.st_size for _, stat in self._stat_entries())
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the cache fits its size cap."""
+        entries = self._stat_entries()
+        size = sum(stat.st_size for _, stat in entries)
+
+        for path, stat in entries:
+            if size <= self.max_size:
+                break
+            size -= stat.st_size
+            path.unlink(missing_ok=True)
+            log.debug("Evicted %s from the cache", path)
+
+    def clear(self) -> None:
+        """Remove all the entries."""
+        for path in self.entries():
+            path.unlink(missing_ok=True)
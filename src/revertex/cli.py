@@ -3,15 +3,50 @@ from __future__ import annotations
 import argparse
 import logging
 import random
+import re
 
-import pyg4ometry
-
-from revertex import core, utils
-from revertex.generators import alpha_n, beta, borehole, musun_gs, shell, surface
+from revertex import cache, utils
 from revertex.utils import setup_log
 
 log = logging.getLogger(__name__)
 
+_MEMORY_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+# the choices of the options, as in the modules (e.g. core.COMPRESSIONS) which
+# are only imported by the commands, so the interface starts quickly
+_COMPRESSIONS = ("none", "gzip", "lzf", "zstd")
+_QMC_ENGINES = ("sobol", "halton")
+_PROFILERS = ("cprofile", "tracemalloc")
+_MUSUN_DIMENSIONS = ("original", "hall_c")
+_MUSUN_CONTAINER_IMAGE = "ghcr.io/legend-exp/musun-gs:latest"
+
+
+def _parse_memory(value: str) -> int:
+    """Parse a memory size like ``4G`` or ``500MB`` into bytes."""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?)(i?B)?\s*", value, re.IGNORECASE)
+
+    if match is None:
+        msg = f"invalid memory size {value!r}, expected e.g. 4G or 500MB"
+        raise argparse.ArgumentTypeError(msg)
+
+    return int(float(match.group(1)) * _MEMORY_UNITS[match.group(2).upper()])
+
+
+def _read_hpges(
+    args: argparse.Namespace, surface_type: str | None = None
+) -> tuple[dict, dict]:
+    """Read the HPGe objects and positions of the `detectors` in the geometry."""
+    if not args.no_cache:
+        # the detectors (and their sampling tables) of the geometry are cached
+        geom_cache = cache.GeometryCache(args.cache_dir, max_size=args.cache_max_size)
+        return geom_cache.read_hpges(args.gdml, args.detectors, (surface_type,))
+
+    # the geometry packages are only imported by the commands that need them
+    import pyg4ometry  # noqa: PLC0415
+
+    reg = pyg4ometry.gdml.Reader(args.gdml).getRegistry()
+    return utils.get_hpges(reg, args.detectors)
+
 
 def cli(args=None) -> None:
     parser = argparse.ArgumentParser(
@@ -34,6 +69,69 @@ def cli(args=None) -> None:
         type=int,
         help="Seed for rng",
     )
+    parser.add_argument(
+        "--max-memory",
+        default=None,
+        type=_parse_memory,
+        help="Memory budget (e.g. 4G or 500MB), the number of events generated per chunk is chosen to fit in it",
+    )
+    parser.add_argument(
+        "--precision",
+        default="float64",
+        choices=["float32", "float64"],
+        help="Floating point type of the output (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--compression",
+        default=None,
+        choices=_COMPRESSIONS,
+        help="Compression of the output datasets (default: gzip)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue a previous run from the checkpoint in its output (hpge-*-pos and musun-gs commands)",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Record the peak memory of every chunk with tracemalloc (slower)",
+    )
+    parser.add_argument(
+        "--qmc",
+        default=None,
+        choices=_QMC_ENGINES,
+        help="Generate the HPGe positions from a scrambled low-discrepancy sequence (quasi-Monte Carlo)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Directory of the cache of the detectors read from the GDML (default: $REVERTEX_CACHE_DIR or ~/.cache/revertex)",
+    )
+    parser.add_argument(
+        "--cache-max-size",
+        default=cache.DEFAULT_MAX_SIZE,
+        type=_parse_memory,
+        help="Size cap of the cache (e.g. 1G), the least recently used entries are removed above it",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always read the detectors from the GDML, without the cache",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        choices=_PROFILERS,
+        help="Profile the run, the profile is written next to the output file (e.g. out.prof)",
+    )
+    parser.add_argument(
+        "--profile-chunks",
+        default=None,
+        type=int,
+        metavar="K",
+        help="Only profile the first K chunks",
+    )
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     # beta spectra
@@ -110,6 +208,26 @@ def cli(args=None) -> None:
         type=int,
         help="Number of events to generate",
     )
+    hpge_surface_parser.add_argument(
+        "--jobs",
+        "-j",
+        default=1,
+        type=int,
+        help="Number of worker processes generating the vertices in parallel",
+    )
+    hpge_surface_parser_files = hpge_surface_parser.add_mutually_exclusive_group()
+    hpge_surface_parser_files.add_argument(
+        "--n-files",
+        default=None,
+        type=int,
+        help="Split the output into this number of files (out_000.lh5, out_001.lh5, ...)",
+    )
+    hpge_surface_parser_files.add_argument(
+        "--events-per-file",
+        default=None,
+        type=int,
+        help="Split the output into files with this number of events",
+    )
 
     hpge_shell_parser = subparsers.add_parser(
         "hpge-shell-pos", help="Generate samples from the shell of the HPGes"
@@ -151,6 +269,26 @@ def cli(args=None) -> None:
         type=int,
         help="Number of events to generate",
     )
+    hpge_shell_parser.add_argument(
+        "--jobs",
+        "-j",
+        default=1,
+        type=int,
+        help="Number of worker processes generating the vertices in parallel",
+    )
+    hpge_shell_parser_files = hpge_shell_parser.add_mutually_exclusive_group()
+    hpge_shell_parser_files.add_argument(
+        "--n-files",
+        default=None,
+        type=int,
+        help="Split the output into this number of files (out_000.lh5, out_001.lh5, ...)",
+    )
+    hpge_shell_parser_files.add_argument(
+        "--events-per-file",
+        default=None,
+        type=int,
+        help="Split the output into files with this number of events",
+    )
     hpge_shell_parser.add_argument(
         "--radius",
         "-r",
@@ -193,6 +331,26 @@ def cli(args=None) -> None:
         type=int,
         help="Number of events to generate",
     )
+    hpge_borehole_parser.add_argument(
+        "--jobs",
+        "-j",
+        default=1,
+        type=int,
+        help="Number of worker processes generating the vertices in parallel",
+    )
+    hpge_borehole_parser_files = hpge_borehole_parser.add_mutually_exclusive_group()
+    hpge_borehole_parser_files.add_argument(
+        "--n-files",
+        default=None,
+        type=int,
+        help="Split the output into this number of files (out_000.lh5, out_001.lh5, ...)",
+    )
+    hpge_borehole_parser_files.add_argument(
+        "--events-per-file",
+        default=None,
+        type=int,
+        help="Split the output into files with this number of events",
+    )
 
     alpha_n_parser = subparsers.add_parser(
         "alpha-n-kin",
@@ -291,7 +449,7 @@ def cli(args=None) -> None:
         type=str,
         default="original",
         help="Use default dimensions for the sampling cuboid. Options are ["
-        + ", ".join(musun_gs.DEFAULT_DIMENSIONS.keys())
+        + ", ".join(_MUSUN_DIMENSIONS)
         + ", custom] (default: original). If 'custom' is selected, the user must provide --dx-cm, --dy-cm, --dz-cm, center_x-cm, center_y-cm, center_z-cm to specify the dimensions of the sampling cuboid.",
     )
     musun_gs_parser.add_argument(
@@ -328,7 +486,7 @@ def cli(args=None) -> None:
     musun_gs_parser.add_argument(
         "--container-image",
         type=str,
-        default=musun_gs.DEFAULT_CONTAINER_IMAGE,
+        default=_MUSUN_CONTAINER_IMAGE,
         help="Docker/Shifter image to use (default: %(default)s).",
     )
     musun_gs_parser.add_argument(
@@ -340,19 +498,48 @@ def cli(args=None) -> None:
 
     args = parser.parse_args(args)
 
+    if args.profile_chunks is not None and args.profile is None:
+        parser.error("--profile-chunks requires --profile")
+    if args.qmc is not None and not args.command.startswith("hpge-"):
+        parser.error("--qmc is only supported by the hpge-*-pos commands")
+    if args.resume and not (
+        args.command.startswith("hpge-") or args.command == "musun-gs"
+    ):
+        parser.error(
+            "--resume is only supported by the hpge-*-pos and musun-gs commands"
+        )
+
     log_level = (None, logging.INFO, logging.DEBUG)[min(args.verbose, 2)]
     setup_log(log_level)
 
+    if args.profile is None:
+        _run(args)
+        return
+
+    from revertex import profiling  # noqa: PLC0415
+
+    out_file = args.output_file if args.command == "alpha-n-kin" else args.out_file
+    with profiling.Profiler(args.profile, out_file, n_chunks=args.profile_chunks):
+        _run(args)
+
+
+def _run(args: argparse.Namespace) -> None:
     if args.command == "beta-kin":
         msg = f"Generating beta kinematics from {args.input_file} to {args.out_file} and seed {args.seed}"
         log.info(msg)
 
+        from revertex.generators import beta  # noqa: PLC0415
+
         beta.save_beta_spectrum(
             n_gen=args.n_events,
             out_file=args.out_file,
             in_file=args.input_file,
             seed=args.seed,
             eunit=args.eunit,
+            max_memory=args.max_memory,
+            precision=args.precision,
+            compression=args.compression,
+            trace_memory=args.trace_memory,
         )
 
     elif args.command == "hpge-surf-pos":
@@ -363,16 +550,25 @@ def cli(args=None) -> None:
         msg += f"detectors: {args.detectors} ({args.surface_type})"
         log.info(msg)
 
-        # read the registry
-        reg = pyg4ometry.gdml.Reader(args.gdml).getRegistry()
+        from revertex import core  # noqa: PLC0415
+        from revertex.generators import surface  # noqa: PLC0415
 
-        hpges, pos = utils.get_hpges(reg, args.detectors)
+        hpges, pos = _read_hpges(args, args.surface_type)
 
         core.write_remage_vtx(
             args.n_events,
             args.out_file,
             args.seed,
             surface.sample_hpge_surface,
+            workers=args.jobs,
+            n_files=args.n_files,
+            events_per_file=args.events_per_file,
+            max_memory=args.max_memory,
+            precision=args.precision,
+            compression=args.compression,
+            trace_memory=args.trace_memory,
+            resume=args.resume,
+            qmc=args.qmc,
             hpges=hpges,
             positions=pos,
             surface_type=args.surface_type,
@@ -386,16 +582,25 @@ def cli(args=None) -> None:
         msg += f"radius : {args.radius}"
         log.info(msg)
 
-        # read the registry
-        reg = pyg4ometry.gdml.Reader(args.gdml).getRegistry()
+        from revertex import core  # noqa: PLC0415
+        from revertex.generators import shell  # noqa: PLC0415
 
-        hpges, pos = utils.get_hpges(reg, args.detectors)
+        hpges, pos = _read_hpges(args, args.surface_type)
 
         core.write_remage_vtx(
             args.n_events,
             args.out_file,
             args.seed,
             shell.sample_hpge_shell,
+            workers=args.jobs,
+            n_files=args.n_files,
+            events_per_file=args.events_per_file,
+            max_memory=args.max_memory,
+            precision=args.precision,
+            compression=args.compression,
+            trace_memory=args.trace_memory,
+            resume=args.resume,
+            qmc=args.qmc,
             hpges=hpges,
             positions=pos,
             distance=args.radius,
@@ -405,6 +610,8 @@ def cli(args=None) -> None:
         msg = "Generating musun-gs muon kinematics and vertices to %s with seed %s"
         log.info(msg, args.out_file, args.seed)
 
+        from revertex.generators import musun_gs  # noqa: PLC0415
+
         if (
             args.default_dimensions != "custom"
             and args.default_dimensions in musun_gs.DEFAULT_DIMENSIONS
@@ -416,6 +623,11 @@ def cli(args=None) -> None:
                 default_dimensions=args.default_dimensions,
                 container_image=args.container_image,
                 container_runtime=args.container_runtime,
+                max_memory=args.max_memory,
+                precision=args.precision,
+                compression=args.compression,
+                trace_memory=args.trace_memory,
+                resume=args.resume,
             )
         elif args.default_dimensions == "custom":
             musun_gs.generate_musun_primaries(
@@ -430,6 +642,11 @@ def cli(args=None) -> None:
                 center_z_cm=args.center_z_cm,
                 container_image=args.container_image,
                 container_runtime=args.container_runtime,
+                max_memory=args.max_memory,
+                precision=args.precision,
+                compression=args.compression,
+                trace_memory=args.trace_memory,
+                resume=args.resume,
             )
         else:
             msg = f"Invalid value for --default-dimensions: {args.default_dimensions}. Valid options are: {', '.join(musun_gs.DEFAULT_DIMENSIONS.keys())}, custom."
@@ -443,16 +660,25 @@ def cli(args=None) -> None:
         msg += f"detectors: {args.detectors}"
         log.info(msg)
 
-        # read the registry
-        reg = pyg4ometry.gdml.Reader(args.gdml).getRegistry()
+        from revertex import core  # noqa: PLC0415
+        from revertex.generators import borehole  # noqa: PLC0415
 
-        hpges, pos = utils.get_hpges(reg, args.detectors)
+        hpges, pos = _read_hpges(args)
 
         core.write_remage_vtx(
             args.n_events,
             args.out_file,
             args.seed,
             borehole.sample_hpge_borehole,
+            workers=args.jobs,
+            n_files=args.n_files,
+            events_per_file=args.events_per_file,
+            max_memory=args.max_memory,
+            precision=args.precision,
+            compression=args.compression,
+            trace_memory=args.trace_memory,
+            resume=args.resume,
+            qmc=args.qmc,
             hpges=hpges,
             positions=pos,
         )
@@ -466,6 +692,7 @@ def cli(args=None) -> None:
             "n_events": args.n_events,
             "seed": args.seed,
             "container_image": args.container_image,
+            "trace_memory": args.trace_memory,
         }
 
         pathway_sag4n = args.input_file_sag4n != ""
@@ -529,4 +756,6 @@ def cli(args=None) -> None:
             msg += f"container-image: {args.container_image} \n"
         log.info(msg)
 
+        from revertex.generators import alpha_n  # noqa: PLC0415
+
         alpha_n.generate_alpha_n_spectrum(input_data)
@@ -1,52 +1,182 @@
 from __future__ import annotations
 
+import hashlib
+import io
+import json
 import logging
-from collections.abc import Callable
+import multiprocessing as mp
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+from collections import deque
+from collections.abc import Callable, Iterator, Mapping
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+from pathlib import Path
+from typing import Literal, Self
 
 import awkward as ak
-import lh5
 import numpy as np
-from lgdo.types import Array, Table
-from numpy.typing import ArrayLike
+from lgdo.types import Array, Scalar, Struct, Table
+from numpy.typing import ArrayLike, NDArray
+
+from revertex import sampling
+from revertex.sinks import CHECKPOINT, PERF, Sink, as_sink
 
 log = logging.getLogger(__name__)
 
+# default number of vertices generated per chunk
+_CHUNK_SIZE = 1_000_000
+
+# range of the chunk size and fraction of the available memory used when the
+# chunk size is chosen automatically
+_MIN_CHUNK_SIZE = 10_000
+_MAX_CHUNK_SIZE = 50_000_000
+_MEMORY_FRACTION = 0.5
+
+# peak memory per event of a generator that does not define `bytes_per_event`
+_DEFAULT_BYTES_PER_EVENT = 1000
+
+# memory per vertex of a generated and converted chunk waiting to be written
+_BYTES_PER_OUTPUT_VERTEX = 48
+
+# floating point type and compression options of the output
+Precision = Literal["float32", "float64"]
+Compression = Literal["none", "gzip", "lzf", "zstd"]
+COMPRESSIONS = ("none", "gzip", "lzf", "zstd")
+
+# generator function and keyword arguments of a worker process, set once when
+# the worker is started
+_worker_state: dict = {}
+
+# functions called with the number of chunks done after every chunk of a run,
+# e.g. to stop profiling after the first chunks
+CHUNK_CALLBACKS: list[Callable[[int], None]] = []
+
+
+class _WorkerPickler(pickle.Pickler):
+    """Pickler for the generator arguments sent to the worker processes.
+
+    :class:`pygeomhpges.HPGe` objects keep a reference to a registry which
+    cannot be pickled, so they are rebuilt from their metadata instead.
+    """
+
+    def reducer_override(self, obj):
+        pygeomhpges = sys.modules.get("pygeomhpges")
+
+        if pygeomhpges is not None and isinstance(obj, pygeomhpges.HPGe):
+            return partial(pygeomhpges.make_hpge, name=obj.name), (obj.metadata, None)
+
+        return NotImplemented
+
+
+def hdf5_settings(compression: Compression | None) -> dict:
+    """Get the HDF5 dataset settings of a compression option.
+
+    Parameters
+    ----------
+    compression
+        The compression of the output datasets, either `none`, `gzip`, `lzf`
+        or `zstd` (requires :mod:`hdf5plugin`). If `None` the default
+        settings of :mod:`lh5` are used.
+
+    Returns
+    -------
+    The keyword arguments of :meth:`h5py.Group.create_dataset`.
+    """
+    if compression is None:
+        return {}
+    if compression == "none":
+        return {"compression": None, "shuffle": False}
+    if compression in ("gzip", "lzf"):
+        return {"compression": compression, "shuffle": True}
+    if compression == "zstd":
+        import hdf5plugin  # noqa: PLC0415
+
+        return {**hdf5plugin.Zstd(), "shuffle": True}
+
+    msg = f"unknown compression {compression}, expected one of {COMPRESSIONS}"
+    raise ValueError(msg)
+
+
+def _column_attrs(attrs: dict, compression: Compression | None) -> dict:
+    if compression is not None:
+        attrs["hdf5_settings"] = hdf5_settings(compression)
+    return attrs
+
+
+def _as_column(col: ak.Array | ArrayLike, dtype) -> NDArray:
+    """Get a contiguous 1D NumPy column of type `dtype`, copying only if needed."""
+    if isinstance(col, ak.Array):
+        col = ak.to_numpy(col)
+
+    col = np.ascontiguousarray(col, dtype=dtype)
+    assert col.ndim == 1
+
+    return col
+
 
 def convert_output_pos(
-    arr: ak.Array,
+    arr: ak.Array | Mapping[str, ArrayLike] | NDArray,
     *,
     lunit: str = "mm",
+    precision: Precision = "float64",
+    compression: Compression | None = None,
 ) -> Table:
     """Converts the vertices to the correct output format for `pos` information.
 
+    NumPy columns that are contiguous and of type `precision` (e.g. the
+    columns of an `(n,3)` array in Fortran order) are used directly, without
+    copying.
+
     Parameters
     ----------
     arr
-        The input data to convert.
+        The input data to convert, either an array with `xloc`, `yloc` and
+        `zloc` fields, a mapping of these field names to 1D arrays, or an
+        array of shape `(n,3)` of the `(x,y,z)` positions.
     lunit
         Unit for distances, by default mm.
+    precision
+        Floating point type of the output, `float32` or `float64`.
+    compression
+        Compression of the output datasets, see :func:`hdf5_settings`.
 
     Returns
     -------
     The output table.
     """
-    out = Table(size=len(arr))
+    if isinstance(arr, np.ndarray):
+        if arr.ndim != 2 or arr.shape[1] != 3:
+            msg = f"positions should have shape (n,3) not {arr.shape}"
+            raise ValueError(msg)
+
+        arr = {"xloc": arr[:, 0], "yloc": arr[:, 1], "zloc": arr[:, 2]}
 
-    for field in ["xloc", "yloc", "zloc"]:
-        assert arr[field].ndim == 1
-        col = arr[field].to_numpy().astype(np.float64, copy=False)
-        out.add_field(field, Array(col, attrs={"units": lunit}))
+    cols = {
+        field: _as_column(arr[field], precision) for field in ["xloc", "yloc", "zloc"]
+    }
+    out = Table(size=len(cols["xloc"]))
+
+    for field, col in cols.items():
+        attrs = _column_attrs({"units": lunit}, compression)
+        out.add_field(field, Array(col, attrs=attrs))
 
     return out
 
 
 def convert_output_kin(
-    arr: ak.Array,
+    arr: ak.Array | Mapping[str, ak.Array | ArrayLike],
     *,
     eunit: str = "keV",
     tunit: str = "ns",
     lunit: str = "mm",
     include_positions: bool = False,
+    precision: Precision = "float64",
+    compression: Compression | None = None,
 ) -> Table:
     """Converts the vertices to the correct output format for `kin` information.
 
@@ -56,7 +186,10 @@ def convert_output_kin(
     Parameters
     ----------
     arr
-        The input data to convert
+        The input data to convert, either an array or a mapping of field names
+        to the columns. The columns can be jagged (several particles per event)
+        :class:`ak.Array`, or flat (one particle per event). Flat NumPy columns
+        that are contiguous and of the right type are used without copying.
     eunit
         Unit for energy, by default keV.
     tunit
@@ -65,75 +198,637 @@ def convert_output_kin(
         Unit for distances, by default mm.
     include_positions
         If positions (xloc/yloc/zloc)
+    precision
+        Floating point type of the output, `float32` or `float64`.
+    compression
+        Compression of the output datasets, see :func:`hdf5_settings`.
 
     Returns
     -------
     The output table.
     """
-    lens = []
-    for field in ak.fields(arr):
-        lens.append(ak.count(arr[field], axis=None))
-    assert all(x == lens[0] for x in lens)
-    out = Table(size=lens[0])
-
-    def _flatten_col(arr: ak.Array, field: str, dtype) -> tuple[ArrayLike, dict]:
-        assert arr[field].ndim in (1, 2)
+    fields = list(arr) if isinstance(arr, Mapping) else ak.fields(arr)
+
+    if include_positions and not {"xloc", "yloc", "zloc"} <= set(fields):
+        msg = "no position columns available to include in output file."
+        raise ValueError(msg)
+
+    columns = {
+        "px": precision,
+        "py": precision,
+        "pz": precision,
+        "ekin": precision,
+        "time": precision,
+        "g4_pid": np.int64,
+    }
+    if include_positions:
+        columns |= {"xloc": precision, "yloc": precision, "zloc": precision}
+
+    # number of particles in each event, or None for one particle per event.
+    counts = None
+    px = arr["px"]
+    if isinstance(px, ak.Array) and px.ndim > 1:
+        assert px.ndim == 2
+        counts = ak.to_numpy(ak.num(px, axis=1))
+
+    # flatten the (jagged) columns, checking the lengths only when needed.
+    cols = {}
+    for field, dtype in columns.items():
+        col = arr[field]
+        if counts is not None:
+            assert np.array_equal(ak.to_numpy(ak.num(col, axis=1)), counts)
+            col = ak.flatten(col)
+        cols[field] = _as_column(col, dtype)
+    n_tot = len(cols["px"])
+    assert all(len(col) == n_tot for col in cols.values())
+
+    out = Table(size=n_tot)
+
+    for field, col in cols.items():
         attrs = {}
         if field == "ekin":
             attrs["units"] = eunit
         elif field == "time":
             attrs["units"] = tunit
+        elif field in ("xloc", "yloc", "zloc"):
+            attrs["units"] = lunit
+        out.add_field(field, Array(col, attrs=_column_attrs(attrs, compression)))
+
+    # derive the number of particles in each event, stored at the index of
+    # the first particle of the event and zero for the others.
+    if counts is None:
+        n_part = np.ones(n_tot, dtype=np.int64)
+    else:
+        n_part = np.zeros(n_tot, dtype=np.int64)
+        first = np.cumsum(counts) - counts
+        n_part[first[counts > 0]] = counts[counts > 0]
+
+    out.add_field(
+        "n_part", Array(n_part, dtype=np.int64, attrs=_column_attrs({}, compression))
+    )
 
-        col = ak.flatten(arr[field]) if arr[field].ndim > 1 else arr[field]
-        assert col.ndim == 1
-        return col.to_numpy().astype(dtype, copy=False), attrs
+    return out
 
-    for field in ["px", "py", "pz", "ekin", "time"]:
-        col, attrs = _flatten_col(arr, field, np.float64)
-        out.add_field(field, Array(col, attrs=attrs))
 
-    for field in ["g4_pid"]:
-        col, attrs = _flatten_col(arr, field, np.int64)
-        out.add_field(field, Array(col))
+def _get_chunks(n: int, m: int) -> np.ndarray:
+    return (
+        np.full(n // m, m, dtype=int)
+        if n % m == 0
+        else np.append(np.full(n // m, m, dtype=int), n % m)
+    )
 
-    # optionally include positions into table.
-    if include_positions:
-        fields = ak.fields(arr)
-        if "xloc" not in fields or "yloc" not in fields or "zloc" not in fields:
-            msg = "no position columns available to include in output file."
+
+def get_shards(
+    n: int, n_files: int | None = None, events_per_file: int | None = None
+) -> list[int]:
+    """Split the events into files.
+
+    Parameters
+    ----------
+    n
+        The total number of events.
+    n_files
+        The number of files, the events are split as evenly as possible.
+    events_per_file
+        The number of events per file, the last file holds the remainder.
+
+    Returns
+    -------
+    The number of events of each file.
+    """
+    if (n_files is None) == (events_per_file is None):
+        msg = "exactly one of n_files or events_per_file must be given"
+        raise ValueError(msg)
+
+    if events_per_file is not None:
+        if events_per_file < 1:
+            msg = f"events_per_file must be positive, not {events_per_file}"
             raise ValueError(msg)
+        return [int(m) for m in _get_chunks(n, events_per_file)]
 
-        for field in ["xloc", "yloc", "zloc"]:
-            col, _ = _flatten_col(arr, field, np.float64)
-            out.add_field(field, Array(col, attrs={"units": lunit}))
+    if not 1 <= n_files <= n:
+        msg = f"cannot split {n} events into {n_files} files"
+        raise ValueError(msg)
 
-    # derive the number of particles in each event.
-    n_part = np.zeros(lens[0], dtype=np.int64)
-    part_idx = 0
-    for x in arr["px"]:
-        part_evt = len(x) if isinstance(x, ak.Array) else 1
-        n_part[part_idx] = part_evt
-        part_idx += part_evt
+    return [n // n_files + (idx < n % n_files) for idx in range(n_files)]
 
-    out.add_field("n_part", Array(n_part, dtype=np.int64))
 
-    return out
+def get_shard_files(out_file: str | Path, n_files: int) -> list[Path]:
+    """Get the paths of the files of a sharded output.
 
+    The files are numbered with (at least) 3 digits, e.g. `out.lh5` is split
+    into `out_000.lh5`, `out_001.lh5`, ...
+    """
+    out_file = Path(out_file)
+    width = max(3, len(str(n_files - 1)))
 
-def _get_chunks(n: int, m: int) -> np.ndarray:
-    return (
-        np.full(n // m, m, dtype=int)
-        if n % m == 0
-        else np.append(np.full(n // m, m, dtype=int), n % m)
+    return [
+        out_file.with_name(f"{out_file.stem}_{idx:0{width}d}{out_file.suffix}")
+        for idx in range(n_files)
+    ]
+
+
+def available_memory() -> int | None:
+    """Get the memory available to this process in bytes.
+
+    This is the available system memory, further limited by the memory limit
+    of the cgroup (e.g. set by the batch system) if there is one.
+
+    Returns
+    -------
+    the available memory, or None if it cannot be determined.
+    """
+    available = None
+
+    meminfo = Path("/proc/meminfo")
+    if meminfo.exists():
+        for line in meminfo.read_text().splitlines():
+            if line.startswith("MemAvailable:"):
+                available = int(line.split()[1]) * 1024
+                break
+    elif hasattr(os, "sysconf") and "SC_AVPHYS_PAGES" in os.sysconf_names:
+        available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+    # cgroup v2 memory limit
+    limit = Path("/sys/fs/cgroup/memory.max")
+    usage = Path("/sys/fs/cgroup/memory.current")
+    if limit.exists() and usage.exists():
+        value = limit.read_text().strip()
+        if value != "max":
+            free = int(value) - int(usage.read_text().strip())
+            available = free if available is None else min(available, free)
+
+    return available
+
+
+def get_chunk_size(bytes_per_event: float, max_memory: int | None = None) -> int:
+    """Choose the chunk size such that the chunks fit into a memory budget.
+
+    Parameters
+    ----------
+    bytes_per_event
+        The (peak) memory needed per event of a chunk, including any buffering.
+    max_memory
+        The memory budget in bytes. If None, a fraction of the
+        :func:`available_memory` is used.
+
+    Returns
+    -------
+    the number of events per chunk, a multiple of 1000.
+    """
+    if max_memory is None:
+        available = available_memory()
+
+        if available is None:
+            log.warning("Could not determine the available memory")
+            return _CHUNK_SIZE
+
+        max_memory = int(_MEMORY_FRACTION * available)
+
+    chunk_size = int(max_memory / bytes_per_event) // 1000 * 1000
+    chunk_size = min(max(chunk_size, _MIN_CHUNK_SIZE), _MAX_CHUNK_SIZE)
+
+    msg = "Using %d events per chunk (%.0f bytes per event, budget %.1f MB)"
+    log.info(msg, chunk_size, bytes_per_event, max_memory / 1e6)
+
+    return chunk_size
+
+
+def _init_worker(payload: bytes) -> None:
+    _worker_state["generator"], _worker_state["kwargs"] = pickle.loads(payload)
+
+
+def _generate_chunk(size: int, seed: np.random.SeedSequence) -> np.ndarray:
+    return _worker_state["generator"](size, seed=seed, **_worker_state["kwargs"])
+
+
+def _generate_chunks(
+    generator: Callable,
+    chunks: np.ndarray,
+    seeds: list[np.random.SeedSequence],
+    workers: int,
+    kwargs: dict,
+) -> Iterator[np.ndarray]:
+    """Generate the chunks, in order, optionally with a pool of worker processes.
+
+    The generator and its keyword arguments are sent to each worker once, when
+    it is started. At most ``2 * workers`` chunks are in flight at any time, so
+    that memory stays bounded if the consumer is slower than the workers.
+    """
+    if workers <= 1:
+        for chunk, seed in zip(chunks, seeds, strict=True):
+            yield generator(int(chunk), seed=seed, **kwargs)
+        return
+
+    buf = io.BytesIO()
+    _WorkerPickler(buf, protocol=pickle.HIGHEST_PROTOCOL).dump((generator, kwargs))
+
+    # do not fork, the numba thread pool used by pygeomhpges is not fork-safe
+    method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp.get_context(method),
+        initializer=_init_worker,
+        initargs=(buf.getvalue(),),
+    ) as pool:
+        tasks = iter(zip(chunks, seeds, strict=True))
+        pending = deque()
+
+        for chunk, seed in tasks:
+            pending.append(pool.submit(_generate_chunk, int(chunk), seed))
+            if len(pending) >= 2 * workers:
+                break
+
+        while pending:
+            result = pending.popleft().result()
+
+            task = next(tasks, None)
+            if task is not None:
+                pending.append(pool.submit(_generate_chunk, int(task[0]), task[1]))
+
+            yield result
+
+
+def config_hash(config: Mapping) -> str:
+    """Hash the configuration of a run, to check that it can be resumed.
+
+    Arrays are hashed by value, objects with `metadata` (e.g. HPGe objects)
+    by their name and metadata, histogram samplers by their non-empty bins
+    and functions by their qualified name.
+    """
+
+    def _default(obj):
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+        if isinstance(obj, sampling.HistogramSampler):
+            return {"edges": obj.edges, "index": obj.index, "weights": obj.weights}
+        if hasattr(obj, "metadata"):
+            return {"name": getattr(obj, "name", None), "metadata": obj.metadata}
+        if callable(obj) and hasattr(obj, "__qualname__"):
+            return f"{obj.__module__}.{obj.__qualname__}"
+        return repr(obj)
+
+    text = json.dumps(config, sort_keys=True, default=_default)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def make_checkpoint(**fields) -> Struct:
+    """Make the checkpoint struct (of scalars) recording the progress of a run."""
+    return Struct({k: Scalar(v) for k, v in fields.items()})
+
+
+class PerfMetrics:
+    """Timing, throughput and peak memory of every chunk of a run.
+
+    The time of every stage of a chunk is measured from the end of the
+    previous stage, see :meth:`lap`. The stages are generating the chunk,
+    converting it and handing it over to the output (`enqueue`). The sinks
+    writing on a background thread (see :class:`.sinks.BackgroundWriter`)
+    only block in the `enqueue` stage when the writer falls behind, the time
+    spent writing is logged by the writer when it is closed. The
+    metrics of a chunk are logged at INFO level and a summary is stored with
+    the output (at ``misc/perf``), see :meth:`summary`.
+
+    Parameters
+    ----------
+    name
+        Name of the run (e.g. the output file) for the log.
+    trace_memory
+        Record the peak memory allocated by Python (and NumPy) for every chunk
+        with :mod:`tracemalloc`. This slows the run down, and the memory
+        allocated by worker processes is not traced.
+
+    Examples
+    --------
+    >>> with PerfMetrics("out.lh5") as perf:
+    ...     for chunk in chunks:
+    ...         positions = generate(chunk)
+    ...         perf.lap("generate")
+    ...         ...
+    ...         perf.end_chunk(len(positions))
+    """
+
+    STAGES = ("generate", "convert", "enqueue")
+
+    def __init__(self, name: str | Path | Sink = "", trace_memory: bool = False):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.n_vertices: list[int] = []
+        self.times: dict[str, list[float]] = {stage: [] for stage in self.STAGES}
+        self.peak_memory: list[int] = []
+        self.ends: list[float] = []
+
+        self._chunk = dict.fromkeys(self.STAGES, 0.0)
+        self._started_tracing = False
+        self._start = self._last = time.perf_counter()
+
+    def start(self) -> Self:
+        """Start timing the first chunk (and tracing the memory)."""
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+
+        self._start = self._last = time.perf_counter()
+        return self
+
+    def stop(self) -> None:
+        """Stop tracing the memory."""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def lap(self, stage: str) -> None:
+        """Add the time since the last lap to a stage of the current chunk."""
+        now = time.perf_counter()
+        self._chunk[stage] += now - self._last
+        self._last = now
+
+    def end_chunk(self, n_vertices: int) -> None:
+        """Record (and log) the metrics of the current chunk."""
+        self.n_vertices.append(int(n_vertices))
+        for stage in self.STAGES:
+            self.times[stage].append(self._chunk[stage])
+        self._chunk = dict.fromkeys(self.STAGES, 0.0)
+        self.ends.append(self._last)
+
+        msg = "Chunk %d of %s: %d vertices in %.3f s (%s), %.3g vertices/s"
+        args = [
+            len(self.n_vertices),
+            self.name,
+            n_vertices,
+            self.chunk_time(-1),
+            ", ".join(f"{s} {self.times[s][-1]:.3f} s" for s in self.STAGES),
+            n_vertices / max(self.chunk_time(-1), 1e-9),
+        ]
+        if self.trace_memory:
+            self.peak_memory.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+            msg += ", peak memory %.1f MB"
+            args.append(self.peak_memory[-1] / 1e6)
+
+        log.info(msg, *args)
+
+        for callback in CHUNK_CALLBACKS.copy():
+            callback(len(self.n_vertices))
+
+    def chunk_time(self, idx: int) -> float:
+        """The time spent on a chunk, in all the stages."""
+        return sum(self.times[stage][idx] for stage in self.STAGES)
+
+    def summary(self, first: int = 0, last: int | None = None) -> Struct:
+        """The metrics of the run (totals and per chunk) as a struct.
+
+        The totals are scalars, the metrics of every chunk are arrays
+        (prefixed with ``chunk_``). Times are in s and memory in bytes.
+
+        Parameters
+        ----------
+        first, last
+            Only summarize the chunks from `first` to `last` (excluded), e.g.
+            the chunks of one of several output files.
+        """
+        chunks = slice(first, last)
+        ends = self.ends[chunks]
+        n_vertices = np.array(self.n_vertices[chunks], dtype=np.int64)
+
+        # wall clock time, from the end of the previous chunk
+        begin = self.ends[first - 1] if first > 0 else self._start
+        total_time = ends[-1] - begin if ends else 0.0
+
+        fields = {
+            "n_chunks": Scalar(len(n_vertices)),
+            "n_vertices": Scalar(int(n_vertices.sum())),
+            "total_time": Scalar(total_time, attrs={"units": "s"}),
+            "vertices_per_second": Scalar(
+                float(n_vertices.sum() / max(total_time, 1e-9))
+            ),
+            "chunk_n_vertices": Array(n_vertices),
+        }
+        for stage in self.STAGES:
+            times = np.array(self.times[stage][chunks], dtype=np.float64)
+            fields[f"{stage}_time"] = Scalar(float(times.sum()), attrs={"units": "s"})
+            fields[f"chunk_{stage}_time"] = Array(times, attrs={"units": "s"})
+
+        if self.trace_memory:
+            peak = np.array(self.peak_memory[chunks], dtype=np.int64)
+            fields["peak_memory"] = Scalar(
+                int(peak.max(initial=0)), attrs={"units": "B"}
+            )
+            fields["chunk_peak_memory"] = Array(peak, attrs={"units": "B"})
+
+        return Struct(fields)
+
+    def __enter__(self) -> Self:
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def _seed_state(seed: int | np.random.SeedSequence | None) -> dict:
+    """The state of the seed sequence all the random streams are spawned from."""
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+
+    return {
+        "entropy": str(seed.entropy),
+        "spawn_key": json.dumps(list(seed.spawn_key)),
+        "n_children_spawned": seed.n_children_spawned,
+    }
+
+
+def _seed_from_state(state: Mapping) -> np.random.SeedSequence:
+    return np.random.SeedSequence(
+        int(state["entropy"]),
+        spawn_key=tuple(json.loads(state["spawn_key"])),
+        n_children_spawned=int(state["n_children_spawned"]),
+    )
+
+
+def _check_checkpoint(checkpoint: Mapping, expected: Mapping, sink: Sink) -> None:
+    for key, value in expected.items():
+        if checkpoint.get(key) != value:
+            msg = (
+                f"cannot resume {sink}, its {key} ({checkpoint.get(key)}) does not "
+                f"match the current run ({value})"
+            )
+            raise ValueError(msg)
+
+
+def _is_auto_chunk_size(
+    chunk_size: int | Literal["auto"] | None, max_memory: int | None
+) -> bool:
+    """Whether to choose the chunk size from the memory budget.
+
+    The chunk size is chosen automatically if it is ``"auto"``, or if it is
+    not given and a `max_memory` budget is. A budget cannot be combined with
+    an explicit chunk size.
+    """
+    if max_memory is not None and chunk_size not in (None, "auto"):
+        msg = f"chunk_size={chunk_size} cannot be combined with max_memory, use chunk_size='auto'"
+        raise ValueError(msg)
+
+    return chunk_size == "auto" or max_memory is not None
+
+
+def _auto_chunk_size(
+    generator: Callable, workers: int, n_waiting: int, max_memory: int | None
+) -> int:
+    """Choose the chunk size of a generator from the memory budget.
+
+    Every worker generates a chunk, while up to ``2 * workers`` chunks wait to
+    be collected and up to `n_waiting` to be consumed.
+    """
+    bytes_per_event = getattr(generator, "bytes_per_event", _DEFAULT_BYTES_PER_EVENT)
+
+    return get_chunk_size(
+        workers * bytes_per_event
+        + (2 * workers + n_waiting) * _BYTES_PER_OUTPUT_VERTEX,
+        max_memory,
     )
 
 
+def _iter_shards(
+    generator: Callable,
+    shards: list[int],
+    shard_seeds: list,
+    chunk_size: int,
+    workers: int,
+    kwargs: dict,
+    skip: list[int] | None = None,
+    qmc: str | None = None,
+) -> Iterator[tuple[int, int, np.ndarray]]:
+    """Generate the chunks of several outputs with one (pool of) generator(s).
+
+    Yields the index of the output, the index of the chunk in the output and
+    the positions of each chunk, in order. The random stream of every chunk is
+    spawned from the seed of its output, and with `qmc` it seeds the
+    scrambling of the quasi-random sequence of the chunk. The first `skip`
+    chunks of each output (e.g. written by a previous run) are not generated.
+    """
+    if skip is None:
+        skip = [0] * len(shards)
+
+    chunks, seeds, index = [], [], []
+    for shard, (m, shard_seed) in enumerate(zip(shards, shard_seeds, strict=True)):
+        shard_chunks = _get_chunks(m, chunk_size)
+        shard_chunk_seeds = sampling.spawn_seeds(shard_seed, len(shard_chunks))
+
+        if qmc is not None:
+            shard_chunk_seeds = [
+                sampling.QuasiRandom(qmc, s) for s in shard_chunk_seeds
+            ]
+
+        for idx in range(skip[shard], len(shard_chunks)):
+            chunks.append(shard_chunks[idx])
+            seeds.append(shard_chunk_seeds[idx])
+            index.append((shard, idx))
+
+    for (shard, idx), positions in zip(
+        index,
+        _generate_chunks(
+            generator, np.array(chunks, dtype=int), seeds, workers, kwargs
+        ),
+        strict=True,
+    ):
+        yield shard, idx, positions
+
+
+def iter_vertices(
+    generator: Callable,
+    n: int,
+    seed: int | np.random.SeedSequence | None = None,
+    *,
+    chunk_size: int | Literal["auto"] | None = None,
+    max_memory: int | None = None,
+    workers: int = 1,
+    output: Literal["table", "numpy"] = "table",
+    lunit: str = "mm",
+    precision: Precision = "float64",
+    qmc: Literal["sobol", "halton"] | None = None,
+    **kwargs,
+) -> Iterator[Table | NDArray]:
+    """Lazily generate vertices in chunks, without writing them to a file.
+
+    The chunks are generated exactly as by :func:`write_remage_vtx` (with the
+    same seed and chunk size the vertices are identical), but yielded one at a
+    time so they can be consumed directly, e.g. by another tool.
+
+    Parameters
+    ----------
+    generator
+        A function generating the vertices (following the revertex specifications)
+    n
+        The number of vertices to generate.
+    seed
+        The seed (or seed sequence) to the random number generator, every chunk is
+        generated with an independent stream spawned from it.
+    chunk_size
+        Number of vertices per chunk (by default 1,000,000), or ``"auto"`` to
+        choose it from the `max_memory` budget.
+    max_memory
+        Memory budget in bytes, used to choose the chunk size automatically.
+        It cannot be combined with an explicit `chunk_size`.
+    workers
+        Number of worker processes generating the chunks in parallel.
+    output
+        Yield each chunk as a `table` (in the `pos` format of remage, see
+        :func:`convert_output_pos`) or as the `numpy` array of shape `(n,3)`
+        returned by the generator.
+    lunit
+        Unit for distances of the tables, by default mm.
+    precision
+        Floating point type of the tables, `float32` or `float64`.
+    qmc
+        Generate quasi-random vertices, see :func:`write_remage_vtx`.
+    kwargs
+        The keyword arguments to the generator.
+
+    Examples
+    --------
+    >>> for chunk in iter_vertices(sample_hpge_surface, 10**7, seed=1, hpges=hpges, ...):
+    ...     process(chunk["xloc"].nda, chunk["yloc"].nda, chunk["zloc"].nda)
+    """
+    if output not in ("table", "numpy"):
+        msg = f"output must be table or numpy not {output}"
+        raise ValueError(msg)
+
+    if _is_auto_chunk_size(chunk_size, max_memory):
+        chunk_size = _auto_chunk_size(generator, workers, 1, max_memory)
+    elif chunk_size is None:
+        chunk_size = _CHUNK_SIZE
+
+    for _, _, positions in _iter_shards(
+        generator, [n], [seed], chunk_size, workers, kwargs, qmc=qmc
+    ):
+        if output == "numpy":
+            yield positions
+        else:
+            yield convert_output_pos(positions, lunit=lunit, precision=precision)
+
+
 def write_remage_vtx(
     n: int,
-    out_file: str,
-    seed: int | None,
+    out_file: str | Path | Sink,
+    seed: int | np.random.SeedSequence | None,
     generator: Callable,
     lunit: str = "mm",
+    workers: int = 1,
+    chunk_size: int | Literal["auto"] | None = None,
+    max_memory: int | None = None,
+    precision: Precision = "float64",
+    compression: Compression | None = None,
+    n_files: int | None = None,
+    events_per_file: int | None = None,
+    resume: bool = False,
+    trace_memory: bool = False,
+    qmc: Literal["sobol", "halton"] | None = None,
     **kwargs,
 ) -> None:
     """Save the vertices generatored by a particular vertex generator function.
@@ -145,35 +840,170 @@ def write_remage_vtx(
     n
         The number of vertices to generate
     out_file
-        The path to the file to save the results.
+        The path to the file to save the results, or a :class:`.sinks.Sink`.
+        If the output is split into several files, they are named after it,
+        see :func:`get_shard_files`.
     seed
-        The seed to the random number generator
+        The seed to the random number generator. Every chunk is generated
+        with an independent stream spawned from it, see
+        :func:`.sampling.spawn_seeds`. For a split output, a stream is spawned
+        for every file and the streams of its chunks are spawned from it, so
+        the files do not depend on the chunk size of the other files.
     generator
         A function generating the vertices (following the revertex specifications)
+    lunit
+        Unit for distances, by default mm.
+    workers
+        Number of worker processes generating the chunks in parallel. The
+        chunks are always written in order, so the output does not depend on
+        the number of workers.
+    chunk_size
+        Number of vertices generated per chunk (by default 1,000,000). If
+        ``"auto"``, or if only `max_memory` is given, it is chosen from the
+        memory needed per vertex by the generator (its ``bytes_per_event``
+        attribute) and the `max_memory` budget.
+    max_memory
+        Memory budget in bytes, used to choose the chunk size automatically.
+        If None, a fraction of the available memory is used. It cannot be
+        combined with an explicit `chunk_size`.
+    precision
+        Floating point type of the output, `float32` or `float64`.
+    compression
+        Compression of the output datasets, see :func:`hdf5_settings`.
+    n_files
+        Split the output into this number of files, see :func:`get_shards`.
+        The files are generated by the same pool of workers, from a single
+        copy of the generator keyword arguments (e.g. the HPGe objects).
+    events_per_file
+        Split the output into files with this number of vertices.
+    resume
+        Continue a previous run, which stopped before writing all the vertices.
+        After every chunk a checkpoint is written to the output (at
+        ``misc/checkpoint``), with the number of chunks written, the state of
+        the seed and a hash of the configuration. The run is resumed from the
+        chunk after the checkpoint, so the output is identical to that of an
+        uninterrupted run. If the `seed` is None, the seed of the previous run
+        is used.
+    trace_memory
+        Record the peak memory of every chunk, see :class:`PerfMetrics`. The
+        time spent generating, converting and writing every chunk is always
+        recorded, logged and stored in the output (at ``misc/perf``).
+    qmc
+        Generate the vertices from a scrambled low-discrepancy (`sobol` or
+        `halton`) sequence instead of random numbers, see
+        :class:`.sampling.QuasiRandom`. Estimates from the vertices (e.g. an
+        acceptance) converge faster than with random vertices. Every chunk
+        is an independently scrambled sequence, so the chunks are still
+        independent and reproducible for a given seed. The generator must
+        accept a :class:`.sampling.QuasiRandom` as seed, like the HPGe
+        samplers.
     kwargs
         The keyword arguments to the function
     """
-    chunks = _get_chunks(n, 1000_000)
-
-    for idx, chunk in enumerate(chunks):
-        positions = generator(chunk, **kwargs)
-
-        pos_ak = ak.Array(
-            {"xloc": positions[:, 0], "yloc": positions[:, 1], "zloc": positions[:, 2]}
-        )
-
-        msg = f"Generated vertices {pos_ak}"
-        log.debug(msg)
-
-        # update the seed
-        seed = seed * 7 if seed is not None else None
-
-        # convert
-        pos_lh5 = convert_output_pos(pos_ak, lunit=lunit)
-
-        msg = f"Output {pos_lh5}"
-        log.debug(msg)
-
-        # write
-        mode = "of" if idx == 0 else "append"
-        lh5.write(pos_lh5, "vtx/pos", out_file, wo_mode=mode)
+    auto_chunk_size = _is_auto_chunk_size(chunk_size, max_memory)
+    if chunk_size is None and not auto_chunk_size:
+        chunk_size = _CHUNK_SIZE
+
+    if n_files is None and events_per_file is None:
+        shards, sinks = [n], [as_sink(out_file)]
+    elif isinstance(out_file, Sink):
+        msg = "the output can only be split into several files if it is a path"
+        raise ValueError(msg)
+    else:
+        shards = get_shards(n, n_files, events_per_file)
+        sinks = [as_sink(f) for f in get_shard_files(out_file, len(shards))]
+
+    config = {
+        "generator": generator,
+        "shards": shards,
+        "lunit": lunit,
+        "precision": precision,
+        "compression": compression,
+        "kwargs": kwargs,
+    }
+    if qmc is not None:
+        # only if set, so the checkpoints of runs without it are unchanged
+        config["qmc"] = qmc
+
+    checkpoints = [sink.read_checkpoint() if resume else None for sink in sinks]
+    previous = next((c for c in checkpoints if c is not None), None)
+
+    if previous is not None:
+        if seed is None:
+            seed = _seed_from_state(previous)
+        if auto_chunk_size:
+            chunk_size = int(previous["chunk_size"])
+
+    elif auto_chunk_size:
+        # up to 3 converted chunks wait to be written
+        chunk_size = _auto_chunk_size(generator, workers, 3, max_memory)
+
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+
+    state = {
+        **_seed_state(seed),
+        "chunk_size": chunk_size,
+        "config_hash": config_hash(config),
+    }
+    skip = [0] * len(shards)
+    for shard, checkpoint in enumerate(checkpoints):
+        if checkpoint is not None:
+            _check_checkpoint(checkpoint, state, sinks[shard])
+            skip[shard] = int(checkpoint["n_chunks_done"])
+
+    shard_seeds = (
+        [seed] if len(shards) == 1 else sampling.spawn_seeds(seed, len(shards))
+    )
+    offsets = [np.cumsum([0, *_get_chunks(m, chunk_size)]) for m in shards]
+
+    if all(s == len(o) - 1 for s, o in zip(skip, offsets, strict=True)):
+        msg = "All the vertices were already written to %s"
+        log.info(msg, out_file)
+        return
+
+    with ExitStack() as stack, PerfMetrics(out_file, trace_memory) as perf:
+        opened, first_chunk = [], {}
+        for shard, idx, positions in _iter_shards(
+            generator, shards, shard_seeds, chunk_size, workers, kwargs, skip, qmc
+        ):
+            perf.lap("generate")
+
+            if not opened or shard != opened[-1]:
+                # the previous file is finished in the background while the
+                # next one is written, and closed when the next one starts
+                if len(opened) > 1:
+                    sinks[opened[-2]].close()
+                sink = sinks[shard].open(n_rows=shards[shard], resume=skip[shard] > 0)
+                stack.enter_context(sink)
+                opened.append(shard)
+                first_chunk[shard] = len(perf.n_vertices)
+
+            msg = f"Generated vertices {positions}"
+            log.debug(msg)
+
+            # convert, without copying if the columns are contiguous
+            pos_lh5 = convert_output_pos(
+                positions, lunit=lunit, precision=precision, compression=compression
+            )
+            perf.lap("convert")
+
+            msg = f"Output {pos_lh5}"
+            log.debug(msg)
+
+            # write, while the next chunk is generated
+            start, stop = offsets[shard][idx], offsets[shard][idx + 1]
+            sinks[shard].write(pos_lh5, "vtx/pos", start_row=int(start))
+
+            checkpoint = make_checkpoint(
+                **state,
+                n_chunks=len(offsets[shard]) - 1,
+                n_chunks_done=idx + 1,
+                n_rows_done=int(stop),
+            )
+            sinks[shard].write(checkpoint, CHECKPOINT)
+            perf.lap("enqueue")
+            perf.end_chunk(len(pos_lh5))
+
+            if stop == shards[shard]:
+                sinks[shard].write(perf.summary(first_chunk[shard]), PERF)
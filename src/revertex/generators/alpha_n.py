@@ -7,11 +7,11 @@ import tempfile
 from pathlib import Path
 
 import awkward as ak
-import lh5
 import numpy as np
-import pyg4ometry as pyg4
 from lgdo import Array, Table, types
 
+from revertex.core import PerfMetrics
+from revertex.sinks import PERF, Sink, as_sink
 from revertex.utils import collect_isotopes
 
 log = logging.getLogger(__name__)
@@ -339,11 +339,17 @@ def prepare_sag4n_output_for_lh5(ak_array: ak.Array) -> ak.Array:
 
 def save_sag4n_output_to_lh5(
     output_data: dict,
-    output_file: str | Path,
+    output_file: str | Path | Sink,
     eunit: str = "MeV",
     tunit: str = "ns",
 ) -> None:
-    """Helper function to save the SaG4n generated events and integral yield to lh5 file."""
+    """Helper function to save the SaG4n generated events and integral yield to lh5 file.
+
+    The output can also be any :class:`.sinks.Sink`. The timing of the
+    conversion and writing is added to ``output_data["perf"]`` (the
+    :class:`.core.PerfMetrics` of the run, if any), and stored at ``misc/perf``.
+    """
+    perf = output_data.get("perf") or PerfMetrics(output_file).start()
 
     ak_array = output_data["prepared_output"]
 
@@ -366,25 +372,26 @@ def save_sag4n_output_to_lh5(
         col = ak_array[field].to_numpy().astype(np.int64, copy=False)
         kin_lh5.add_field(field, Array(col, dtype=np.int64))
 
-    lh5.write(kin_lh5, "vtx/kin", output_file, wo_mode="of")
-
     misc_data = {
         "integral_yield": types.Scalar(output_data["integral_yield"]),
         "n_valid_events": types.Scalar(output_data["n_valid_events"]),
         "n_simulated_events": types.Scalar(output_data["n_simulated_events"]),
     }
     misc = types.Struct(misc_data)
+    perf.lap("convert")
 
-    lh5.write(
-        misc,
-        "misc",
-        output_file,
-        wo_mode="append",
-    )
+    with as_sink(output_file).open(n_rows=len(ak_array)) as sink:
+        sink.write(kin_lh5, "vtx/kin")
+        sink.write(misc, "misc")
+        perf.lap("enqueue")
+        perf.end_chunk(len(ak_array))
+
+        sink.write(perf.summary(), PERF)
 
 
 def generate_material_input(gdml_file: str | Path, part: str) -> str:
     """Helper function to generate material definition for the input file."""
+    import pyg4ometry as pyg4  # noqa: PLC0415
 
     reg = pyg4.gdml.Reader(str(gdml_file)).getRegistry()
 
@@ -604,6 +611,7 @@ def generate_alpha_n_spectrum(input_data: dict) -> None:
     - ``output_file_sag4n``: Folder and stem path of SaG4n output files
       (.out, .root, .log). These are usually temporary files deleted after
       processing.
+    - ``trace_memory``: Record the peak memory, see :class:`.core.PerfMetrics`.
     """
 
     if "output_file" not in input_data:
@@ -681,27 +689,32 @@ def generate_alpha_n_spectrum(input_data: dict) -> None:
 
         input_data["sag4n_output_stem"] = output_stem
 
-    run_sag4n(input_data)
-    if _generated_input_file:
-        Path(input_data["input_file_sag4n"]).unlink(missing_ok=True)
-    sag4n_output = read_sag4n_output(input_data)
+    trace_memory = input_data.get("trace_memory", False)
+    with PerfMetrics(input_data["output_file"], trace_memory) as perf:
+        run_sag4n(input_data)
+        if _generated_input_file:
+            Path(input_data["input_file_sag4n"]).unlink(missing_ok=True)
+        perf.lap("generate")
 
-    evt_data = sag4n_output["evts"]
-    integral_yield = sag4n_output["integral_yield"]
-    msg = f"Integral yield: {integral_yield:.3e} (n/decay)"
-    log.info(msg)
+        sag4n_output = read_sag4n_output(input_data)
 
-    prepared_output = prepare_sag4n_output_for_lh5(evt_data)
+        evt_data = sag4n_output["evts"]
+        integral_yield = sag4n_output["integral_yield"]
+        msg = f"Integral yield: {integral_yield:.3e} (n/decay)"
+        log.info(msg)
 
-    n_valid_events = np.sum(prepared_output["n_part"] > 0)
-    msg = f"Number of valid events with n_part > 0: {n_valid_events}"
-    log.info(msg)
+        prepared_output = prepare_sag4n_output_for_lh5(evt_data)
 
-    output_data = {
-        "prepared_output": prepared_output,
-        "integral_yield": integral_yield,
-        "n_valid_events": n_valid_events,
-        "n_simulated_events": input_data.get("n_events", 10000000),
-    }
+        n_valid_events = np.sum(prepared_output["n_part"] > 0)
+        msg = f"Number of valid events with n_part > 0: {n_valid_events}"
+        log.info(msg)
+
+        output_data = {
+            "prepared_output": prepared_output,
+            "integral_yield": integral_yield,
+            "n_valid_events": n_valid_events,
+            "n_simulated_events": input_data.get("n_events", 10000000),
+            "perf": perf,
+        }
 
-    save_sag4n_output_to_lh5(output_data, input_data["output_file"])
+        save_sag4n_output_to_lh5(output_data, input_data["output_file"])
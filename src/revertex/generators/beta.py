@@ -1,42 +1,75 @@
 from __future__ import annotations
 
 import logging
+from pathlib import Path
+from typing import Literal
 
 import awkward as ak
 import hist
-import lh5
 import numpy as np
 from numpy.typing import ArrayLike
 from scipy.spatial.transform import Rotation as rot
 
-from revertex import utils
-from revertex.core import _get_chunks, convert_output_kin
-from revertex.sampling import sample_histogram
+from revertex import sampling, utils
+from revertex.core import (
+    _CHUNK_SIZE,
+    Compression,
+    PerfMetrics,
+    Precision,
+    _get_chunks,
+    _is_auto_chunk_size,
+    convert_output_kin,
+    get_chunk_size,
+)
+from revertex.sampling import HistogramSampler
+from revertex.sinks import PERF, Sink, as_sink
 
 log = logging.getLogger(__name__)
 
+# memory per event of a converted chunk waiting to be written
+_BYTES_PER_OUTPUT_EVENT = 112
+
 
 def save_beta_spectrum(
-    n_gen: int, in_file: str, out_file: str, seed: int | None = None, eunit: str = "keV"
+    n_gen: int,
+    in_file: str,
+    out_file: str | Path | Sink,
+    seed: int | np.random.SeedSequence | None = None,
+    eunit: str = "keV",
+    chunk_size: int | Literal["auto"] | None = None,
+    max_memory: int | None = None,
+    precision: Precision = "float64",
+    compression: Compression | None = None,
+    trace_memory: bool = False,
 ) -> None:
-    """Save positions generated by the function to a file.
+    """Save beta kinematics sampled from a spectrum to a file.
 
     Parameters
     ----------
-    func
-        function which generates the positions, must return an `ak.Array` of positions.
     n_gen
-        number of positions to generate
+        number of events to generate
     in_file
         path to the CSV theory file.
     out_file
-        path to the output file.
+        path to the output file, or a :class:`.sinks.Sink`.
     seed
-        random seed, for each chunk will be multiplied by 7.
-    lunit
-        The length unit returned by the function.
-    **kwargs
-        keyword arguments to be passed to the function.
+        random seed, each chunk is generated with an independent stream spawned
+        from it.
+    eunit
+        the unit for energy in the input file, default keV.
+    chunk_size
+        number of events generated per chunk (by default 1,000,000), or
+        ``"auto"`` to choose it from the `max_memory` budget.
+    max_memory
+        memory budget in bytes used to choose the chunk size, with
+        ``chunk_size="auto"`` and no budget a fraction of the available memory
+        is used. It cannot be combined with an explicit `chunk_size`.
+    precision
+        the floating point type of the output, `float32` or `float64`.
+    compression
+        the compression of the output datasets, see :func:`.core.hdf5_settings`.
+    trace_memory
+        record the peak memory of every chunk, see :class:`.core.PerfMetrics`.
     """
     # read input
     energies, phase_space = utils.read_input_beta_csv(in_file, delimiter=",")
@@ -44,25 +77,78 @@ def save_beta_spectrum(
     msg = f"Read beta spectrum from {in_file} E = {energies}, phase space = {phase_space} "
     log.info(msg)
 
-    chunks = _get_chunks(n_gen, 1000_000)
-
-    for idx, chunk in enumerate(chunks):
-        # generate kinematics
-        kin_ak = generate_beta_spectrum(
-            chunk, energies=energies, phase_space=phase_space, seed=seed, eunit=eunit
+    if _is_auto_chunk_size(chunk_size, max_memory):
+        # one chunk is generated while up to 3 are waiting to be written
+        chunk_size = get_chunk_size(
+            generate_beta_spectrum.bytes_per_event + 3 * _BYTES_PER_OUTPUT_EVENT,
+            max_memory,
         )
-        msg = f"Generated beta kinematics {kin_ak}"
-        log.debug(msg)
 
-        # update the seed
-        seed = seed * 7 if seed is not None else None
+    elif chunk_size is None:
+        chunk_size = _CHUNK_SIZE
+
+    chunks = _get_chunks(n_gen, chunk_size)
+    seeds = sampling.spawn_seeds(seed, len(chunks))
+
+    # the spectrum is the same for every chunk
+    sampler = HistogramSampler(_beta_histogram(energies, phase_space, eunit))
+
+    with (
+        as_sink(out_file).open(n_rows=n_gen) as sink,
+        PerfMetrics(out_file, trace_memory) as perf,
+    ):
+        for chunk, chunk_seed in zip(chunks, seeds, strict=True):
+            # generate kinematics
+            kin_ak = generate_beta_spectrum(
+                chunk,
+                energies=energies,
+                phase_space=phase_space,
+                seed=chunk_seed,
+                eunit=eunit,
+                sampler=sampler,
+            )
+            perf.lap("generate")
+            msg = f"Generated beta kinematics {kin_ak}"
+            log.debug(msg)
+
+            # convert
+            kin_lh5 = convert_output_kin(
+                kin_ak, eunit=eunit, precision=precision, compression=compression
+            )
+            perf.lap("convert")
+
+            # write, while the next chunk is generated
+            sink.write(kin_lh5, "vtx/kin")
+            perf.lap("enqueue")
+            perf.end_chunk(chunk)
+
+        sink.write(perf.summary(), PERF)
+
+
+def _beta_histogram(
+    energies: ArrayLike, phase_space: ArrayLike, eunit: str = "keV"
+) -> hist.Hist:
+    """The histogram of a beta spectrum, in keV.
+
+    The energies are the left edges of the bins.
+    """
+    # convert energies to bin edges
+    if eunit == "MeV":
+        factor = 1 / 1000.0
+    elif eunit == "keV":
+        factor = 1
+    elif eunit == "eV":
+        factor = 1000
+    else:
+        msg = f"Only eunits keV, MeV or eV are supported not {eunit}"
+        raise ValueError(msg)
 
-        # convert
-        kin_lh5 = convert_output_kin(kin_ak, eunit=eunit)
+    histo = hist.Hist(hist.axis.Variable(energies * factor))
 
-        # write
-        mode = "of" if idx == 0 else "append"
-        lh5.write(kin_lh5, "vtx/kin", out_file, wo_mode=mode)
+    for b in range(histo.size - 2):
+        histo[b] = phase_space[b]
+
+    return histo
 
 
 def generate_beta_spectrum(
@@ -70,8 +156,9 @@ def generate_beta_spectrum(
     *,
     energies: ArrayLike,
     phase_space: ArrayLike,
-    seed: int | None = None,
+    seed: sampling.SeedLike = None,
     eunit: str = "keV",
+    sampler: HistogramSampler | None = None,
 ) -> ak.Array:
     """Generate samples from a beta spectrum defined by a list of energies and phase space
     values.
@@ -89,31 +176,23 @@ def generate_beta_spectrum(
     size
         number of events to generate
     seed
-        random seed.
+        random seed, or the generator to use.
     eunit
         the unit for energy in the input file, default keV.
+    sampler
+        the sampler of the spectrum built from `energies` and `phase_space`,
+        to reuse it between chunks. By default it is built for this call.
 
     Returns
     -------
     An awkward array with the sampled kinematics, in keV.
     """
-    # convert energies to bin edges
-    if eunit == "MeV":
-        factor = 1 / 1000.0
-    elif eunit == "keV":
-        factor = 1
-    elif eunit == "eV":
-        factor = 1000
-    else:
-        msg = f"Only eunits keV, MeV or eV are supported not {eunit}"
-        raise ValueError(msg)
+    if sampler is None:
+        sampler = HistogramSampler(_beta_histogram(energies, phase_space, eunit))
 
-    histo = hist.Hist(hist.axis.Variable(energies * factor))
+    rng = np.random.default_rng(seed)
 
-    for b in range(histo.size - 2):
-        histo[b] = phase_space[b]
-
-    energy_samples = sample_histogram(histo, size, seed=seed)
+    energy_samples = sampler.sample(size, seed=rng)
     matrix = np.vstack(
         [[energy_samples, np.zeros_like(energy_samples), np.zeros_like(energy_samples)]]
     )
@@ -121,7 +200,6 @@ def generate_beta_spectrum(
     mass = 511.0  # keV
     momentum = np.sqrt(energy_samples**2 + 2 * mass * energy_samples)
 
-    rng = np.random.default_rng(seed)  # Set seed
     rand_rot = rot.random(random_state=rng)  # Random rotation
 
     matrix = np.vstack([[momentum, np.zeros_like(momentum), np.zeros_like(momentum)]])
@@ -137,3 +215,7 @@ def generate_beta_spectrum(
             "g4_pid": np.full_like(energy_samples, 11),
         }
     )
+
+
+# peak memory per event, used to choose the chunk size automatically
+generate_beta_spectrum.bytes_per_event = 150
@@ -15,7 +15,7 @@ log = logging.getLogger(__name__)
 def sample_hpge_borehole(
     n_tot: int,
     *,
-    seed: int | None = None,
+    seed: sampling.SeedLike | sampling.QuasiRandom = None,
     hpges: dict[str, pygeomhpges.HPGe] | pygeomhpges.HPGe,
     positions: dict[str, ArrayLike] | ArrayLike,
 ) -> NDArray:
@@ -26,42 +26,53 @@ def sample_hpge_borehole(
     n_tot
         total number of events to generate
     seed
-        random seed for the RNG.
+        random seed for the RNG, or the generator to use. Each detector is
+        sampled with an independent stream spawned from it.
     hpges
         List of :class:`pygeomhpges.HPGe` objects.
     positions
-        List of the origin position of each HPGe.
+        List of the origin position of each HPGe, or the 4x4 transform of
+        its placement if it is rotated (see :func:`.utils.to_global`).
 
     Returns
     -------
     Array of global coordinates.
     """
-    rng = np.random.default_rng(seed=seed)
+    rng = sampling.get_rng(seed)
 
-    out = np.full((n_tot, 3), np.nan)
+    # Fortran order, so the x, y and z columns can be written without copies
+    out = np.full((n_tot, 3), np.nan, order="F")
 
     # loop over n_det maybe could be faster
     if isinstance(hpges, Mapping):
         weights = utils.get_borehole_weights(hpges)
 
-        det_index = rng.choice(np.arange(len(hpges)), size=n_tot, p=weights)
+        det_index = sampling.choice(rng, np.arange(len(hpges)), n_tot, p=weights)
+        det_rngs = sampling.spawn_rngs(rng, len(hpges))
 
         for idx, (name, hpge) in enumerate(hpges.items()):
             n = np.sum(det_index == idx)
 
-            out[det_index == idx] = (
-                _sample_hpge_borehole_impl(n, hpge, seed=seed) + positions[name]
+            out[det_index == idx] = utils.to_global(
+                _sample_hpge_borehole_impl(n, hpge, seed=det_rngs[idx]),
+                positions[name],
             )
     else:
-        out = _sample_hpge_borehole_impl(n_tot, hpges, seed=seed) + positions
+        utils.to_global(
+            _sample_hpge_borehole_impl(n_tot, hpges, seed=rng), positions, out=out
+        )
 
     return out
 
 
+# peak memory per vertex, used to choose the chunk size automatically
+sample_hpge_borehole.bytes_per_event = 200
+
+
 def _sample_hpge_borehole_impl(
     size: int,
     hpge: pygeomhpges.HPGe,
-    seed: int | None = None,
+    seed: sampling.SeedLike | sampling.QuasiRandom = None,
 ) -> NDArray:
     """Generate events on the surface of a single HPGe.
 
@@ -74,40 +85,39 @@ def _sample_hpge_borehole_impl(
     surface_type
         Which surface to generate events on either `nplus`, `pplus`, `passive` or None (generate on all surfaces).
     seed
-        seed for random number generator.
+        seed for random number generator, or the generator to use.
 
     Returns
     -------
     Array with shape `(n,3)` describing the local `(x,y,z)` positions for every vertex
     """
-    r, z = hpge.get_profile()
+    # the bounding cylinder of the borehole, computed once for all the chunks
+    tables = utils.DetectorSamplingCache.get(hpge)
 
-    height = max(z)
-    radius = max(r)
+    # the proposals are generated in the same buffer in every round, and the
+    # accepted points are copied to the output
+    proposals = np.empty((size, 3), order="F")
+    output = np.empty((size, 3), order="F")
+    n_accepted = 0
 
-    output = None
-
-    # sampling efficiency is not necessarily high but hopefully this is not a big limitation
-    seed_tmp = seed
-
-    while output is None or (len(output) < size):
-        # adjust seed
-        seed_tmp = seed_tmp * 7 if seed_tmp is not None else seed
+    # every rejection round continues the same random stream
+    rng = sampling.get_rng(seed)
 
+    # most proposals in the bounding cylinder of the borehole are accepted
+    while n_accepted < size:
         # get some proposed points
-        proposals = sampling.sample_cylinder(
-            r_range=(0, radius),
-            z_range=(0, height),
-            size=size,
-            seed=seed_tmp,
+        sampling.sample_cylinder(
+            r_range=(0, tables.borehole_radius),
+            z_range=tables.borehole_z_range,
+            size=len(proposals),
+            seed=rng,
+            out=proposals,
         )
 
         is_good = hpge.is_inside_borehole(proposals)
+        sel = proposals[is_good][: size - n_accepted]
 
-        sel = proposals[is_good]
-
-        # extend
-        output = np.vstack((output, sel)) if output is not None else sel
+        output[n_accepted : n_accepted + len(sel)] = sel
+        n_accepted += len(sel)
 
-    # now cut to the right size
-    return output[:size]
+    return output
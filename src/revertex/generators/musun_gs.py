@@ -6,13 +6,25 @@ import shutil
 import subprocess
 import tempfile
 from pathlib import Path
+from typing import Literal
 
 import awkward as ak
-import lh5
 import numpy as np
 from numpy.typing import NDArray
 
-from revertex.core import _get_chunks, convert_output_kin
+from revertex.core import (
+    Compression,
+    PerfMetrics,
+    Precision,
+    _check_checkpoint,
+    _get_chunks,
+    _is_auto_chunk_size,
+    config_hash,
+    convert_output_kin,
+    get_chunk_size,
+    make_checkpoint,
+)
+from revertex.sinks import CHECKPOINT, PERF, Sink, as_sink
 
 log = logging.getLogger(__name__)
 
@@ -25,6 +37,10 @@ _GEANT3_TO_PDG: dict[int, int] = {10: -13, 11: 13}
 # default chunk size (muons per container run)
 _CHUNK_SIZE = 1_000_000
 
+# peak memory per muon of parsing and converting a chunk, including the chunks
+# waiting to be written
+_BYTES_PER_MUON = 1000
+
 # regex to extract global muon intensity from container stdout
 _RATE_RE = re.compile(r"Global intensity\s*=\s*([\d.E+\-]+)", re.IGNORECASE)
 
@@ -52,7 +68,7 @@ DEFAULT_DIMENSIONS = {
 
 def generate_musun_primaries(
     n_muons: int,
-    out_file: str,
+    out_file: str | Path | Sink,
     seed: int | None = None,
     *,
     dx_cm: float = 4000.0,
@@ -64,6 +80,12 @@ def generate_musun_primaries(
     default_dimensions: str | None = None,
     container_image: str = DEFAULT_CONTAINER_IMAGE,
     container_runtime: str | None = None,
+    chunk_size: int | Literal["auto"] | None = None,
+    max_memory: int | None = None,
+    precision: Precision = "float64",
+    compression: Compression | None = None,
+    resume: bool = False,
+    trace_memory: bool = False,
 ) -> None:
     """Generate atmospheric muon kinematics using musun-gs and save to LH5.
 
@@ -72,15 +94,15 @@ def generate_musun_primaries(
     format.
 
     Generates *n_muons* total by running the container in chunks of up to
-    1,000,000 muons. Each chunk uses a different seed so the results are
-    statistically independent.
+    *chunk_size* (by default 1,000,000) muons. Each chunk uses a different
+    seed so the results are statistically independent.
 
     Parameters
     ----------
     n_muons
         Total number of muons to generate.
     out_file
-        Path to the output LH5 file.
+        Path to the output LH5 file, or a :class:`.sinks.Sink`.
     seed
         Base RANLUX seed. Successive chunks multiply the seed by 7 (same
         convention as other revertex generators). If ``None``, chunks use
@@ -106,14 +128,28 @@ def generate_musun_primaries(
     container_runtime
         ``"docker"`` or ``"shifter"``. If ``None``, the first available
         runtime on ``PATH`` is used.
+    chunk_size
+        Number of muons per container run, or ``"auto"`` to choose it from
+        the *max_memory* budget.
+    max_memory
+        Memory budget in bytes used to choose the chunk size. If ``None``, a
+        fraction of the available memory is used. It cannot be combined with
+        an explicit *chunk_size*.
+    precision
+        Floating point type of the output, ``"float32"`` or ``"float64"``.
+    compression
+        Compression of the output datasets, see :func:`.core.hdf5_settings`.
+    resume
+        Continue a previous run from the checkpoint written to the output
+        after every chunk, see :func:`.core.write_remage_vtx`.
+    trace_memory
+        Record the peak memory of every chunk, see :class:`.core.PerfMetrics`.
+        The time spent running the container, converting and writing every
+        chunk is stored in the output (at ``misc/perf``).
     """
     runtime = _detect_runtime(container_runtime)
     _check_image(runtime, container_image)
 
-    Path(out_file).parent.mkdir(parents=True, exist_ok=True)
-
-    chunks = _get_chunks(n_muons, _CHUNK_SIZE)
-    chunk_seed = seed
     global_rate: float | None = None
 
     if default_dimensions is not None:
@@ -131,37 +167,98 @@ def generate_musun_primaries(
         center_y_cm = dims["center_y_cm"]
         center_z_cm = dims["center_z_cm"]
 
-    for idx, chunk in enumerate(chunks):
-        kin_ak, pos_ak, rate = _run_container(
-            int(chunk),
-            chunk_seed if chunk_seed is not None else idx + 1,
-            dx_cm,
-            dy_cm,
-            dz_cm,
-            center_x_cm,
-            center_y_cm,
-            center_z_cm,
-            runtime,
-            container_image,
-        )
+    out = as_sink(out_file)
+    previous = out.read_checkpoint() if resume else None
+
+    auto_chunk_size = _is_auto_chunk_size(chunk_size, max_memory)
+    if previous is not None and auto_chunk_size:
+        chunk_size = int(previous["chunk_size"])
+    elif auto_chunk_size:
+        chunk_size = get_chunk_size(_BYTES_PER_MUON, max_memory)
+    elif chunk_size is None:
+        chunk_size = _CHUNK_SIZE
+
+    chunks = _get_chunks(n_muons, chunk_size)
+    offsets = np.cumsum([0, *chunks])
+
+    config = {
+        "n_muons": n_muons,
+        "seed": seed,
+        "cuboid_cm": [dx_cm, dy_cm, dz_cm, center_x_cm, center_y_cm, center_z_cm],
+        "container_image": container_image,
+        "precision": precision,
+        "compression": compression,
+    }
+    state = {"chunk_size": chunk_size, "config_hash": config_hash(config)}
+
+    done = 0
+    if previous is not None:
+        _check_checkpoint(previous, state, out)
+        done = int(previous["n_chunks_done"])
+
+    if done == len(chunks):
+        log.info("All the muons were already written to %s", out_file)
+        return
+
+    # the seeds of the chunks already written are skipped
+    chunk_seed = seed * 7**done if seed is not None else None
+
+    with (
+        out.open(n_rows=n_muons, resume=done > 0) as sink,
+        PerfMetrics(out_file, trace_memory) as perf,
+    ):
+        for idx in range(done, len(chunks)):
+            chunk = chunks[idx]
+            kin_ak, pos_ak, rate = _run_container(
+                int(chunk),
+                chunk_seed if chunk_seed is not None else idx + 1,
+                dx_cm,
+                dy_cm,
+                dz_cm,
+                center_x_cm,
+                center_y_cm,
+                center_z_cm,
+                runtime,
+                container_image,
+            )
+            perf.lap("generate")
 
-        if global_rate is None and rate is not None:
-            global_rate = rate
+            if global_rate is None and rate is not None:
+                global_rate = rate
 
-        chunk_seed = chunk_seed * 7 if chunk_seed is not None else None
+            chunk_seed = chunk_seed * 7 if chunk_seed is not None else None
 
-        combined_ak = ak.Array(
-            {
+            # pass the columns directly, without building a combined array
+            columns = {
                 **{f: kin_ak[f] for f in ak.fields(kin_ak)},
                 **{f: pos_ak[f] for f in ak.fields(pos_ak)},
             }
-        )
-        kin_lh5 = convert_output_kin(combined_ak, include_positions=True, lunit="mm")
-        mode = "of" if idx == 0 else "append"
-        lh5.write(kin_lh5, "vtx/kin", out_file, wo_mode=mode)
+            kin_lh5 = convert_output_kin(
+                columns,
+                include_positions=True,
+                lunit="mm",
+                precision=precision,
+                compression=compression,
+            )
+            perf.lap("convert")
+
+            # write, while the container generates the next chunk
+            sink.write(kin_lh5, "vtx/kin", start_row=int(offsets[idx]))
+
+            checkpoint = make_checkpoint(
+                **state,
+                n_chunks=len(chunks),
+                n_chunks_done=idx + 1,
+                n_rows_done=int(offsets[idx + 1]),
+            )
+            sink.write(checkpoint, CHECKPOINT)
+            perf.lap("enqueue")
+            perf.end_chunk(chunk)
+
+            msg = "Chunk %d/%d: generated %d muons for %s"
+            log.info(msg, idx + 1, len(chunks), int(chunk), out_file)
 
-        msg = "Chunk %d/%d: wrote %d muons to %s"
-        log.info(msg, idx + 1, len(chunks), int(chunk), out_file)
+        sink.write(perf.summary(), PERF)
 
     if global_rate is not None:
         log.info("Global muon intensity: %.4e (s)^-1", global_rate)
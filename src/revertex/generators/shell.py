@@ -15,7 +15,7 @@ log = logging.getLogger(__name__)
 def sample_hpge_shell(
     n_tot: int,
     *,
-    seed: int | None = None,
+    seed: sampling.SeedLike | sampling.QuasiRandom = None,
     hpges: dict[str, pygeomhpges.HPGe] | pygeomhpges.HPGe,
     positions: dict[str, ArrayLike] | ArrayLike,
     distance: float,
@@ -28,11 +28,13 @@ def sample_hpge_shell(
     n_tot
         total number of events to generate
     seed
-        random seed for the RNG.
+        random seed for the RNG, or the generator to use. Each detector is
+        sampled with an independent stream spawned from it.
     hpges
         List of :class:`pygeomhpges.HPGe` objects.
     positions
-        List of the origin position of each HPGe.
+        List of the origin position of each HPGe, or the 4x4 transform of
+        its placement if it is rotated (see :func:`.utils.to_global`).
     surface_type
         Which surface to generate events on either `nplus`, `pplus`, `passive` or None (generate on all surfaces).
 
@@ -41,40 +43,52 @@ def sample_hpge_shell(
     Array of global coordinates.
     """
 
-    rng = np.random.default_rng(seed=seed)
+    rng = sampling.get_rng(seed)
 
-    out = np.full((n_tot, 3), np.nan)
+    # Fortran order, so the x, y and z columns can be written without copies
+    out = np.full((n_tot, 3), np.nan, order="F")
 
     if isinstance(hpges, Mapping):
         p_det = utils.get_surface_weights(hpges, surface_type=surface_type)
-        det_index = rng.choice(np.arange(len(hpges)), size=n_tot, p=p_det)
+        det_index = sampling.choice(rng, np.arange(len(hpges)), n_tot, p=p_det)
+        det_rngs = sampling.spawn_rngs(rng, len(hpges))
 
         for idx, (name, hpge) in enumerate(hpges.items()):
             n = np.sum(det_index == idx)
 
-            out[det_index == idx] = (
+            out[det_index == idx] = utils.to_global(
                 _sample_hpge_shell_impl(
-                    n, hpge, distance=distance, surface_type=surface_type, seed=seed
-                )
-                + positions[name]
+                    n,
+                    hpge,
+                    distance=distance,
+                    surface_type=surface_type,
+                    seed=det_rngs[idx],
+                ),
+                positions[name],
             )
 
     else:
-        out = (
+        utils.to_global(
             _sample_hpge_shell_impl(
-                n_tot, hpges, distance=distance, surface_type=surface_type, seed=seed
-            )
-            + positions
+                n_tot, hpges, distance=distance, surface_type=surface_type, seed=rng
+            ),
+            positions,
+            out=out,
         )
     return out
 
 
+# peak memory per vertex (including the 5 proposals per vertex), used to
+# choose the chunk size automatically
+sample_hpge_shell.bytes_per_event = 1000
+
+
 def _sample_hpge_shell_impl(
     size: int,
     hpge: pygeomhpges.HPGe,
     surface_type: str | None,
     distance: float,
-    seed: int | None = None,
+    seed: sampling.SeedLike | sampling.QuasiRandom = None,
 ) -> NDArray:
     """Generate events on a shell around a single HPGe. This uses rejection sampling.
 
@@ -89,49 +103,51 @@ def _sample_hpge_shell_impl(
     distance
         Size of the hpge shell to generate in.
     seed
-        seed for random number generator.
+        seed for random number generator, or the generator to use.
 
     Returns
     -------
     Array with shape `(n,3)` describing the local `(x,y,z)` positions for every vertex
     """
 
-    # get the surface indices (which sides to use)
-    surface_indices = utils.get_surface_indices(hpge, surface_type)
+    # the surface indices (which sides to use) and the bounding box, computed
+    # once for all the chunks
+    tables = utils.DetectorSamplingCache.get(hpge, surface_type)
+    tables.check_surfaces(size)
+    surface_indices = tables.surface_indices
 
     # the bounding box should be in x +/- (radius+distance)
     # and in y -distance to height + distance
+    height = tables.height
+    radius = tables.radius
 
-    r, z = hpge.get_profile()
+    # the proposals are generated in the same buffer in every round, and the
+    # accepted points are copied to the output
+    proposals = np.empty((size * 5, 3), order="F")
+    output = np.empty((size, 3), order="F")
+    n_accepted = 0
 
-    height = max(z)
-    radius = max(r)
-
-    output = None
+    # every rejection round continues the same random stream
+    rng = sampling.get_rng(seed)
 
     # sampling efficiency is not necessarily high but hopefully this is not a big limitation
-    seed_tmp = seed
-
-    while output is None or (len(output) < size):
-        # adjust seed
-        seed_tmp = seed_tmp * 7 if seed_tmp is not None else seed
-
+    while n_accepted < size:
         # get some proposed points
-        proposals = sampling.sample_cylinder(
+        sampling.sample_cylinder(
             r_range=(0, radius + distance),
             z_range=(-distance, height + distance),
-            size=size * 5,
-            seed=seed_tmp,
+            size=len(proposals),
+            seed=rng,
+            out=proposals,
         )
 
         distances = hpge.distance_to_surface(proposals, surface_indices, signed=True)
 
         # should be negative (outside) and > -distance
         is_good = (distances < 0) & (abs(distances) < distance)
-        sel = proposals[is_good]
+        sel = proposals[is_good][: size - n_accepted]
 
-        # extend
-        output = np.vstack((output, sel)) if output is not None else sel
+        output[n_accepted : n_accepted + len(sel)] = sel
+        n_accepted += len(sel)
 
-    # now cut to the right size
-    return output[:size]
+    return output
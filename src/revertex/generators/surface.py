@@ -8,14 +8,14 @@ import pygeomhpges
 from numpy.typing import ArrayLike, NDArray
 from scipy.stats import rv_continuous
 
-from revertex import sampling, utils
+from revertex import kernels, sampling, utils
 
 log = logging.getLogger(__name__)
 
 
 def sample_hpge_surface(
     n_tot: int,
-    seed: int | None = None,
+    seed: sampling.SeedLike | sampling.QuasiRandom = None,
     *,
     hpges: dict[str, pygeomhpges.HPGe] | pygeomhpges.HPGe,
     positions: dict[str, ArrayLike] | ArrayLike,
@@ -30,51 +30,62 @@ def sample_hpge_surface(
     hpges
         List of :class:`pygeomhpges.HPGe` objects.
     positions
-        List of the origin position of each HPGe.
+        List of the origin position of each HPGe, or the 4x4 transform of
+        its placement if it is rotated (see :func:`.utils.to_global`).
     surface_type
         Which surface to generate events on either `nplus`, `pplus`, `passive` or None (generate on all surfaces).
     seed
-        seed for random number generator.
+        seed for random number generator, or the generator to use. Each
+        detector is sampled with an independent stream spawned from it.
 
     Returns
     -------
     Array of global coordinates.
     """
 
-    rng = np.random.default_rng(seed=seed)
+    rng = sampling.get_rng(seed)
 
-    out = np.full((n_tot, 3), np.nan)
+    # Fortran order, so the x, y and z columns can be written without copies
+    out = np.full((n_tot, 3), np.nan, order="F")
 
     # loop over n_det maybe could be faster
     if isinstance(hpges, Mapping):
         # index of the surfaces per detector
         p_det = utils.get_surface_weights(hpges, surface_type=surface_type)
-        det_index = rng.choice(np.arange(len(hpges)), size=n_tot, p=p_det)
+        det_index = sampling.choice(rng, np.arange(len(hpges)), n_tot, p=p_det)
+        det_rngs = sampling.spawn_rngs(rng, len(hpges))
 
         for idx, (name, hpge) in enumerate(hpges.items()):
             n = np.sum(det_index == idx)
 
-            out[det_index == idx] = (
-                _sample_hpge_surface_impl(n, hpge, surface_type=surface_type, seed=seed)
-                + positions[name]
+            out[det_index == idx] = utils.to_global(
+                _sample_hpge_surface_impl(
+                    n, hpge, surface_type=surface_type, seed=det_rngs[idx]
+                ),
+                positions[name],
             )
     else:
-        out = (
+        utils.to_global(
             _sample_hpge_surface_impl(
-                n_tot, hpges, surface_type=surface_type, seed=seed
-            )
-            + positions
+                n_tot, hpges, surface_type=surface_type, seed=rng
+            ),
+            positions,
+            out=out,
         )
 
     return out
 
 
+# peak memory per vertex, used to choose the chunk size automatically
+sample_hpge_surface.bytes_per_event = 150
+
+
 def _sample_hpge_surface_impl(
     n: int,
     hpge: pygeomhpges.HPGe,
     surface_type: str | None,
     depth: rv_continuous | None = None,
-    seed: int | None = None,
+    seed: sampling.SeedLike | sampling.QuasiRandom = None,
 ) -> NDArray:
     """Generate events on the surface of a single HPGe.
 
@@ -89,45 +100,48 @@ def _sample_hpge_surface_impl(
     depth
         scipy `rv_continuous` object describing the depth profile, if None events are generated directly on the surface.
     seed
-        seed for random number generator.
+        seed for random number generator, or the generator to use.
 
     Returns
     -------
     Array with shape `(n,3)` describing the local `(x,y,z)` positions for every vertex
     """
-    rng = (
-        np.random.default_rng(seed=seed)
-        if seed is not None
-        else np.random.default_rng()
-    )
+    if depth is not None:
+        msg = "depth profile is not yet implemented "
+        raise NotImplementedError(msg)
 
-    surface_indices = utils.get_surface_indices(hpge, surface_type)
+    rng = sampling.get_rng(seed)
 
-    # surface areas
-    areas = hpge.surface_area(surface_indices).magnitude
+    # the surfaces, computed once for all the chunks
+    tables = utils.DetectorSamplingCache.get(hpge, surface_type)
+    s1, s2 = tables.s1, tables.s2
 
-    # get the sides
-    sides = rng.choice(surface_indices, size=n, p=areas / np.sum(areas))
-    # get thhe detector geometry
-    r, z = hpge.get_profile()
-    s1, s2 = pygeomhpges.utils.get_line_segments(r, z)
+    if isinstance(rng, sampling.QuasiRandom):
+        # the side, the position along it and the angle from one point
+        u_side, u, u_phi = rng.points(n, 3).T
+        sides = tables.sample_sides(u_side)
+        u, phi = u.copy(), u_phi * (2 * np.pi)
+    else:
+        # get the sides
+        sides = tables.sample_sides(rng.random(n))
+        u = rng.uniform(size=n)
+        phi = rng.uniform(low=0, high=2 * np.pi, size=n)
+
+    if kernels.ENABLED:
+        # the coordinates computed in one pass
+        out = np.empty((n, 3), order="F")
+        return kernels.surface_points(out, s1, s2, sides, u, phi)
 
     # compute random coordinates
     r1 = s1[sides][:, 0]
     r2 = s2[sides][:, 0]
 
-    frac = sampling.sample_proportional_radius(r1, r2, size=(len(sides)))
+    frac = sampling._proportional_radius(u, r1, r2)
 
     rz_coords = s1[sides] + (s2[sides] - s1[sides]) * frac[:, np.newaxis]
 
-    phi = rng.uniform(low=0, high=2 * np.pi, size=(len(sides)))
-
     # convert to random x,y
     x = rz_coords[:, 0] * np.cos(phi)
     y = rz_coords[:, 0] * np.sin(phi)
 
-    if depth is not None:
-        msg = "depth profile is not yet implemented "
-        raise NotImplementedError(msg)
-
     return np.vstack([x, y, rz_coords[:, 1]]).T
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import logging
+
+import numpy as np
+from numpy.typing import NDArray
+
+from revertex import sampling
+
+log = logging.getLogger(__name__)
+
+
+def sample_voxels(
+    n_tot: int,
+    *,
+    seed: sampling.SeedLike = None,
+    sampler: sampling.HistogramSampler,
+) -> NDArray:
+    """Generate events in a voxelised map of the activity.
+
+    The voxels are drawn proportionally to their activity, and the events
+    are uniformly distributed within every voxel. The map is given by a 3D
+    :class:`.sampling.HistogramSampler`, which is built once and reused for
+    every chunk, e.g. with :func:`.core.write_remage_vtx`:
+
+    >>> sampler = HistogramSampler.from_voxels(index, activity, edges)
+    >>> write_remage_vtx(n, "vtx.lh5", seed, sample_voxels, sampler=sampler)
+
+    Parameters
+    ----------
+    n_tot
+        total number of events to generate
+    seed
+        random seed for the RNG, or the generator to use.
+    sampler
+        the sampler of the map, with the bin edges along x, y and z in the
+        global coordinates.
+
+    Returns
+    -------
+    Array of global coordinates.
+    """
+    if sampler.ndim != 3:
+        msg = f"the voxelised map must be 3D not {sampler.ndim}D"
+        raise ValueError(msg)
+
+    # Fortran order, so the x, y and z columns can be written without copies
+    out = np.empty((n_tot, 3), order="F")
+    for idx, coord in enumerate(sampler.sample(n_tot, seed=seed)):
+        out[:, idx] = coord
+
+    return out
+
+
+# peak memory per vertex, used to choose the chunk size automatically
+sample_voxels.bytes_per_event = 100
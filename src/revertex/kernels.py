@@ -0,0 +1,115 @@
+"""Numba kernels of the sampling functions.
+
+The NumPy implementation of the sampling functions makes several passes
+over memory per vertex, with a temporary array for every operation. The
+kernels here fuse these operations in a single loop over the vertices. They
+are used automatically if :mod:`numba` is installed, otherwise the NumPy
+implementation is used. Both give the same samples (up to rounding) for the
+same seed, as the random numbers are drawn by NumPy in the same order.
+
+The kernels can be disabled by setting the `REVERTEX_DISABLE_JIT`
+environment variable, or :data:`ENABLED` to False.
+"""
+
+from __future__ import annotations
+
+import functools
+import importlib.util
+import logging
+import math
+import os
+
+from numpy.typing import NDArray
+
+log = logging.getLogger(__name__)
+
+# numba is slow to import, it is only imported when a kernel is first called
+HAS_NUMBA = importlib.util.find_spec("numba") is not None
+
+# use the kernels, instead of the NumPy implementation
+ENABLED = HAS_NUMBA and not os.environ.get("REVERTEX_DISABLE_JIT")
+
+
+def _jit(func):
+    """Compile a kernel, on its first call and with the result cached on disk."""
+    if not HAS_NUMBA:  # pragma: no cover
+        return func
+
+    compiled = None
+
+    @functools.wraps(func)
+    def kernel(*args):
+        nonlocal compiled
+        if compiled is None:
+            import numba  # noqa: PLC0415
+
+            compiled = numba.njit(cache=True, nogil=True)(func)
+        return compiled(*args)
+
+    return kernel
+
+
+@_jit
+def proportional_radius(u: NDArray, r0: NDArray, r1: NDArray) -> NDArray:
+    """Transform uniform samples `u` in place, see :func:`.sampling.sample_proportional_radius`."""
+    for i in range(len(u)):
+        a = min(r0[i], r1[i])
+        b = max(r0[i], r1[i])
+        if a != b:
+            u[i] = (math.sqrt(u[i] * (b * b - a * a) + a * a) - a) / (b - a)
+        if not r1[i] > r0[i]:
+            u[i] = 1 - u[i]
+    return u
+
+
+@_jit
+def cylinder(out: NDArray, r2_range: tuple, phi_range: tuple) -> NDArray:
+    """Transform uniform samples in place to points in a cylinder.
+
+    The columns of `out` hold the samples of r^2, phi and z in their ranges,
+    see :func:`.sampling.sample_cylinder`.
+    """
+    for i in range(out.shape[0]):
+        r = math.sqrt(out[i, 0] * (r2_range[1] - r2_range[0]) + r2_range[0])
+        phi = out[i, 1] * (phi_range[1] - phi_range[0]) + phi_range[0]
+        out[i, 0] = r * math.cos(phi)
+        out[i, 1] = r * math.sin(phi)
+    return out
+
+
+@_jit
+def surface_points(
+    out: NDArray, s1: NDArray, s2: NDArray, sides: NDArray, u: NDArray, phi: NDArray
+) -> NDArray:
+    """Compute points on the surfaces of revolution of the segments of a profile.
+
+    Parameters
+    ----------
+    out
+        The output array of shape `(n, 3)`.
+    s1, s2
+        The `(r, z)` start and end of every segment.
+    sides
+        The segment of every point.
+    u, phi
+        Uniform samples in [0, 1) along the segment (weighted by the radius
+        like :func:`.sampling.sample_proportional_radius`) and in [0, 2 pi)
+        for the angle.
+    """
+    for i in range(len(sides)):
+        side = sides[i]
+        r1, z1 = s1[side, 0], s1[side, 1]
+        r2, z2 = s2[side, 0], s2[side, 1]
+
+        a, b = min(r1, r2), max(r1, r2)
+        frac = u[i]
+        if a != b:
+            frac = (math.sqrt(frac * (b * b - a * a) + a * a) - a) / (b - a)
+        if not r2 > r1:
+            frac = 1 - frac
+
+        r = r1 + (r2 - r1) * frac
+        out[i, 0] = r * math.cos(phi[i])
+        out[i, 1] = r * math.sin(phi[i])
+        out[i, 2] = z1 + (z2 - z1) * frac
+    return out
@@ -0,0 +1,137 @@
+"""Profiling of the generation runs.
+
+A :class:`Profiler` profiles a run with :mod:`cProfile` (where the time is
+spent) or :mod:`tracemalloc` (where the memory is allocated), and writes the
+result next to the output file. It can stop after the first chunks of the run
+(see :class:`.core.PerfMetrics`), so the profile of a long run is ready after
+a few seconds.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import io
+import logging
+import pstats
+import tracemalloc
+from pathlib import Path
+from typing import Literal, Self
+
+from revertex import core
+
+log = logging.getLogger(__name__)
+
+PROFILERS = ("cprofile", "tracemalloc")
+
+# suffix of the file with the result of every profiler
+_SUFFIXES = {"cprofile": ".prof", "tracemalloc": ".tracemalloc"}
+
+
+def get_profile_file(out_file: str | Path, kind: str) -> Path:
+    """The path of the profile of a run, next to its output file.
+
+    For example ``vtx.prof`` for the :mod:`cProfile` profile of ``vtx.lh5``.
+    """
+    return Path(out_file).with_suffix(_SUFFIXES[kind])
+
+
+class Profiler:
+    """Profile a run, and write the result next to the output file.
+
+    The :mod:`cProfile` statistics are written with
+    :meth:`pstats.Stats.dump_stats` (to be read with :mod:`pstats` or e.g.
+    snakeviz), and the :mod:`tracemalloc` snapshot with
+    :meth:`tracemalloc.Snapshot.dump` (to be read with
+    :meth:`tracemalloc.Snapshot.load`). The top entries are also logged.
+
+    Only the main process is profiled, not the worker processes generating
+    the chunks in parallel.
+
+    Parameters
+    ----------
+    kind
+        The profiler, `cprofile` or `tracemalloc`.
+    out_file
+        The output file of the run, the profile is written next to it.
+    n_chunks
+        Stop profiling after this number of chunks, by default profile the
+        whole run.
+    n_top
+        Number of entries of the profile logged.
+    """
+
+    def __init__(
+        self,
+        kind: Literal["cprofile", "tracemalloc"],
+        out_file: str | Path,
+        n_chunks: int | None = None,
+        n_top: int = 20,
+    ):
+        if kind not in PROFILERS:
+            msg = f"unknown profiler {kind}, expected one of {PROFILERS}"
+            raise ValueError(msg)
+
+        self.kind = kind
+        self.path = get_profile_file(out_file, kind)
+        self.n_chunks = n_chunks
+        self.n_top = n_top
+        self.running = False
+
+        self._profile: cProfile.Profile | None = None
+
+    def start(self) -> Self:
+        """Start profiling."""
+        if self.kind == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            tracemalloc.start(25)
+
+        if self.n_chunks is not None:
+            core.CHUNK_CALLBACKS.append(self._chunk_done)
+
+        self.running = True
+        return self
+
+    def _chunk_done(self, n_done: int) -> None:
+        if n_done >= self.n_chunks:
+            self.stop()
+
+    def stop(self) -> None:
+        """Stop profiling and write the profile."""
+        if not self.running:
+            return
+        self.running = False
+
+        if self._chunk_done in core.CHUNK_CALLBACKS:
+            core.CHUNK_CALLBACKS.remove(self._chunk_done)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        if self.kind == "cprofile":
+            self._profile.disable()
+            stream = io.StringIO()
+            stats = pstats.Stats(self._profile, stream=stream)
+            stats.dump_stats(self.path)
+            stats.sort_stats("cumulative").print_stats(self.n_top)
+
+            msg = "Wrote the cProfile profile to %s, top functions:\n%s"
+            log.info(msg, self.path, stream.getvalue())
+        else:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            snapshot.dump(str(self.path))
+
+            top = snapshot.statistics("lineno")[: self.n_top]
+            msg = (
+                "Wrote the tracemalloc snapshot to %s (peak memory %.1f MB), "
+                "top allocations:\n%s"
+            )
+            log.info(msg, self.path, peak / 1e6, "\n".join(str(s) for s in top))
+
+    def __enter__(self) -> Self:
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
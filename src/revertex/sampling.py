@@ -1,53 +1,244 @@
 from __future__ import annotations
 
 import logging
+import warnings
+from collections.abc import Sequence
+from typing import TYPE_CHECKING, Literal, Self
 
-import hist
 import numpy as np
-from numpy.typing import ArrayLike
+from numpy.typing import ArrayLike, DTypeLike, NDArray
+
+from revertex import kernels
+
+if TYPE_CHECKING:
+    import hist
 
 log = logging.getLogger(__name__)
 
+# anything that can be used to seed a random number generator
+SeedLike = int | np.random.SeedSequence | np.random.Generator | None
+
+# the low-discrepancy sequences of the quasi-Monte Carlo mode, see QuasiRandom
+QMC_ENGINES = ("sobol", "halton")
+
+
+def spawn_seeds(
+    seed: int | np.random.SeedSequence | None, n: int
+) -> list[np.random.SeedSequence]:
+    """Allocate independent random streams, e.g. for every chunk of the output.
+
+    The streams are spawned from a :class:`numpy.random.SeedSequence`, so they
+    are statistically independent and reproducible for a given `seed`.
+
+    Parameters
+    ----------
+    seed
+        The seed (or seed sequence) to spawn the streams from. If None,
+        fresh entropy is used.
+    n
+        The number of streams.
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+
+    return seed.spawn(n)
+
+
+def spawn_rngs(
+    seed: SeedLike | QuasiRandom, n: int
+) -> list[np.random.Generator | QuasiRandom]:
+    """Create independent random number generators, e.g. for every detector.
+
+    Parameters
+    ----------
+    seed
+        The seed, seed sequence or generator to spawn the generators from. A
+        :class:`QuasiRandom` spawns independent quasi-random sequences.
+    n
+        The number of generators.
+    """
+    if isinstance(seed, np.random.Generator | QuasiRandom):
+        return seed.spawn(n)
+
+    return [np.random.default_rng(s) for s in spawn_seeds(seed, n)]
+
+
+class QuasiRandom:
+    """Scrambled low-discrepancy points, used in place of random numbers.
+
+    Quasi-Monte Carlo (QMC) points cover the unit hypercube more evenly than
+    random ones, so integrals (e.g. acceptances or efficiencies) estimated
+    with them converge faster. A :class:`QuasiRandom` can be given as the
+    `seed` of the samplers: the uniform numbers of every vertex are then the
+    coordinates of a point of a scrambled :mod:`scipy.stats.qmc` sequence.
+    The successive calls (e.g. the rounds of a rejection sampling loop)
+    continue the same sequence, so no point is repeated.
+
+    The scrambling makes every sequence an independent randomised QMC
+    estimate. Every chunk of a run is generated with its own sequence (see
+    the `qmc` option of :func:`.core.write_remage_vtx`), so the chunks can be
+    generated independently, in any order or in parallel.
+
+    Parameters
+    ----------
+    engine
+        The low-discrepancy sequence, `sobol` or `halton`.
+    seed
+        The seed of the scrambling.
+    """
+
+    def __init__(self, engine: Literal["sobol", "halton"], seed: SeedLike = None):
+        if engine not in QMC_ENGINES:
+            msg = f"unknown QMC engine {engine}, expected one of {QMC_ENGINES}"
+            raise ValueError(msg)
+
+        self.engine = engine
+        self.rng = np.random.default_rng(seed)
+
+        # one sequence per dimension, created on first use
+        self._engines = {}
+
+    def points(self, size: int, d: int) -> NDArray:
+        """The next `size` points of the sequence of dimension `d`, with shape `(size, d)`."""
+        if d not in self._engines:
+            # slow to import, and only needed for QMC
+            from scipy.stats import qmc  # noqa: PLC0415
+
+            cls = qmc.Sobol if self.engine == "sobol" else qmc.Halton
+            self._engines[d] = cls(d, scramble=True, seed=self.rng)
+
+        with warnings.catch_warnings():
+            # Sobol points are best balanced in powers of 2, which the chunks
+            # and rejection rounds are not, but they are still better
+            # balanced than random points
+            warnings.filterwarnings("ignore", "The balance properties", UserWarning)
+            return self._engines[d].random(size)
+
+    def spawn(self, n: int) -> list[QuasiRandom]:
+        """Create independent sequences, e.g. for every detector."""
+        return [QuasiRandom(self.engine, rng) for rng in self.rng.spawn(n)]
+
+
+def get_rng(seed: SeedLike | QuasiRandom) -> np.random.Generator | QuasiRandom:
+    """Like :func:`numpy.random.default_rng`, but a :class:`QuasiRandom` is kept."""
+    if isinstance(seed, QuasiRandom):
+        return seed
+    return np.random.default_rng(seed=seed)
+
+
+def choice(
+    rng: np.random.Generator | QuasiRandom, a: ArrayLike, size: int, p: ArrayLike
+) -> NDArray:
+    """Draw `size` elements of `a` with probabilities `p`, like :meth:`numpy.random.Generator.choice`.
+
+    With a :class:`QuasiRandom`, every element is drawn in proportion to its
+    probability up to the discrepancy of the points, much closer than with
+    random draws.
+    """
+    if not isinstance(rng, QuasiRandom):
+        return rng.choice(a, size=size, p=p)
+
+    return _inverse_cdf(a, p, rng.points(size, 1)[:, 0])
+
+
+def _inverse_cdf(a: ArrayLike, p: ArrayLike, u: NDArray) -> NDArray:
+    """The elements of `a` drawn with probabilities `p` from uniform samples `u`."""
+    cdf = np.cumsum(p)
+    index = np.searchsorted(cdf / cdf[-1], u, side="right")
+    return np.asarray(a)[np.minimum(index, len(cdf) - 1)]
+
+
+def _random(rng: np.random.Generator, out: np.ndarray) -> np.ndarray:
+    """Fill `out` with uniform samples in ``[0, 1)``, in place if possible."""
+    if out.flags.c_contiguous and out.dtype in (np.float32, np.float64):
+        rng.random(out=out, dtype=out.dtype)
+    else:
+        out[:] = rng.random(len(out))
+    return out
+
+
+def _scale(out: np.ndarray, low: float, high: float) -> np.ndarray:
+    """Scale uniform samples in ``[0, 1)`` to ``[low, high)`` in place."""
+    # the same operations as rng.uniform, so the samples are identical
+    out *= high - low
+    out += low
+    return out
+
 
 def sample_cylinder(
-    r_range: float,
+    r_range: tuple,
     z_range: tuple,
     size: int,
-    seed: int | None,
+    seed: SeedLike | QuasiRandom,
     phi_range: tuple = (0, 2 * np.pi),
-):
+    *,
+    out: NDArray | None = None,
+    dtype: DTypeLike = np.float64,
+) -> NDArray:
     """Generate points in a cylinder, returns the points as a 2D array
 
+    The points are computed in place in the output array, which can be reused
+    between calls (e.g. in rejection sampling loops), so only one temporary
+    array is allocated.
+
     Parameters
     ----------
     r_range
         The range of `r` to sample.
     z_range
         The range of `z` to sample.
-    phi
-        The range of angles to sample.
     size
         The number of points to generate.
     seed
-        The random seed for the rng.
+        The random seed for the rng, or the generator to use. With a
+        :class:`QuasiRandom`, the points are quasi-random.
+    phi_range
+        The range of angles to sample.
+    out
+        Array of shape `(size, 3)` to write the points to. By default a new
+        array is allocated, in Fortran order so the coordinates are
+        contiguous.
+    dtype
+        The floating point type of the new array, if `out` is not given.
     """
+    rng = get_rng(seed)
 
-    rng = np.random.default_rng(seed=seed)
+    if out is None:
+        out = np.empty((size, 3), dtype=dtype, order="F")
+    elif out.shape != (size, 3):
+        msg = f"out must have shape {(size, 3)} not {out.shape}"
+        raise ValueError(msg)
 
-    r2 = rng.uniform(low=r_range[0] ** 2, high=r_range[1] ** 2, size=size)
-    r = np.sqrt(r2)
+    x, y, z = out.T
 
-    z = rng.uniform(low=z_range[0], high=z_range[1], size=size)
-    phi = rng.uniform(low=phi_range[0], high=phi_range[1], size=size)
+    # uniform samples of r^2 in x, phi in y and z
+    if isinstance(rng, QuasiRandom):
+        out[:] = rng.points(size, 3)
+    else:
+        _random(rng, x)
+        _random(rng, z)
+        _random(rng, y)
+    _scale(z, *z_range)
 
-    x = r * np.cos(phi)
-    y = r * np.sin(phi)
+    if kernels.ENABLED:
+        # transformed in a single pass
+        r2_range = (float(r_range[0]) ** 2, float(r_range[1]) ** 2)
+        return kernels.cylinder(out, r2_range, tuple(map(float, phi_range)))
 
-    return np.column_stack((x, y, z))
+    # r (from r^2, for a uniform density) in x and phi in y
+    np.sqrt(_scale(x, r_range[0] ** 2, r_range[1] ** 2), out=x)
+    _scale(y, *phi_range)
+
+    cos_phi = np.cos(y)
+    np.sin(y, out=y)
+    y *= x
+    x *= cos_phi
+
+    return out
 
 
 def sample_histogram(
-    histo: hist.Hist, size: int, *, seed: int | None = None
+    histo: hist.Hist, size: int, *, seed: SeedLike = None
 ) -> np.ndarray:
     """Generate samples from a 1D or 2D histogram.
 
@@ -61,12 +252,14 @@ def sample_histogram(
     size
         The number of samples to generate.
     seed
-        Random seed.
+        Random seed, or the generator to use.
 
     Returns
     -------
     an array of the samples (1D case) of a tuple of x, y samples (2D case)
     """
+    import hist  # noqa: PLC0415
+
     # create rng
     rng = np.random.default_rng(seed=seed)
 
@@ -122,8 +315,187 @@ def sample_histogram(
     raise ValueError(msg)
 
 
+def _alias_table(probs: NDArray) -> tuple[NDArray, NDArray]:
+    """Build the Walker alias table of a discrete distribution.
+
+    Bin `i` is drawn with probability ``prob[i] / k`` directly, and is the
+    alias of the bins `j` with ``alias[j] == i`` with probability
+    ``(1 - prob[j]) / k``. The table is built as in Vose's method, where the
+    bins with less than the mean probability ("small") are topped up by
+    the bins with more ("large"). Instead of pairing them one by one, the
+    pairs follow from the cumulative sums of the deficits of the small bins
+    and of the excesses of the large bins, so there is no Python loop.
+    """
+    k = len(probs)
+    q = probs * (k / np.sum(probs))
+
+    prob = np.ones(k)
+    alias = np.arange(k)
+
+    small = np.flatnonzero(q < 1)
+    large = np.flatnonzero(q >= 1)
+    if len(small) == 0 or len(large) == 0:
+        return prob, alias
+
+    deficit = 1 - q[small]
+    end = np.cumsum(deficit)
+    start = end - deficit
+    excess_end = np.cumsum(q[large] - 1)
+
+    # every small bin is topped up by the large bin with excess left where
+    # its deficit starts
+    prob[small] = q[small]
+    owner = np.searchsorted(excess_end, start, side="right")
+    alias[small] = large[np.minimum(owner, len(large) - 1)]
+
+    # the excess of a large bin can run out in the middle of the deficit of a
+    # small bin, then the large bin is topped up by the next one
+    idx = np.minimum(np.searchsorted(end, excess_end, side="right"), len(small) - 1)
+    overshoot = np.where(start[idx] < excess_end, end[idx] - excess_end, 0)
+    prob[large[:-1]] = 1 - np.clip(overshoot[:-1], 0, 1)
+    alias[large[:-1]] = large[1:]
+
+    return prob, alias
+
+
+class HistogramSampler:
+    """Sample from a histogram with any number of dimensions.
+
+    Like :func:`sample_histogram`, the histogram is approximated as a
+    piecewise uniform probability distribution. The bins are drawn with a
+    Walker alias table, built once from the histogram, so every sample costs
+    the same whatever the number of bins. This is faster than
+    :func:`sample_histogram` when sampling the same histogram many times,
+    e.g. once per chunk, and for histograms with many bins.
+
+    Only the non-empty bins are stored, so a voxelised map (e.g. of the
+    activity in a 3D volume) costs memory proportional to its non-empty
+    voxels. A map which is already sparse can be given by the indices of
+    these voxels with :meth:`from_voxels`, without the dense grid.
+
+    Parameters
+    ----------
+    histo
+        The histogram to generate samples from, or the grid of its bin
+        contents.
+    edges
+        The bin edges along every axis, needed if `histo` is a grid.
+
+    Examples
+    --------
+    >>> sampler = HistogramSampler(histo)
+    >>> for chunk in chunks:
+    ...     energies = sampler.sample(chunk, seed=rng)
+    """
+
+    def __init__(
+        self, histo: hist.Hist | ArrayLike, edges: Sequence[ArrayLike] | None = None
+    ):
+        # slow to import, and only needed for histograms
+        import hist  # noqa: PLC0415
+
+        if isinstance(histo, hist.Hist):
+            counts, *edges = histo.to_numpy()
+        elif edges is not None:
+            counts = np.asarray(histo, dtype=np.float64)
+        else:
+            msg = f"sample histogram needs hist.Hist object or bin edges not {type(histo)}"
+            raise TypeError(msg)
+
+        index = np.flatnonzero(counts)
+        self._setup(edges, counts.shape, index, counts.ravel()[index])
+
+    @classmethod
+    def from_voxels(
+        cls, index: ArrayLike, weights: ArrayLike, edges: Sequence[ArrayLike]
+    ) -> Self:
+        """Make the sampler of a sparse histogram.
+
+        Parameters
+        ----------
+        index
+            The indices of the non-empty bins, with shape `(n, ndim)`.
+        weights
+            The contents of these bins.
+        edges
+            The bin edges along every axis.
+        """
+        shape = tuple(len(e) - 1 for e in edges)
+        index = np.ravel_multi_index(np.asarray(index).T, shape)
+
+        sampler = cls.__new__(cls)
+        sampler._setup(edges, shape, index, np.asarray(weights, dtype=np.float64))
+        return sampler
+
+    def _setup(
+        self,
+        edges: Sequence[ArrayLike],
+        shape: tuple[int, ...],
+        index: NDArray,
+        weights: NDArray,
+    ) -> None:
+        self.edges = [np.asarray(e, dtype=np.float64) for e in edges]
+        self.shape = shape
+        self.ndim = len(shape)
+
+        if len(self.edges) != self.ndim or any(
+            len(e) != n + 1 for e, n in zip(self.edges, shape, strict=True)
+        ):
+            msg = f"the bin edges do not match the histogram with shape {shape}"
+            raise ValueError(msg)
+
+        if np.any(weights < 0) or not np.sum(weights) > 0:
+            msg = "the histogram must have non-negative contents and entries"
+            raise ValueError(msg)
+
+        # the empty bins are never drawn
+        keep = weights > 0
+        self.index = index[keep]
+        self.weights = weights[keep]
+        self.widths = [np.diff(e) for e in self.edges]
+
+        self.prob, self.alias = _alias_table(self.weights)
+
+    def sample_bins(self, size: int, seed: SeedLike = None) -> NDArray:
+        """Draw the (flattened) indices of the bins of `size` samples."""
+        rng = np.random.default_rng(seed=seed)
+
+        idx = rng.integers(0, len(self.prob), size=size)
+        keep = rng.random(size) < self.prob[idx]
+        return self.index[np.where(keep, idx, self.alias[idx])]
+
+    def sample(self, size: int, seed: SeedLike = None) -> NDArray | tuple[NDArray, ...]:
+        """Generate samples from the histogram.
+
+        Parameters
+        ----------
+        size
+            The number of samples to generate.
+        seed
+            Random seed, or the generator to use.
+
+        Returns
+        -------
+        an array of the samples (1D case) or a tuple with the samples along
+        every axis.
+        """
+        rng = np.random.default_rng(seed=seed)
+
+        bins = np.unravel_index(self.sample_bins(size, rng), self.shape)
+
+        # the value within the bin
+        values = []
+        for edges, widths, idx in zip(self.edges, self.widths, bins, strict=True):
+            values.append(edges[idx] + rng.random(size) * widths[idx])
+
+        return values[0] if self.ndim == 1 else tuple(values)
+
+
 def sample_proportional_radius(
-    r0: ArrayLike, r1: ArrayLike, size: int = 10000, seed: int | None = None
+    r0: ArrayLike,
+    r1: ArrayLike,
+    size: int = 10000,
+    seed: SeedLike | QuasiRandom = None,
 ):
     r"""Sample from a distribution weighted by the radius. This is used for the surface sampling og shapes.
 
@@ -145,30 +517,37 @@ def sample_proportional_radius(
     size
         number of samples.
     seed
-        random seed for rng.
+        random seed for rng, or the generator (or :class:`QuasiRandom`) to use.
     """
-    rng = (
-        np.random.default_rng(seed=seed)
-        if seed is not None
-        else np.random.default_rng()
-    )
+    rng = get_rng(seed)
     if len(r0) != size or len(r1) != size:
         msg = (
             f"r0 and r1 must have {size} elements not {len(r0)} (r0) or {len(r1)} (r1)"
         )
         raise ValueError(msg)
 
+    # Generate uniform samples for each pair
+    if isinstance(rng, QuasiRandom):
+        u = rng.points(size, 1).ravel()
+    else:
+        u = rng.uniform(size=size)
+
+    return _proportional_radius(u, r0, r1)
+
+
+def _proportional_radius(u: NDArray, r0: ArrayLike, r1: ArrayLike) -> NDArray:
+    """Transform uniform samples `u` in place, see :func:`sample_proportional_radius`."""
     # Ensure r0 and r1 are numpy arrays
     r0, r1 = np.asarray(r0), np.asarray(r1)
 
+    if kernels.ENABLED:
+        return kernels.proportional_radius(u, r0, r1)
+
     # Get min and max for each pair
     sign = r1 > r0
     a = np.minimum(r0, r1)
     b = np.maximum(r0, r1)
 
-    # Generate uniform samples for each pair
-    u = rng.uniform(size=a.shape)  # Same shape as r0 and r1
-
     # Apply inverse transform sampling element-wise
     result = u
     mask = a != b
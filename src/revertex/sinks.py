@@ -0,0 +1,636 @@
+"""Outputs (sinks) of the generated vertices.
+
+A sink receives the converted chunks (LGDO tables in the remage format) and
+stores them, e.g. in an LH5 file (:class:`LH5Sink`), as memory-mapped NumPy
+files (:class:`NumpySink`) or in memory (:class:`MemorySink`). The generator
+entry points accept a sink wherever they accept an output file.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Self
+
+import h5py
+import lh5
+import numpy as np
+from lgdo.types import LGDO, Array, Scalar, Struct, Table
+from numpy.typing import NDArray
+
+log = logging.getLogger(__name__)
+
+# name of the struct recording the progress of a run, used to resume it
+CHECKPOINT = "misc/checkpoint"
+
+# name of the struct with the timing and memory metrics of a run
+PERF = "misc/perf"
+
+# number of rows of an HDF5 chunk of the pre-sized output datasets (32 kB of
+# float64): the (default gzip) compression gets slower for larger chunks, and
+# partially written chunks still fit in the default chunk cache
+_HDF5_CHUNK_ROWS = 4096
+
+
+def _iter_arrays(obj: LGDO, name: str) -> Iterator[tuple[str, NDArray]]:
+    """Iterate over the paths and data of the arrays of a (nested) struct."""
+    if isinstance(obj, Array):
+        yield name, obj.nda
+    elif isinstance(obj, Struct):
+        for field, value in obj.items():
+            yield from _iter_arrays(value, f"{name}/{field}")
+    else:
+        msg = f"cannot write {type(obj).__name__} {name} into pre-sized datasets"
+        raise NotImplementedError(msg)
+
+
+def _deflate_chunk(chunk: NDArray, shuffle: bool, level: int) -> bytes:
+    """Apply the HDF5 shuffle and deflate filters to the data of a chunk."""
+    if shuffle:
+        data = chunk.view(np.uint8).reshape(-1, chunk.itemsize).T.tobytes()
+    else:
+        data = chunk.tobytes()
+
+    return zlib.compress(data, level)
+
+
+class BackgroundWriter:
+    """Write LGDO objects to an LH5 file on a background thread.
+
+    The objects are passed to the writer thread through a bounded queue, so
+    that the next chunk can be generated while the previous one is written.
+    The file is overwritten (or, to resume writing, opened for appending) and
+    kept open until the writer is closed.
+
+    If the total number of rows `n_rows` is known, the datasets of each table
+    are created at their final size (with chunks of `chunk_rows` rows) when it
+    is first written, and every object is written into its slice of rows.
+    This avoids resizing the datasets for every object and allows the objects
+    to be written out of order with `start_row`. Otherwise the objects are
+    appended, as are objects other than tables (e.g. a struct of scalars).
+    The file is flushed after every object other than a table, so that such
+    an object (e.g. a checkpoint) is only on disk after the preceding tables.
+
+    The full HDF5 chunks of gzip compressed pre-sized datasets are compressed
+    by a pool of `compression_threads` threads and written directly, so that
+    the compression is not limited to the writer thread.
+
+    The time spent generating and the time spent waiting for the writer are
+    logged when the writer is closed.
+
+    Parameters
+    ----------
+    out_file
+        The path to the output file.
+    maxsize
+        The maximum number of objects waiting to be written.
+    n_rows
+        The total number of rows of each object, if known.
+    chunk_rows
+        The number of rows of the HDF5 chunks of the pre-sized datasets.
+    compression_threads
+        The number of threads compressing the chunks, by default the number of
+        CPUs.
+    resume
+        Keep the existing file and write into its (pre-sized) datasets.
+
+    Examples
+    --------
+    >>> with BackgroundWriter("vtx.lh5", n_rows=n) as writer:
+    ...     for chunk in chunks:
+    ...         writer.write(convert_output_pos(chunk), "vtx/pos")
+    """
+
+    def __init__(
+        self,
+        out_file: str,
+        maxsize: int = 2,
+        *,
+        n_rows: int | None = None,
+        chunk_rows: int = _HDF5_CHUNK_ROWS,
+        compression_threads: int | None = None,
+        resume: bool = False,
+    ) -> None:
+        self.out_file = out_file
+        self.resume = resume
+        self.n_rows = n_rows
+        self.chunk_rows = chunk_rows
+        self.compression_threads = compression_threads or os.cpu_count() or 1
+
+        self.n_written = 0
+        self.write_time = 0.0
+        self.wait_time = 0.0
+        self.compute_time = 0.0
+
+        # dataset paths and next row of each pre-sized object
+        self._paths = {}
+        self._next_row = {}
+
+        self._file = None
+        self._pool = None
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._error = None
+        self._start = time.perf_counter()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            # after an error keep draining the queue so the producer never blocks
+            if self._error is not None:
+                continue
+
+            obj, name, start_row = item
+            start = time.perf_counter()
+            try:
+                if self._file is None:
+                    Path(self.out_file).parent.mkdir(parents=True, exist_ok=True)
+                    self._file = h5py.File(self.out_file, "a" if self.resume else "w")
+
+                if self.n_rows is None or not isinstance(obj, Table):
+                    lh5.write(obj, name, self._file, wo_mode="append")
+                    self._file.flush()
+                else:
+                    self._write_rows(obj, name, start_row)
+            except Exception as e:
+                # any error is raised in the caller (see _raise_error), the
+                # thread keeps running so the caller never blocks on the queue
+                self._error = e
+            else:
+                self.n_written += 1
+            self.write_time += time.perf_counter() - start
+
+        try:
+            if self._pool is not None:
+                self._pool.shutdown()
+            if self._file is not None:
+                if self._error is None:
+                    self._truncate()
+                self._file.close()
+        except Exception as e:
+            # raised in the caller by close()
+            self._error = self._error or e
+
+    def _write_rows(self, obj: LGDO, name: str, start_row: int | None) -> None:
+        if name in self._file and name not in self._paths:
+            # resume writing into the datasets of a previous run
+            self._paths[name] = [path for path, _ in _iter_arrays(obj, name)]
+            for path in self._paths[name]:
+                if self._file[path].shape[0] < self.n_rows:
+                    self._file[path].resize(self.n_rows, axis=0)
+
+            self._next_row[name] = 0
+
+        if name not in self._file:
+            # create the datasets (and attributes) with lh5, then resize them
+            lh5.write(
+                obj,
+                name,
+                self._file,
+                n_rows=0,
+                wo_mode="w",
+                maxshape=(None,),
+                chunks=(max(min(self.chunk_rows, self.n_rows), 1),),
+            )
+            self._paths[name] = [path for path, _ in _iter_arrays(obj, name)]
+            for path in self._paths[name]:
+                self._file[path].resize(self.n_rows, axis=0)
+
+            self._next_row[name] = 0
+
+        if start_row is None:
+            start_row = self._next_row[name]
+
+        for path, nda in _iter_arrays(obj, name):
+            dset = self._file[path]
+            if start_row + len(nda) > dset.shape[0]:
+                dset.resize(start_row + len(nda), axis=0)
+            self._write_slice(dset, start_row, nda)
+
+        self._next_row[name] = max(self._next_row[name], start_row + len(obj))
+
+    def _write_slice(self, dset: h5py.Dataset, start: int, nda: NDArray) -> None:
+        end = start + len(nda)
+
+        # only the gzip (and shuffle) filters are applied by hand
+        if dset.compression != "gzip" or dset.fletcher32 or dset.scaleoffset:
+            dset[start:end] = nda
+            return
+
+        # the full chunks inside the slice are compressed in parallel, the
+        # partial chunks at the edges go through the HDF5 filter pipeline
+        rows = dset.chunks[0]
+        first = -(-start // rows) * rows
+        last = end // rows * rows
+        if last <= first:
+            dset[start:end] = nda
+            return
+
+        if start < first:
+            dset[start:first] = nda[: first - start]
+        if last < end:
+            dset[last:end] = nda[last - start :]
+
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.compression_threads)
+
+        full = nda[first - start : last - start].astype(dset.dtype, copy=False)
+        compress = partial(
+            _deflate_chunk, shuffle=dset.shuffle, level=dset.compression_opts
+        )
+        chunks = self._pool.map(compress, full.reshape(-1, rows))
+        for idx, data in enumerate(chunks):
+            dset.id.write_direct_chunk((first + idx * rows,), data)
+
+    def _truncate(self) -> None:
+        # shrink the datasets if fewer rows than expected were written
+        for name, n_rows in self._next_row.items():
+            if n_rows == self.n_rows:
+                continue
+
+            msg = "Wrote %d rows of %s, expected %d"
+            log.warning(msg, n_rows, name, self.n_rows)
+
+            for path in self._paths[name]:
+                self._file[path].resize(n_rows, axis=0)
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            msg = f"failed writing to {self.out_file}"
+            raise RuntimeError(msg) from self._error
+
+    def write(self, obj: LGDO, name: str, start_row: int | None = None) -> None:
+        """Queue an object to be written, blocks if the queue is full.
+
+        Parameters
+        ----------
+        obj
+            The object to write.
+        name
+            The name of the object in the file, e.g. `vtx/pos`.
+        start_row
+            The first row of the object in the pre-sized datasets, by default
+            after the last row written. Only used if `n_rows` is given.
+        """
+        self._raise_error()
+
+        start = time.perf_counter()
+        self._queue.put((obj, name, start_row))
+        self.wait_time += time.perf_counter() - start
+
+    def close(self) -> None:
+        """Wait for the queued objects to be written and stop the thread."""
+        if not self._thread.is_alive():
+            return
+
+        start = time.perf_counter()
+        self._queue.put(None)
+        self._thread.join()
+        self.wait_time += time.perf_counter() - start
+
+        self.compute_time = time.perf_counter() - self._start - self.wait_time
+
+        msg = (
+            "Wrote %d objects to %s: %.2f s generating, %.2f s waiting for the "
+            "writer, %.2f s writing"
+        )
+        log.info(
+            msg,
+            self.n_written,
+            self.out_file,
+            self.compute_time,
+            self.wait_time,
+            self.write_time,
+        )
+
+        self._raise_error()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class Sink:
+    """Base class of the outputs of the generated vertices.
+
+    A sink is opened by the generator entry point, with the total number of
+    rows if it is known, receives the chunks with :meth:`write` and is closed
+    once all chunks are written. It is used as a context manager:
+
+    >>> with sink.open(n_rows=n):
+    ...     for chunk in chunks:
+    ...         sink.write(convert_output_pos(chunk), "vtx/pos")
+
+    A sink that can be resumed keeps the objects of a previous run when it is
+    opened with `resume`, and returns the last checkpoint (a struct of scalars
+    written under :data:`CHECKPOINT`) of that run from :meth:`read_checkpoint`.
+    """
+
+    def open(
+        self,
+        n_rows: int | None = None,  # noqa: ARG002
+        resume: bool = False,  # noqa: ARG002
+    ) -> Sink:
+        """Prepare the sink for writing.
+
+        Parameters
+        ----------
+        n_rows
+            The total number of rows of each table, if known.
+        resume
+            Keep the objects written by a previous run.
+        """
+        return self
+
+    def read_checkpoint(self) -> dict | None:
+        """Get the last checkpoint written to the sink, if any."""
+        return None
+
+    def write(self, obj: LGDO, name: str, start_row: int | None = None) -> None:
+        """Write an object, e.g. a chunk of a table.
+
+        Parameters
+        ----------
+        obj
+            The object to write.
+        name
+            The name of the object, e.g. `vtx/pos`.
+        start_row
+            The first row of a chunk of a table, by default after the last row
+            written.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Finish writing."""
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class LH5Sink(Sink):
+    """Write the vertices to an LH5 file, on a background thread.
+
+    Parameters
+    ----------
+    path
+        The path to the output file, it is overwritten.
+    **kwargs
+        Keyword arguments to the :class:`BackgroundWriter`.
+    """
+
+    def __init__(self, path: str | Path, **kwargs) -> None:
+        self.path = path
+        self.kwargs = kwargs
+        self._writer = None
+
+    def open(self, n_rows: int | None = None, resume: bool = False) -> LH5Sink:
+        self._writer = BackgroundWriter(
+            self.path,
+            n_rows=n_rows,
+            resume=resume and Path(self.path).is_file(),
+            **self.kwargs,
+        )
+        return self
+
+    def read_checkpoint(self) -> dict | None:
+        if not Path(self.path).is_file():
+            return None
+
+        with h5py.File(self.path, "r") as f:
+            if CHECKPOINT not in f:
+                return None
+
+        checkpoint = lh5.read(CHECKPOINT, self.path)
+        return {k: _decode(v.value) for k, v in checkpoint.items()}
+
+    def write(self, obj: LGDO, name: str, start_row: int | None = None) -> None:
+        self._writer.write(obj, name, start_row=start_row)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+    def __repr__(self) -> str:
+        return f"LH5Sink({str(self.path)!r})"
+
+
+class NumpySink(Sink):
+    """Write the vertices to a directory of memory-mapped NumPy files.
+
+    Every column of a table is stored as a `.npy` file at the path of the
+    column in the directory, e.g. `vtx/pos/xloc.npy`, so the vertices can be
+    memory-mapped without decoding, with ``np.load(path, mmap_mode="r")``.
+    Scalars are stored as 0-dimensional arrays and the attributes (e.g. the
+    units) of all objects in `attrs.json`.
+
+    The files of the tables are created at their final size, so the total
+    number of rows must be known when the sink is opened.
+
+    Parameters
+    ----------
+    path
+        The path to the output directory.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.n_rows = None
+        self.resume = False
+
+        self._columns = {}
+        self._next_row = {}
+        self._attrs = {}
+
+    def open(self, n_rows: int | None = None, resume: bool = False) -> NumpySink:
+        if n_rows is None:
+            msg = "the number of rows must be known to write to NumPy files"
+            raise ValueError(msg)
+
+        self.n_rows = n_rows
+        self.resume = resume
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        if resume and (self.path / "attrs.json").is_file():
+            with (self.path / "attrs.json").open() as f:
+                self._attrs = json.load(f)
+
+        return self
+
+    def read_checkpoint(self) -> dict | None:
+        directory = self.path / CHECKPOINT
+        if not directory.is_dir():
+            return None
+
+        return {
+            file.stem: _decode(np.load(file).item())
+            for file in sorted(directory.glob("*.npy"))
+        }
+
+    def _store_attrs(self, obj: LGDO, name: str) -> None:
+        self._attrs[name] = {
+            k: v for k, v in obj.attrs.items() if k not in ("hdf5_settings",)
+        }
+        if isinstance(obj, Struct):
+            for field, value in obj.items():
+                self._store_attrs(value, f"{name}/{field}")
+
+    def write(self, obj: LGDO, name: str, start_row: int | None = None) -> None:
+        if not isinstance(obj, Table):
+            self._store_attrs(obj, name)
+            self._save(obj, name)
+            return
+
+        if name not in self._next_row:
+            self._store_attrs(obj, name)
+            self._next_row[name] = 0
+
+        if start_row is None:
+            start_row = self._next_row[name]
+
+        for path, nda in _iter_arrays(obj, name):
+            if path not in self._columns:
+                file = self.path / f"{path}.npy"
+                file.parent.mkdir(parents=True, exist_ok=True)
+                if self.resume and file.is_file():
+                    column = np.lib.format.open_memmap(file, mode="r+")
+                    if len(column) < self.n_rows:
+                        # the file was shrunk when the previous run stopped
+                        data = np.array(column)
+                        del column
+                        column = np.lib.format.open_memmap(
+                            file, mode="w+", dtype=data.dtype, shape=(self.n_rows,)
+                        )
+                        column[: len(data)] = data
+                else:
+                    column = np.lib.format.open_memmap(
+                        file, mode="w+", dtype=nda.dtype, shape=(self.n_rows,)
+                    )
+                self._columns[path] = (name, column)
+
+            self._columns[path][1][start_row : start_row + len(nda)] = nda
+
+        self._next_row[name] = max(self._next_row[name], start_row + len(obj))
+
+    def _save(self, obj: LGDO, name: str) -> None:
+        if isinstance(obj, Struct):
+            for field, value in obj.items():
+                self._save(value, f"{name}/{field}")
+        elif isinstance(obj, Scalar | Array):
+            file = self.path / f"{name}.npy"
+            file.parent.mkdir(parents=True, exist_ok=True)
+            np.save(file, obj.value if isinstance(obj, Scalar) else obj.nda)
+        else:
+            msg = f"cannot write {type(obj).__name__} {name} to NumPy files"
+            raise NotImplementedError(msg)
+
+    def close(self) -> None:
+        while self._columns:
+            path, (name, column) = self._columns.popitem()
+            column.flush()
+
+            # shrink the files if fewer rows than expected were written
+            n_written = self._next_row[name]
+            if n_written < self.n_rows:
+                data = np.array(column[:n_written])
+                del column
+                np.save(self.path / f"{path}.npy", data)
+
+        if self._attrs:
+            with (self.path / "attrs.json").open("w") as f:
+                json.dump(self._attrs, f, indent=2, default=str)
+
+    def __repr__(self) -> str:
+        return f"NumpySink({str(self.path)!r})"
+
+
+class MemorySink(Sink):
+    """Keep the vertices in memory, e.g. for tests or to use them directly.
+
+    Examples
+    --------
+    >>> sink = MemorySink()
+    >>> write_remage_vtx(1000, sink, seed=1, generator=generator)
+    >>> sink.read("vtx/pos")
+    """
+
+    def __init__(self) -> None:
+        self.objects: dict[str, list[tuple[int | None, LGDO]]] = {}
+
+    def open(
+        self,
+        n_rows: int | None = None,  # noqa: ARG002
+        resume: bool = False,
+    ) -> MemorySink:
+        if not resume:
+            self.objects = {}
+        return self
+
+    def read_checkpoint(self) -> dict | None:
+        if CHECKPOINT not in self.objects:
+            return None
+        return {k: v.value for k, v in self.read(CHECKPOINT).items()}
+
+    def write(self, obj: LGDO, name: str, start_row: int | None = None) -> None:
+        self.objects.setdefault(name, []).append((start_row, obj))
+
+    def read(self, name: str) -> LGDO:
+        """Get an object, with the chunks of a table concatenated in order.
+
+        Parameters
+        ----------
+        name
+            The name of the object, e.g. `vtx/pos`.
+        """
+        chunks = self.objects[name]
+        if not isinstance(chunks[0][1], Table):
+            return chunks[-1][1]
+
+        # the chunks without start row follow the previous chunk, a chunk
+        # written again (e.g. by a resumed run) replaces the previous one
+        placed = {}
+        next_row = 0
+        for start_row, obj in chunks:
+            start = next_row if start_row is None else start_row
+            placed[start] = obj
+            next_row = max(next_row, start + len(obj))
+        placed = sorted(placed.items(), key=lambda x: x[0])
+
+        first = placed[0][1]
+        out = Table(size=sum(len(obj) for _, obj in placed))
+        for field, col in first.items():
+            nda = np.concatenate([obj[field].nda for _, obj in placed])
+            attrs = {k: v for k, v in col.attrs.items() if k != "datatype"}
+            out.add_field(field, Array(nda, attrs=attrs))
+
+        return out
+
+
+def _decode(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def as_sink(out: str | Path | Sink) -> Sink:
+    """Get the sink of an output, an LH5 file if it is a path."""
+    return out if isinstance(out, Sink) else LH5Sink(out)
@@ -1,17 +1,21 @@
 from __future__ import annotations
 
+import functools
 import logging
 import re
+import weakref
+from typing import TYPE_CHECKING, ClassVar
 
 import colorlog
 import numpy as np
-import pyg4ometry.geant4 as pg4
-import pygeomhpges
-import pygeomtools
-from pyg4ometry import geant4
+from numpy.typing import ArrayLike, NDArray
 
 from revertex import sampling
 
+if TYPE_CHECKING:
+    import pygeomhpges
+    from pyg4ometry import geant4
+
 log = logging.getLogger(__name__)
 
 
@@ -70,37 +74,137 @@ def find_mother_physical_volumes(
     return mothers
 
 
-def _get_position(pv_name: str, reg: geant4.Registry) -> list:
-    """Get the global position of a physical volume from the GDML"""
+def get_placement_index(
+    reg: geant4.Registry,
+) -> dict[str, list[geant4.PhysicalVolume]]:
+    """Index the mother physical volumes of every physical volume.
+
+    The mothers of a physical volume are the placements of the logical volume
+    it is placed in. The index is built in a single pass over the registry,
+    instead of a search of the registry for every volume (see
+    :func:`find_mother_physical_volumes`).
+
+    Returns
+    -------
+    the list of mother physical volumes for the name of every physical volume,
+    empty for the volumes placed in the world.
+    """
+    placements = {}
+    for pv in reg.physicalVolumeDict.values():
+        placements.setdefault(pv.logicalVolume.name, []).append(pv)
+
+    return {
+        daughter.name: placements.get(lv.name, [])
+        for lv in reg.logicalVolumeDict.values()
+        for daughter in lv.daughterVolumes
+    }
+
 
-    pv = reg.physicalVolumeDict[pv_name]
-    local_pos = pv.position
+def _local_transform(pv: geant4.PhysicalVolume) -> NDArray:
+    """The 4x4 transform from the frame of a physical volume to that of its mother."""
+    # the geometry packages are slow to import, only import them when needed
+    from pyg4ometry import transformation  # noqa: PLC0415
 
-    n_mothers = 1
+    if pv.type != "placement":
+        msg = f"Only support finding global transforms of placements, not {pv.type}"
+        raise RuntimeError(msg)
+
+    # the rotation of a GDML placement is that of the frame, the volume is
+    # rotated by its inverse (as in Geant4)
+    rotation = np.linalg.inv(transformation.tbxyz2matrix(pv.rotation.eval()))
+    scale = pv.scale.eval() if pv.scale is not None else [1, 1, 1]
+
+    transform = np.eye(4)
+    transform[:3, :3] = rotation @ np.diag(scale)
+    transform[:3, 3] = pv.position.eval()
+    return transform
+
+
+def get_global_transforms(
+    reg: geant4.Registry,
+    pv_names: list[str],
+    index: dict[str, list[geant4.PhysicalVolume]] | None = None,
+) -> dict[str, NDArray]:
+    """Get the global transforms of physical volumes from the GDML.
+
+    The transform of a volume is the 4x4 matrix (rotation and translation)
+    from its local coordinates to the global ones, composed over the chain of
+    its mother volumes. The transform of every mother is only computed once,
+    for all the volumes placed in it.
+
+    Parameters
+    ----------
+    reg
+        the registry of the geometry.
+    pv_names
+        the names of the physical volumes.
+    index
+        the mother volumes of every volume, see :func:`get_placement_index`.
+        Built from `reg` if not given.
+    """
+    if index is None:
+        index = get_placement_index(reg)
 
-    while n_mothers > 0:
-        mothers = find_mother_physical_volumes(pv, reg)
-        n_mothers = len(mothers)
+    transforms = {}
 
-        if len(mothers) > 1:
-            msg = "Only support finding global position if every volume is only placed once."
-            raise RuntimeError(msg)
-        if len(mothers) == 1:
-            if mothers[0].rotation.eval() != [0, 0, 0]:
-                msg = "Only support finding global position without rotations"
+    def _global_transform(pv):
+        if pv.name not in transforms:
+            mothers = index.get(pv.name, [])
+            if len(mothers) > 1:
+                msg = "Only support finding global position if every volume is only placed once."
                 raise RuntimeError(msg)
 
-            local_pos += mothers[0].position
+            transform = _local_transform(pv)
+            if len(mothers) == 1:
+                transform = _global_transform(mothers[0]) @ transform
+            transforms[pv.name] = transform
+
+        return transforms[pv.name]
+
+    return {name: _global_transform(reg.physicalVolumeDict[name]) for name in pv_names}
+
+
+def _get_position(pv_name: str, reg: geant4.Registry) -> list:
+    """Get the global position of a physical volume from the GDML"""
+    return get_global_transforms(reg, [pv_name])[pv_name][:3, 3].tolist()
+
+
+def to_global(
+    local: NDArray, placement: ArrayLike, out: NDArray | None = None
+) -> NDArray:
+    """Transform local coordinates in a detector to global ones.
+
+    Parameters
+    ----------
+    local
+        the local coordinates of the points, with shape `(n, 3)`.
+    placement
+        the global position of the origin of the detector, or the 4x4
+        transform of its placement (see :func:`get_global_transforms`).
+    out
+        the array to write the global coordinates to.
+    """
+    placement = np.asarray(placement, dtype=float)
+
+    if placement.shape != (4, 4):
+        return np.add(local, placement, out=out)
 
-            pv = mothers[0]
+    # rotate all the points in a single matrix multiplication
+    out = np.matmul(local, placement[:3, :3].T, out=out)
+    out += placement[:3, 3]
+    return out
 
-    return local_pos.eval()
 
+def get_hpges(reg: geant4.Registry, detectors: str | list[str]) -> tuple[dict, dict]:
+    """Extract the objects for each HPGe detector in `reg` and in the list of `detectors`
 
-def get_hpges(
-    reg: pg4.geant4.registry, detectors: str | list[str]
-) -> tuple[dict, dict]:
-    """Extract the objects for each HPGe detector in `reg` and in the list of `detectors`"""
+    Returns the HPGe objects and their placements: the global position of
+    their origin, or the 4x4 global transform of the rotated detectors (see
+    :func:`to_global`).
+    """
+    # the geometry packages are slow to import, only import them when needed
+    import pygeomhpges  # noqa: PLC0415
+    import pygeomtools  # noqa: PLC0415
 
     phy_vol_dict = reg.physicalVolumeDict
     det_list = expand_regex(list(phy_vol_dict.keys()), list(detectors))
@@ -112,7 +216,13 @@ def get_hpges(
         for name in det_list
     }
 
-    pos = {name: _get_position(name, reg) for name in det_list}
+    # the translation of the unrotated detectors, the full transform otherwise
+    pos = {}
+    for name, transform in get_global_transforms(reg, det_list).items():
+        if np.array_equal(transform[:3, :3], np.eye(3)):
+            pos[name] = transform[:3, 3].tolist()
+        else:
+            pos[name] = transform
 
     return hpges, pos
 
@@ -133,25 +243,57 @@ def get_surface_weights(hpges: dict, surface_type: str | None) -> list:
     for a given `surface_type`
     """
 
-    # index of the surfaces per detector
-    surf_ids_tot = [
-        np.array(hpge.surfaces) == surface_type
-        if surface_type is not None
-        else np.arange(len(hpge.surfaces))
-        for name, hpge in hpges.items()
-    ]
-
     # total surface area per detector
     surf_tot = [
-        np.sum(hpge.surface_area(surf_ids).magnitude)
-        for (name, hpge), surf_ids in zip(hpges.items(), surf_ids_tot, strict=True)
+        DetectorSamplingCache.get(hpge, surface_type).surface_area
+        for hpge in hpges.values()
     ]
 
+    # the detectors without surfaces of the type get no vertices, but at
+    # least one of them must have some
+    if np.sum(surf_tot) == 0:
+        msg = f"none of {list(hpges)} has a surface of type {surface_type} to sample on"
+        raise ValueError(msg)
+
     return surf_tot / np.sum(surf_tot)
 
 
-def get_borehole_volume(hpge: pygeomhpges.HPGe, size=1000000):
-    """Estimate the borehole volume (with MC)"""
+@functools.lru_cache(maxsize=1024)
+def _revolution_volume(r: tuple[float, ...], z: tuple[float, ...]) -> float:
+    """The volume of revolution of the polygon `(r, z)` around the z axis.
+
+    By Pappus' theorem, the volume is the area of the polygon times the
+    distance travelled by its centroid. Summed over the edges (closing the
+    polygon) this is the sum of the signed volumes of the frustums below them.
+    """
+    r1, z1 = r[-1], z[-1]
+    volume = 0.0
+    for r2, z2 in zip(r, z, strict=True):
+        volume += (r1 * r1 + r1 * r2 + r2 * r2) * (z2 - z1)
+        r1, z1 = r2, z2
+
+    return np.pi * abs(volume) / 3
+
+
+def get_borehole_volume(hpge: pygeomhpges.HPGe, size: int | None = None) -> float:
+    """The volume of the borehole of an HPGe, in mm^3.
+
+    The volume is computed exactly from the r-z profile of the borehole
+    (``hpge.borehole_r`` and ``hpge.borehole_z``), and cached for every
+    profile.
+
+    Parameters
+    ----------
+    hpge
+        the detector.
+    size
+        if given, estimate the volume with this number of Monte Carlo points
+        instead, e.g. as a cross-check.
+    """
+    if size is None:
+        return _revolution_volume(
+            tuple(map(float, hpge.borehole_r)), tuple(map(float, hpge.borehole_z))
+        )
 
     r, z = hpge.get_profile()
     height = max(z)
@@ -170,11 +312,105 @@ def get_borehole_volume(hpge: pygeomhpges.HPGe, size=1000000):
 def get_borehole_weights(hpges: dict) -> list:
     """Get a weighting for each hpge in the `hpges` based on borehole volume"""
 
-    vol_tot = [get_borehole_volume(hpge, size=int(1e6)) for _, hpge in hpges.items()]
+    vol_tot = [
+        DetectorSamplingCache.get(hpge).borehole_volume for hpge in hpges.values()
+    ]
 
     return vol_tot / np.sum(vol_tot)
 
 
+class DetectorSamplingCache:
+    """The tables of a detector needed to sample vertices on or around it.
+
+    The surface, shell and borehole samplers generate every chunk of a run
+    from the same detectors. The tables derived from the geometry of a
+    detector (its profile, the segments and areas of its surfaces, its
+    bounding cylinders and volumes) are computed once, with :meth:`get`, and
+    reused for every chunk. They hold no reference to the detector, so they
+    can be pickled, e.g. to worker processes.
+
+    Parameters
+    ----------
+    hpge
+        the detector.
+    surface_type
+        the type of the surfaces to sample on (`nplus`, `pplus`,
+        `passive`), or None for all the surfaces.
+    """
+
+    # the tables of every detector and surface type, for the lifetime of the
+    # detector
+    _cache: ClassVar[weakref.WeakKeyDictionary] = weakref.WeakKeyDictionary()
+
+    def __init__(self, hpge: pygeomhpges.HPGe, surface_type: str | None = None):
+        # the geometry packages are slow to import, only import them when needed
+        import pygeomhpges  # noqa: PLC0415
+
+        self.name = hpge.name
+        self.surface_type = surface_type
+
+        r, z = hpge.get_profile()
+        self.r, self.z = np.asarray(r, dtype=float), np.asarray(z, dtype=float)
+
+        # the bounding cylinder of the detector
+        self.radius, self.height = float(np.max(self.r)), float(np.max(self.z))
+
+        # the segments of the profile, and the areas of the surfaces to sample
+        self.s1, self.s2 = pygeomhpges.utils.get_line_segments(r, z)
+        self.surface_indices = get_surface_indices(hpge, surface_type)
+        self.areas = hpge.surface_area(self.surface_indices).magnitude
+        self.surface_area = float(np.sum(self.areas))
+
+        # normalised as by Generator.choice, which draws the same surfaces. A
+        # detector without surfaces of the type has no vertices, e.g. in an
+        # array where only some detectors have them
+        self.area_cdf = np.zeros(len(self.areas))
+        if self.surface_area > 0:
+            self.area_cdf = np.cumsum(self.areas / self.surface_area)
+            self.area_cdf /= self.area_cdf[-1]
+
+        # the borehole, if any, and its bounding cylinder
+        self.borehole_volume = None
+        if getattr(hpge, "borehole_r", None) is not None:
+            self.borehole_volume = get_borehole_volume(hpge)
+            self.borehole_radius = float(np.max(hpge.borehole_r))
+            self.borehole_z_range = (
+                float(np.min(hpge.borehole_z)),
+                float(np.max(hpge.borehole_z)),
+            )
+
+    @classmethod
+    def get(
+        cls, hpge: pygeomhpges.HPGe, surface_type: str | None = None
+    ) -> DetectorSamplingCache:
+        """The tables of a detector, computed on the first call."""
+        tables = cls._cache.setdefault(hpge, {})
+        if surface_type not in tables:
+            tables[surface_type] = cls(hpge, surface_type)
+        return tables[surface_type]
+
+    @classmethod
+    def put(
+        cls,
+        hpge: pygeomhpges.HPGe,
+        surface_type: str | None,
+        tables: DetectorSamplingCache,
+    ) -> None:
+        """Set the tables of a detector, e.g. read from the :mod:`.cache`."""
+        cls._cache.setdefault(hpge, {})[surface_type] = tables
+
+    def check_surfaces(self, n: int) -> None:
+        """Raise a ValueError if `n` vertices cannot be sampled on the surfaces."""
+        if n > 0 and self.surface_area == 0:
+            msg = f"{self.name} has no surface of type {self.surface_type} to sample on"
+            raise ValueError(msg)
+
+    def sample_sides(self, u: NDArray) -> NDArray:
+        """The surfaces drawn in proportion to their area, from uniform samples `u`."""
+        self.check_surfaces(len(u))
+        return self.surface_indices[np.searchsorted(self.area_cdf, u, side="right")]
+
+
 def setup_log(level: int | None = None) -> None:
     """Setup a colored logger for this package.
 
@@ -7,11 +7,11 @@ from pathlib import Path
 from tempfile import gettempdir
 
 import dbetto
+import numpy as np
 import pyg4ometry as pg4
 import pygeomhpges as hpges
 import pygeomtools
 import pytest
-from legendtestdata import LegendTestData
 
 _tmptestdir = Path(gettempdir()) / f"revertex-tests-{getuser()}-{uuid.uuid4()!s}"
 
@@ -29,18 +29,32 @@ def tmptestdir(tmptestdir_global, request):
     return p
 
 
+@pytest.fixture(scope="session", autouse=True)
+def cache_dir(tmptestdir_global):
+    """Keep the geometry cache of the tests out of the home directory."""
+    path = tmptestdir_global / "cache"
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("REVERTEX_CACHE_DIR", str(path))
+        yield path
+
+
+def uniform_box(size, seed=None, *, length):
+    """A generator of vertices in a box, shared by the tests.
+
+    Defined at module level, so the worker processes can import it.
+    """
+    rng = np.random.default_rng(seed=seed)
+    return rng.uniform(low=0, high=length, size=(size, 3))
+
+
+uniform_box.bytes_per_event = 100
+
+
 def pytest_sessionfinish(exitstatus):
     if exitstatus == 0 and Path.exists(_tmptestdir):
         shutil.rmtree(_tmptestdir)
 
 
-@pytest.fixture(scope="session")
-def test_data_configs():
-    ldata = LegendTestData()
-    ldata.checkout("8247690")
-    return ldata.get_path("legend/metadata/hardware/detectors/germanium/diodes")
-
-
 @pytest.fixture(scope="session", autouse=True)
 def test_gdml(test_data_configs):
     test_file_dir = Path(__file__).parent
@@ -10,6 +10,7 @@ import numpy as np
 import pyg4ometry as pyg4
 import pytest
 
+from revertex import sinks
 from revertex.cli import cli
 from revertex.generators import alpha_n
 from revertex.generators.alpha_n import (
@@ -733,6 +734,13 @@ def test_save_sag4n_output_to_lh5_roundtrip(tmp_path):
     assert int(misc["n_valid_events"].value) == 2
     assert int(misc["n_simulated_events"].value) == 10000
 
+    # or to any sink
+    sink = sinks.MemorySink()
+    alpha_n.save_sag4n_output_to_lh5(output_data, sink)
+    assert np.all(sink.read("vtx/kin")["n_part"].nda == [2, 0, 1])
+    assert sink.read("misc")["n_valid_events"].value == 2
+    assert sink.read("misc/perf")["n_vertices"].value == 3
+
 
 ### container runtime
 
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import os
+import pickle
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pyg4ometry
+import pytest
+
+from revertex import cache, utils
+
+
+def test_geometry_cache(tmp_path, test_gdml, monkeypatch):
+    geom_cache = cache.GeometryCache(tmp_path / "cache")
+
+    hpges, pos = geom_cache.read_hpges(test_gdml, ["B*"], ("nplus",))
+    assert list(hpges) == ["B99000A"]
+    assert pos["B99000A"] == [-50.0, 0.0, -30.0]
+    assert len(geom_cache.entries()) == 1
+
+    # the next runs do not parse the geometry
+    def _no_parse(*_args, **_kwargs):
+        msg = "the GDML should not be parsed"
+        raise AssertionError(msg)
+
+    with monkeypatch.context() as mp:
+        mp.setattr(pyg4ometry.gdml, "Reader", _no_parse)
+
+        cached, cached_pos = geom_cache.read_hpges(test_gdml, ["B*"])
+        assert cached_pos == pos
+        assert cached["B99000A"].metadata == hpges["B99000A"].metadata
+
+        # with the sampling tables
+        tables = utils.DetectorSamplingCache.get(hpges["B99000A"], "nplus")
+        cached_tables = utils.DetectorSamplingCache.get(cached["B99000A"], "nplus")
+        assert np.array_equal(cached_tables.area_cdf, tables.area_cdf)
+
+        # the other detectors are not in the entry yet
+        with pytest.raises(AssertionError):
+            geom_cache.read_hpges(test_gdml, ["V*"])
+
+    # added to the same entry
+    hpges, pos = geom_cache.read_hpges(test_gdml, ["V*"])
+    assert list(hpges) == ["V99000A"]
+    assert len(geom_cache.entries()) == 1
+
+    # a modified geometry has a new entry
+    modified = tmp_path / "modified.gdml"
+    shutil.copy(test_gdml, modified)
+    with modified.open("a") as f:
+        f.write("<!-- modified -->\n")
+
+    assert geom_cache.key(modified) != geom_cache.key(test_gdml)
+    geom_cache.read_hpges(modified, ["B*"])
+    assert len(geom_cache.entries()) == 2
+
+    # an unreadable entry is replaced
+    geom_cache.path(geom_cache.key(test_gdml)).write_bytes(b"not a pickle")
+    hpges, _ = geom_cache.read_hpges(test_gdml, ["B*"])
+    assert list(hpges) == ["B99000A"]
+
+
+def test_cache_eviction(tmp_path):
+    geom_cache = cache.GeometryCache(tmp_path, max_size=2500)
+
+    # three entries of about 1000 bytes, used in order
+    for idx in range(3):
+        path = geom_cache.path(f"entry{idx}")
+        path.write_bytes(pickle.dumps({"data": b"0" * 950}))
+        os.utime(path, (idx, idx))
+
+    assert 2500 < geom_cache.size() < 3100
+
+    # the least recently used entry is removed
+    geom_cache.evict()
+    assert [p.stem for p in geom_cache.entries()] == ["entry1", "entry2"]
+
+    # reading an entry marks it as used
+    geom_cache._load("entry1")
+    assert [p.stem for p in geom_cache.entries()] == ["entry2", "entry1"]
+
+    geom_cache.clear()
+    assert geom_cache.entries() == []
+
+
+def test_cache_concurrent_eviction(tmp_path, monkeypatch):
+    geom_cache = cache.GeometryCache(tmp_path)
+    path = geom_cache.path("entry")
+    path.write_bytes(pickle.dumps({"data": 1}))
+
+    # evicted by another run after it was read, it is not recreated
+    def _load_and_evict(f):
+        entry = pickle.loads(f.read())
+        path.unlink()
+        return entry
+
+    with monkeypatch.context() as mp:
+        mp.setattr(cache.pickle, "load", _load_and_evict)
+        assert geom_cache._load("entry") == {"data": 1}
+    assert not path.exists()
+
+    # entries removed while listing the cache are skipped
+    path.write_bytes(pickle.dumps({"data": 1}))
+    vanished = geom_cache.path("vanished")
+    monkeypatch.setattr(Path, "glob", lambda *_: iter([vanished, path]))
+
+    assert geom_cache.entries() == [path]
+    geom_cache.max_size = 0
+    geom_cache.evict()
+    assert not path.exists()
+
+
+def test_cache_unwritable(tmp_path, test_gdml, caplog):
+    # the cache cannot be created under a file, e.g. as in a read-only directory
+    (tmp_path / "file").write_text("")
+    geom_cache = cache.GeometryCache(tmp_path / "file" / "cache")
+
+    # the detectors are still read, without the cache
+    hpges, pos = geom_cache.read_hpges(test_gdml, ["B*"])
+    assert list(hpges) == ["B99000A"]
+    assert pos["B99000A"] == [-50.0, 0.0, -30.0]
+    assert "Could not write the cache entry" in caplog.text
+
+    assert geom_cache._load(geom_cache.key(test_gdml)) is None
+    assert geom_cache.entries() == []
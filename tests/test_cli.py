@@ -1,18 +1,33 @@
 from __future__ import annotations
 
+import argparse
+import subprocess
+import sys
 from pathlib import Path
 
 import lh5
+import numpy as np
+import pytest
 
-from revertex.cli import cli
+from revertex import cli as cli_module
+from revertex import core, profiling, sampling
+from revertex.cli import _parse_memory, cli
+from revertex.generators import musun_gs
 
 
-def test_cli(tmptestdir, test_gdml):
+def test_cli(tmptestdir, test_gdml, cache_dir):
     test_file_dir = Path(__file__).parent
 
     # test cli for betas
     cli(
         [
+            "--max-memory",
+            "1G",
+            "--trace-memory",
+            "--profile",
+            "cprofile",
+            "--profile-chunks",
+            "1",
             "beta-kin",
             "-i",
             f"{test_file_dir}/test_files/beta.csv",
@@ -29,6 +44,46 @@ def test_cli(tmptestdir, test_gdml):
     assert set(kin.fields) == {"px", "py", "pz", "ekin", "time", "g4_pid", "n_part"}
     assert len(kin) == 2000
 
+    perf = lh5.read("misc/perf", f"{tmptestdir}/test_beta.lh5")
+    assert perf["n_vertices"].value == 2000
+    assert perf["peak_memory"].value > 0
+    assert (tmptestdir / "test_beta.prof").is_file()
+
+    # only the positions of the HPGe commands are quasi-random
+    with pytest.raises(SystemExit):
+        cli(
+            [
+                "--qmc",
+                "sobol",
+                "beta-kin",
+                "-i",
+                "b.csv",
+                "-o",
+                "b.lh5",
+                "-n",
+                "10",
+                "-e",
+                "keV",
+            ]
+        )
+
+    # the beta kinematics have no checkpoints, a run would start from scratch
+    with pytest.raises(SystemExit):
+        cli(
+            [
+                "--resume",
+                "beta-kin",
+                "-i",
+                "b.csv",
+                "-o",
+                "b.lh5",
+                "-n",
+                "10",
+                "-e",
+                "keV",
+            ]
+        )
+
     cli(
         [
             "hpge-surf-pos",
@@ -45,13 +100,42 @@ def test_cli(tmptestdir, test_gdml):
         ]
     )
 
+    # the detectors read from the geometry are cached for the next runs
+    assert len(list(cache_dir.glob("*.pkl"))) == 1
+
     pos = lh5.read("vtx/pos", f"{tmptestdir}/test_surf.lh5").view_as("ak")
     assert set(pos.fields) == {"xloc", "yloc", "zloc"}
 
     assert len(pos) == 1000
 
+    # split into several files
+    cli(
+        [
+            "--no-cache",
+            "hpge-surf-pos",
+            "-g",
+            test_gdml,
+            "-t",
+            "nplus",
+            "-d",
+            "B*",
+            "-o",
+            f"{tmptestdir}/test_surf_split.lh5",
+            "-n",
+            "1000",
+            "--events-per-file",
+            "400",
+        ]
+    )
+
+    for idx, n in enumerate([400, 400, 200]):
+        pos = lh5.read("vtx/pos", f"{tmptestdir}/test_surf_split_{idx:03d}.lh5")
+        assert len(pos) == n
+
     cli(
         [
+            "--qmc",
+            "sobol",
             "hpge-shell-pos",
             "-g",
             test_gdml,
@@ -75,6 +159,10 @@ def test_cli(tmptestdir, test_gdml):
 
     cli(
         [
+            "--precision",
+            "float32",
+            "--compression",
+            "lzf",
             "hpge-borehole-pos",
             "-g",
             test_gdml,
@@ -87,7 +175,39 @@ def test_cli(tmptestdir, test_gdml):
         ]
     )
 
-    pos = lh5.read("vtx/pos", f"{tmptestdir}/test_bh.lh5").view_as("ak")
+    pos = lh5.read("vtx/pos", f"{tmptestdir}/test_bh.lh5")
+    assert pos["xloc"].nda.dtype == np.float32
+
+    pos = pos.view_as("ak")
     assert set(pos.fields) == {"xloc", "yloc", "zloc"}
 
     assert len(pos) == 1000
+
+
+def test_parse_memory():
+    assert _parse_memory("1024") == 1024
+    assert _parse_memory("4G") == 4 * 1024**3
+    assert _parse_memory("500MB") == 500 * 1024**2
+    assert _parse_memory("1.5 GiB") == int(1.5 * 1024**3)
+
+    with pytest.raises(argparse.ArgumentTypeError):
+        _parse_memory("lots")
+
+
+def test_cli_imports():
+    # the heavy packages are only imported by the commands
+    code = (
+        "import sys, revertex.cli; "
+        "print(*(m for m in ('numba', 'hist', 'lgdo') if m in sys.modules))"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert out.stdout.strip() == ""
+
+    # the choices of the options are those of the modules
+    assert cli_module._COMPRESSIONS == core.COMPRESSIONS
+    assert cli_module._QMC_ENGINES == sampling.QMC_ENGINES
+    assert cli_module._PROFILERS == profiling.PROFILERS
+    assert tuple(musun_gs.DEFAULT_DIMENSIONS) == cli_module._MUSUN_DIMENSIONS
+    assert cli_module._MUSUN_CONTAINER_IMAGE == musun_gs.DEFAULT_CONTAINER_IMAGE
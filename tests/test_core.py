@@ -2,10 +2,14 @@ from __future__ import annotations
 
 import awkward as ak
 import hist
+import lh5
 import numpy as np
+import pytest
+from conftest import uniform_box
+from lgdo.types import Table
 from scipy import stats
 
-from revertex import core, sampling
+from revertex import core, sampling, sinks
 
 
 def test_hist_sample_one_dim():
@@ -97,6 +101,76 @@ def test_hist_sample_two_dim():
     assert sigma < 5
 
 
+@pytest.mark.parametrize(
+    "probs",
+    [
+        np.full(5, 0.2),
+        np.array([0, 0, 1, 0, 3, 0]),
+        np.r_[1000, np.full(999, 1e-3)],
+        np.random.default_rng(1).exponential(size=1000),
+    ],
+)
+def test_alias_table(probs):
+    prob, alias = sampling._alias_table(probs)
+    k = len(probs)
+
+    # the probability of every bin, drawn directly or as an alias
+    reco = (prob + np.bincount(alias, weights=1 - prob, minlength=k)) / k
+    assert np.allclose(reco, probs / np.sum(probs))
+    assert np.all((prob >= 0) & (prob <= 1))
+
+
+def test_histogram_sampler():
+    rng = np.random.default_rng()
+
+    h = hist.Hist.new.Reg(10, 0, 10).Double().fill([0.1, 0.1])
+    samples = sampling.HistogramSampler(h).sample(1000)
+    assert len(samples) == 1000
+    assert np.all((samples > 0) & (samples < 1))
+
+    # the sampler is reused for several chunks
+    n_tot = 100000
+    n = 10
+    h = hist.Hist.new.Reg(n, 0, 10).Double().fill(rng.exponential(3, size=n_tot))
+    sampler = sampling.HistogramSampler(h)
+    samples = np.concatenate([sampler.sample(n_tot // 4, seed=rng) for _ in range(4)])
+
+    expected, _ = h.to_numpy()
+    observed, _ = np.histogram(samples, bins=h.axes[0].edges)
+    expected *= n_tot / np.sum(expected)
+
+    test_stat = np.sum((observed - expected) ** 2 / expected)
+    p = stats.chi2.sf(test_stat, n - 1)
+    assert stats.norm.ppf(1 - p) < 5
+
+    # 2D
+    h = (
+        hist.Hist.new.Reg(n, 0, 10)
+        .Reg(5, 0, 5)
+        .Double()
+        .fill(rng.exponential(3, size=n_tot), rng.uniform(0, 5, size=n_tot))
+    )
+    sample_x, sample_y = sampling.HistogramSampler(h).sample(n_tot, seed=rng)
+    expected, edges_x, edges_y = h.to_numpy()
+    observed, _, _ = np.histogram2d(sample_x, sample_y, bins=(edges_x, edges_y))
+    expected *= n_tot / np.sum(expected)
+
+    mask = expected > 0
+    test_stat = np.sum((observed - expected)[mask] ** 2 / expected[mask])
+    p = stats.chi2.sf(test_stat, np.sum(mask) - 1)
+    assert stats.norm.ppf(1 - p) < 5
+
+    # the same seed gives the same samples
+    sampler = sampling.HistogramSampler(h)
+    assert np.array_equal(sampler.sample(10, seed=1), sampler.sample(10, seed=1))
+
+    with pytest.raises(TypeError):
+        sampling.HistogramSampler(np.ones(10))
+
+    with pytest.raises(ValueError):
+        sampling.HistogramSampler(hist.Hist.new.Reg(10, 0, 10).Double())
+
+
 def test_convert_pos():
     arr = ak.Array({"xloc": [1, 2, 3], "yloc": [1, 2, 3], "zloc": [1, 2, 3]})
     converted = core.convert_output_pos(arr).view_as("ak")
@@ -105,6 +179,30 @@ def test_convert_pos():
         assert ak.all(converted[f] == arr[f])
 
 
+def test_convert_pos_columnar():
+    pos = np.asfortranarray(np.random.default_rng(1).uniform(size=(100, 3)))
+
+    # the columns of a Fortran order array are used directly
+    converted = core.convert_output_pos(pos)
+    for idx, f in enumerate(["xloc", "yloc", "zloc"]):
+        assert np.shares_memory(converted[f].nda, pos)
+        assert np.all(converted[f].nda == pos[:, idx])
+
+    # so are contiguous columns in a dict
+    cols = {"xloc": pos[:, 0], "yloc": pos[:, 1], "zloc": pos[:, 2]}
+    converted = core.convert_output_pos(cols)
+    assert np.shares_memory(converted["xloc"].nda, pos)
+
+    # C order arrays are copied
+    pos_c = np.ascontiguousarray(pos)
+    converted = core.convert_output_pos(pos_c)
+    assert not np.shares_memory(converted["xloc"].nda, pos_c)
+    assert np.all(converted["yloc"].nda == pos[:, 1])
+
+    with pytest.raises(ValueError):
+        core.convert_output_pos(np.zeros((10, 2)))
+
+
 def test_convert_kin():
     # single particle in each event.
     arr = ak.Array(
@@ -140,6 +238,35 @@ def test_convert_kin():
         assert ak.all(converted[f] == ak.flatten(arr[f]))
     assert ak.all(converted["n_part"] == ak.Array([2, 0, 2, 0, 1]))
 
+    # events without particles.
+    arr = ak.Array(
+        {
+            "px": [[1, 2], [], [3], []],
+            "py": [[1, 2], [], [3], []],
+            "pz": [[1, 2], [], [3], []],
+            "time": [[1, 2], [], [3], []],
+            "ekin": [[1, 2], [], [3], []],
+            "g4_pid": [[11, 11], [], [22], []],
+        }
+    )
+    converted = core.convert_output_kin(arr).view_as("ak")
+    assert ak.all(converted["n_part"] == ak.Array([2, 0, 1]))
+
+    # dict of flat numpy columns.
+    cols = {
+        "px": np.array([1.0, 2.0, 3.0]),
+        "py": np.array([1.0, 2.0, 3.0]),
+        "pz": np.array([1.0, 2.0, 3.0]),
+        "time": np.array([1.0, 2.0, 3.0]),
+        "ekin": np.array([1.0, 2.0, 3.0]),
+        "g4_pid": np.array([11, 11, 11]),
+    }
+    converted = core.convert_output_kin(cols)
+
+    assert np.shares_memory(converted["px"].nda, cols["px"])
+    assert np.all(converted["g4_pid"].nda == 11)
+    assert np.all(converted["n_part"].nda == 1)
+
     # multiple particles & positions.
     arr = ak.Array(
         {
@@ -171,3 +298,303 @@ def test_sample_proportional_radius():
 def test_sample_cylinder():
     samples = sampling.sample_cylinder((0, 10), (-1, 11), 100, None)
     assert samples.shape == (100, 3)
+
+    # the same samples as the direct computation
+    rng = np.random.default_rng(1)
+    r = np.sqrt(rng.uniform(4, 100, size=100))
+    z = rng.uniform(-1, 11, size=100)
+    phi = rng.uniform(0, 2 * np.pi, size=100)
+    expected = np.column_stack((r * np.cos(phi), r * np.sin(phi), z))
+
+    samples = sampling.sample_cylinder((2, 10), (-1, 11), 100, seed=1)
+    assert np.array_equal(samples, expected)
+    assert samples.flags.f_contiguous
+
+    # in place, in any memory layout
+    for order in "CF":
+        out = np.zeros((100, 3), order=order)
+        rng = np.random.default_rng(1)
+        assert sampling.sample_cylinder((2, 10), (-1, 11), 100, rng, out=out) is out
+        assert np.array_equal(out, expected)
+
+    samples = sampling.sample_cylinder((2, 10), (-1, 11), 100, 1, dtype=np.float32)
+    assert samples.dtype == np.float32
+    assert np.all(np.hypot(samples[:, 0], samples[:, 1]) <= 10 + 1e-5)
+
+    with pytest.raises(ValueError):
+        sampling.sample_cylinder((2, 10), (-1, 11), 100, 1, out=np.empty((10, 3)))
+
+
+def test_quasi_random():
+    n = 2**14
+
+    # the fraction of a cylinder in a region, estimated with quasi-random and
+    # random points
+    errors = {}
+    for engine in [*sampling.QMC_ENGINES, None]:
+        errors[engine] = []
+        for seed in range(5):
+            rng = sampling.QuasiRandom(engine, seed) if engine else seed
+            points = sampling.sample_cylinder((0, 40), (0, 80), n, rng)
+            errors[engine].append(np.mean((points[:, 0] > 10) & (points[:, 2] < 30)))
+
+        assert np.all(points[:, 2] >= 0)
+        assert np.all(points[:, 2] < 80)
+
+    for engine in sampling.QMC_ENGINES:
+        assert np.std(errors[engine]) < np.std(errors[None]) / 5
+
+    # the successive calls continue the sequence
+    rng = sampling.QuasiRandom("sobol", 1)
+    first, second = rng.points(8, 2), rng.points(8, 2)
+    assert not np.any(np.isin(first, second))
+    assert np.array_equal(
+        np.vstack([first, second]), sampling.QuasiRandom("sobol", 1).points(16, 2)
+    )
+
+    # spawned sequences are scrambled differently
+    children = rng.spawn(2)
+    assert not np.array_equal(children[0].points(8, 2), children[1].points(8, 2))
+
+    # the choice is in proportion to the probabilities, up to the discrepancy
+    p = np.array([0.5, 0.3, 0.2])
+    index = sampling.choice(sampling.QuasiRandom("sobol", 1), np.arange(3), 1024, p=p)
+    assert np.allclose(np.bincount(index) / 1024, p, atol=2 / 1024)
+
+    samples = sampling.sample_proportional_radius(
+        np.zeros(n), np.full(n, 10), size=n, seed=sampling.QuasiRandom("halton", 1)
+    )
+    # P(r) ~ r, so the mean is 2/3
+    assert abs(np.mean(samples) - 2 / 3) < 1e-3
+
+    with pytest.raises(ValueError):
+        sampling.QuasiRandom("lattice")
+
+
+def _qmc_cylinder(size, seed=None):
+    return sampling.sample_cylinder((0, 1), (0, 1), size, seed)
+
+
+def test_write_remage_vtx_qmc(tmptestdir):
+    for workers in [1, 2]:
+        core.write_remage_vtx(
+            1050,
+            f"{tmptestdir}/vtx_qmc_{workers}.lh5",
+            seed=42,
+            generator=_qmc_cylinder,
+            workers=workers,
+            chunk_size=100,
+            qmc="sobol",
+        )
+
+    serial = lh5.read("vtx/pos", f"{tmptestdir}/vtx_qmc_1.lh5").view_as("ak")
+    parallel = lh5.read("vtx/pos", f"{tmptestdir}/vtx_qmc_2.lh5").view_as("ak")
+    assert len(serial) == 1050
+    assert ak.all(serial.zloc == parallel.zloc)
+
+    # every chunk is a separately scrambled sequence
+    chunks = list(
+        core.iter_vertices(
+            _qmc_cylinder, 200, seed=42, chunk_size=100, output="numpy", qmc="sobol"
+        )
+    )
+    assert np.array_equal(chunks[0][:, 2], serial.zloc[:100].to_numpy())
+    assert not np.any(np.isin(chunks[0], chunks[1]))
+
+    # the random vertices are not resumed as quasi-random ones
+    with pytest.raises(ValueError):
+        core.write_remage_vtx(
+            1050,
+            f"{tmptestdir}/vtx_qmc_1.lh5",
+            seed=42,
+            generator=_qmc_cylinder,
+            chunk_size=100,
+            resume=True,
+        )
+
+
+def test_write_remage_vtx_workers(tmptestdir):
+    for workers in [1, 2]:
+        core.write_remage_vtx(
+            1050,
+            f"{tmptestdir}/vtx_{workers}.lh5",
+            seed=42,
+            generator=uniform_box,
+            workers=workers,
+            chunk_size=100,
+            length=10,
+        )
+
+    serial = lh5.read("vtx/pos", f"{tmptestdir}/vtx_1.lh5").view_as("ak")
+    parallel = lh5.read("vtx/pos", f"{tmptestdir}/vtx_2.lh5").view_as("ak")
+
+    assert len(serial) == 1050
+    for field in ["xloc", "yloc", "zloc"]:
+        assert ak.all(serial[field] == parallel[field])
+
+
+def test_perf_metrics(tmptestdir):
+    core.write_remage_vtx(
+        1050,
+        f"{tmptestdir}/vtx_perf.lh5",
+        seed=42,
+        generator=uniform_box,
+        chunk_size=100,
+        trace_memory=True,
+        length=10,
+    )
+    perf = lh5.read("misc/perf", f"{tmptestdir}/vtx_perf.lh5")
+
+    assert perf["n_chunks"].value == 11
+    assert perf["n_vertices"].value == 1050
+    assert perf["total_time"].attrs["units"] == "s"
+    assert np.all(perf["chunk_n_vertices"].nda == [100] * 10 + [50])
+    for stage in core.PerfMetrics.STAGES:
+        assert np.all(perf[f"chunk_{stage}_time"].nda >= 0)
+        assert perf[f"{stage}_time"].value <= perf["total_time"].value
+    assert np.all(perf["chunk_peak_memory"].nda > 0)
+
+    # the metrics of part of the chunks
+    metrics = core.PerfMetrics()
+    with metrics:
+        for n in [10, 20, 30]:
+            metrics.lap("generate")
+            metrics.end_chunk(n)
+    summary = metrics.summary(first=1)
+    assert summary["n_vertices"].value == 50
+    assert "peak_memory" not in summary
+
+
+def test_iter_vertices(tmptestdir):
+    chunks = core.iter_vertices(uniform_box, 1050, seed=42, chunk_size=100, length=10)
+    chunks = list(chunks)
+
+    assert len(chunks) == 11
+    assert all(isinstance(chunk, Table) for chunk in chunks)
+    assert len(chunks[-1]) == 50
+
+    # the same vertices as written to file
+    core.write_remage_vtx(
+        1050,
+        f"{tmptestdir}/vtx_iter.lh5",
+        seed=42,
+        generator=uniform_box,
+        chunk_size=100,
+        length=10,
+    )
+    pos = lh5.read("vtx/pos", f"{tmptestdir}/vtx_iter.lh5")
+    assert np.all(np.concatenate([c["xloc"].nda for c in chunks]) == pos["xloc"].nda)
+
+    arrays = core.iter_vertices(
+        uniform_box, 1050, seed=42, chunk_size=100, output="numpy", length=10
+    )
+    first = next(arrays)
+    assert first.shape == (100, 3)
+    assert np.all(first[:, 1] == chunks[0]["yloc"].nda)
+
+    with pytest.raises(ValueError):
+        next(core.iter_vertices(uniform_box, 10, output="ak", length=10))
+
+    # the seed can also be a seed sequence, or None for fresh entropy
+    chunks_seq = core.iter_vertices(
+        uniform_box,
+        1050,
+        seed=np.random.SeedSequence(42),
+        chunk_size=100,
+        output="numpy",
+        length=10,
+    )
+    assert np.array_equal(next(chunks_seq), first)
+    assert len(next(core.iter_vertices(uniform_box, 10, length=10))) == 10
+
+
+def test_get_shards():
+    assert core.get_shards(10, n_files=3) == [4, 3, 3]
+    assert core.get_shards(10, events_per_file=4) == [4, 4, 2]
+
+    with pytest.raises(ValueError):
+        core.get_shards(10)
+    with pytest.raises(ValueError):
+        core.get_shards(2, n_files=3)
+
+    files = core.get_shard_files("dir/out.lh5", 2)
+    assert [str(f) for f in files] == ["dir/out_000.lh5", "dir/out_001.lh5"]
+    assert core.get_shard_files("out.lh5", 1001)[-1].name == "out_1000.lh5"
+
+
+def test_write_remage_vtx_shards(tmptestdir):
+    for name in ["a", "b"]:
+        core.write_remage_vtx(
+            1000,
+            f"{tmptestdir}/shards_{name}/vtx.lh5",
+            seed=42,
+            generator=uniform_box,
+            chunk_size=100,
+            n_files=3,
+            length=10,
+        )
+
+    first = None
+    for idx, n in enumerate([334, 333, 333]):
+        pos_a = lh5.read("vtx/pos", f"{tmptestdir}/shards_a/vtx_{idx:03d}.lh5")
+        pos_b = lh5.read("vtx/pos", f"{tmptestdir}/shards_b/vtx_{idx:03d}.lh5")
+
+        assert len(pos_a) == n
+        assert np.all(pos_a["xloc"].nda == pos_b["xloc"].nda)
+
+        # every file has its own random stream
+        if first is None:
+            first = pos_a["xloc"].nda
+        else:
+            assert not np.any(first[:n] == pos_a["xloc"].nda)
+
+
+def test_spawn_seeds():
+    # reproducible for a given seed
+    first = [s.generate_state(4) for s in sampling.spawn_seeds(42, 3)]
+    second = [s.generate_state(4) for s in sampling.spawn_seeds(42, 3)]
+    assert all(np.all(a == b) for a, b in zip(first, second, strict=True))
+
+    # but every stream is different
+    assert not np.all(first[0] == first[1])
+
+    rngs = sampling.spawn_rngs(np.random.default_rng(42), 2)
+    assert rngs[0].uniform() != rngs[1].uniform()
+
+
+def test_get_chunk_size(tmptestdir):
+    assert core.get_chunk_size(100, max_memory=10**9) == 10_000_000
+
+    # never below the minimum chunk size
+    assert core.get_chunk_size(100, max_memory=1000) == core._MIN_CHUNK_SIZE
+
+    # budget from the available memory
+    assert core.get_chunk_size(100) >= core._MIN_CHUNK_SIZE
+
+    # a budget of ~2 chunks
+    core.write_remage_vtx(
+        30_000,
+        f"{tmptestdir}/vtx_auto.lh5",
+        seed=1,
+        generator=uniform_box,
+        max_memory=20_000 * (100 + 5 * core._BYTES_PER_OUTPUT_VERTEX),
+        length=10,
+    )
+    pos = lh5.read("vtx/pos", f"{tmptestdir}/vtx_auto.lh5").view_as("ak")
+    assert len(pos) == 30_000
+
+    # one chunk being generated, one being written and three waiting
+    checkpoint = sinks.LH5Sink(f"{tmptestdir}/vtx_auto.lh5").read_checkpoint()
+    assert checkpoint["chunk_size"] == 20_000
+
+    # an explicit chunk size is not silently replaced
+    with pytest.raises(ValueError, match="max_memory"):
+        core.write_remage_vtx(
+            1000,
+            f"{tmptestdir}/vtx_both.lh5",
+            seed=1,
+            generator=uniform_box,
+            chunk_size=100,
+            max_memory=10**9,
+            length=10,
+        )
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import numpy as np
+import pygeomhpges
+import pytest
+from scipy import stats
+
+from revertex import kernels, sampling
+from revertex.generators import surface
+
+pytestmark = pytest.mark.skipif(not kernels.HAS_NUMBA, reason="numba is not installed")
+
+N = 100_000
+
+
+def _both_backends(monkeypatch, func, *args, **kwargs):
+    samples = []
+    for enabled in [False, True]:
+        monkeypatch.setattr(kernels, "ENABLED", enabled)
+        samples.append(func(*args, **kwargs))
+    return samples
+
+
+def _assert_same_distribution(numpy, jit):
+    # independent samples of the two backends follow the same distribution
+    assert stats.ks_2samp(numpy, jit).pvalue > 1e-4
+
+
+def test_cylinder(monkeypatch):
+    numpy, jit = _both_backends(
+        monkeypatch, sampling.sample_cylinder, (10, 40), (0, 80), N, seed=1
+    )
+
+    # the same random numbers, so the same points up to rounding
+    assert np.allclose(numpy, jit)
+    assert jit.flags.f_contiguous
+
+    numpy_2, _ = _both_backends(
+        monkeypatch, sampling.sample_cylinder, (10, 40), (0, 80), N, seed=2
+    )
+    for idx in range(3):
+        _assert_same_distribution(numpy_2[:, idx], jit[:, idx])
+
+    # in place, in a smaller type
+    numpy, jit = _both_backends(
+        monkeypatch,
+        sampling.sample_cylinder,
+        (10, 40),
+        (0, 80),
+        N,
+        seed=1,
+        dtype=np.float32,
+    )
+    assert jit.dtype == np.float32
+    assert np.allclose(numpy, jit, rtol=1e-5, atol=1e-4)
+
+
+def test_proportional_radius(monkeypatch):
+    # not the seed of the samples, which would be correlated with the radii
+    rng = np.random.default_rng(10)
+    r0, r1 = rng.uniform(0, 40, size=N), rng.uniform(0, 40, size=N)
+    r1[:100] = r0[:100]
+
+    numpy, jit = _both_backends(
+        monkeypatch, sampling.sample_proportional_radius, r0, r1, size=N, seed=1
+    )
+    assert np.allclose(numpy, jit)
+
+    numpy_2, _ = _both_backends(
+        monkeypatch, sampling.sample_proportional_radius, r0, r1, size=N, seed=2
+    )
+    _assert_same_distribution(numpy_2, jit)
+
+
+def test_surface(monkeypatch, test_data_configs):
+    hpge = pygeomhpges.make_hpge(test_data_configs + "/V99000A.yaml", registry=None)
+
+    numpy, jit = _both_backends(
+        monkeypatch, surface._sample_hpge_surface_impl, N, hpge, "nplus", seed=1
+    )
+    assert np.allclose(numpy, jit)
+
+    numpy_2, _ = _both_backends(
+        monkeypatch, surface._sample_hpge_surface_impl, N, hpge, "nplus", seed=2
+    )
+    for idx in range(3):
+        _assert_same_distribution(numpy_2[:, idx], jit[:, idx])
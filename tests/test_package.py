@@ -1,9 +1,44 @@
 from __future__ import annotations
 
 import importlib.metadata
+import subprocess
+import sys
+
+import pytest
 
 import revertex as m
 
 
 def test_package():
     assert importlib.metadata.version("revertex") == m.__version__
+
+
+# slow to import, and only needed by the commands reading a geometry
+_GEOMETRY_MODULES = ["pyg4ometry", "pygeomhpges", "pygeomtools"]
+
+
+def _imported_modules(code: str) -> set[str]:
+    # in a fresh interpreter, as the tests import everything
+    out = subprocess.run(
+        [sys.executable, "-c", f"{code}; import sys; print(*sys.modules)"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return set(out.stdout.split())
+
+
+def test_lazy_imports():
+    modules = _imported_modules("import revertex")
+    assert "revertex.core" not in modules
+    assert "revertex.utils" not in modules
+
+    modules = _imported_modules("import revertex.cli")
+    for name in _GEOMETRY_MODULES:
+        assert name not in modules
+
+    # the submodules are still available as attributes
+    modules = _imported_modules("import revertex; revertex.sampling")
+    assert "revertex.sampling" in modules
+    with pytest.raises(AttributeError):
+        _ = m.not_a_module
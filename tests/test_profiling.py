@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import pstats
+import tracemalloc
+
+import pytest
+from conftest import uniform_box
+
+from revertex import core, profiling
+
+
+def test_get_profile_file():
+    assert profiling.get_profile_file("out/vtx.lh5", "cprofile").name == "vtx.prof"
+    assert (
+        profiling.get_profile_file("vtx.lh5", "tracemalloc").name == "vtx.tracemalloc"
+    )
+
+
+@pytest.mark.parametrize("kind", profiling.PROFILERS)
+def test_profiler(tmptestdir, kind):
+    out_file = tmptestdir / f"vtx_{kind}.lh5"
+
+    with profiling.Profiler(kind, out_file, n_chunks=2) as profiler:
+        core.write_remage_vtx(
+            1050, out_file, seed=1, generator=uniform_box, chunk_size=100, length=10
+        )
+
+        # stopped after the first 2 chunks
+        assert not profiler.running
+        assert core.CHUNK_CALLBACKS == []
+
+    assert profiler.path == profiling.get_profile_file(out_file, kind)
+    if kind == "cprofile":
+        stats = pstats.Stats(str(profiler.path))
+        assert any(func[2] == "uniform_box" for func in stats.stats)
+    else:
+        snapshot = tracemalloc.Snapshot.load(str(profiler.path))
+        assert len(snapshot.traces) > 0
+        assert not tracemalloc.is_tracing()
+
+    with pytest.raises(ValueError):
+        profiling.Profiler("perf", out_file)
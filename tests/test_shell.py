@@ -8,6 +8,7 @@ from revertex.generators.shell import (
     _sample_hpge_shell_impl,
     sample_hpge_shell,
 )
+from revertex.sampling import QuasiRandom
 
 
 def test_shell_gen(test_data_configs):
@@ -41,3 +42,17 @@ def test_many_shell_gen(test_data_configs):
     )
 
     assert np.shape(coords) == (1000, 3)
+
+
+def test_shell_gen_qmc(test_data_configs):
+    hpge = pygeomhpges.make_hpge(test_data_configs + "/V99000A.yaml", registry=None)
+
+    # several rounds of rejection sampling, continuing the same sequence
+    coords = _sample_hpge_shell_impl(
+        1000, hpge, surface_type=None, distance=1, seed=QuasiRandom("sobol", 1)
+    )
+    assert np.shape(coords) == (1000, 3)
+    assert len(np.unique(coords, axis=0)) == 1000
+
+    distances = hpge.distance_to_surface(coords, signed=True)
+    assert np.all((distances < 0) & (distances > -1))
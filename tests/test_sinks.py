@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import awkward as ak
+import h5py
+import lh5
+import numpy as np
+import pytest
+from conftest import uniform_box
+
+from revertex import core, sinks
+from revertex.generators import beta
+
+# number of chunks generated by _interrupted_box before it fails
+_N_CHUNKS_BEFORE_FAILURE = {"n": None}
+
+
+def _interrupted_box(size, seed=None, *, length):
+    if _N_CHUNKS_BEFORE_FAILURE["n"] == 0:
+        msg = "interrupted"
+        raise KeyboardInterrupt(msg)
+    if _N_CHUNKS_BEFORE_FAILURE["n"] is not None:
+        _N_CHUNKS_BEFORE_FAILURE["n"] -= 1
+    return uniform_box(size, seed, length=length)
+
+
+def test_background_writer(tmptestdir):
+    arr = ak.Array({"xloc": [1, 2, 3], "yloc": [1, 2, 3], "zloc": [1, 2, 3]})
+
+    with sinks.BackgroundWriter(f"{tmptestdir}/writer.lh5", maxsize=1) as writer:
+        for _ in range(5):
+            writer.write(core.convert_output_pos(arr), "vtx/pos")
+
+    assert writer.n_written == 5
+    assert writer.write_time > 0
+
+    pos = lh5.read("vtx/pos", f"{tmptestdir}/writer.lh5").view_as("ak")
+    assert len(pos) == 15
+
+    # errors in the writer thread are raised in the caller
+    with (
+        pytest.raises(RuntimeError),
+        sinks.BackgroundWriter(f"{tmptestdir}/writer_bad.lh5") as writer,
+    ):
+        writer.write("not an lgdo", "vtx/pos")
+
+
+def test_background_writer_presized(tmptestdir):
+    out_file = f"{tmptestdir}/writer_presized.lh5"
+    pos = np.asfortranarray(np.arange(30, dtype=float).reshape(10, 3))
+
+    # chunks written out of order land in their slice of rows
+    with sinks.BackgroundWriter(out_file, n_rows=10, chunk_rows=4) as writer:
+        writer.write(core.convert_output_pos(pos[6:]), "vtx/pos", start_row=6)
+        writer.write(core.convert_output_pos(pos[:6]), "vtx/pos", start_row=0)
+
+    with h5py.File(out_file) as f:
+        assert f["vtx/pos/xloc"].shape == (10,)
+        assert f["vtx/pos/xloc"].chunks == (4,)
+
+    out = lh5.read("vtx/pos", out_file)
+    assert out["xloc"].attrs["units"] == "mm"
+    assert np.all(out["xloc"].nda == pos[:, 0])
+    assert np.all(out["zloc"].nda == pos[:, 2])
+
+    # the datasets are shrunk if fewer rows are written
+    with sinks.BackgroundWriter(out_file, n_rows=20) as writer:
+        writer.write(core.convert_output_pos(pos), "vtx/pos")
+
+    assert len(lh5.read("vtx/pos", out_file)) == 10
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip", "lzf", "zstd"])
+def test_write_compressed(tmptestdir, compression):
+    out_file = f"{tmptestdir}/writer_{compression}.lh5"
+    pos = np.random.default_rng(1).uniform(size=(1000, 3))
+
+    # chunks not aligned with the HDF5 chunks
+    with sinks.BackgroundWriter(out_file, n_rows=1000, chunk_rows=64) as writer:
+        for start in range(0, 1000, 300):
+            chunk = core.convert_output_pos(
+                pos[start : start + 300],
+                precision="float32",
+                compression=compression,
+            )
+            writer.write(chunk, "vtx/pos")
+
+    with h5py.File(out_file) as f:
+        dset = f["vtx/pos/xloc"]
+        assert dset.dtype == np.float32
+        if compression == "none":
+            assert dset.compression is None
+
+    out = lh5.read("vtx/pos", out_file)
+    assert "hdf5_settings" not in out["xloc"].attrs
+    assert np.all(out["xloc"].nda == pos[:, 0].astype(np.float32))
+    assert np.all(out["zloc"].nda == pos[:, 2].astype(np.float32))
+
+    with pytest.raises(ValueError):
+        core.hdf5_settings("bzip2")
+
+
+def test_numpy_sink(tmptestdir):
+    sink = sinks.NumpySink(f"{tmptestdir}/vtx_npy")
+    core.write_remage_vtx(
+        1050, sink, seed=42, generator=uniform_box, chunk_size=100, length=10
+    )
+    core.write_remage_vtx(
+        1050,
+        f"{tmptestdir}/vtx_npy.lh5",
+        seed=42,
+        generator=uniform_box,
+        chunk_size=100,
+        length=10,
+    )
+    pos = lh5.read("vtx/pos", f"{tmptestdir}/vtx_npy.lh5")
+
+    for field in ["xloc", "yloc", "zloc"]:
+        col = np.load(f"{tmptestdir}/vtx_npy/vtx/pos/{field}.npy", mmap_mode="r")
+        assert isinstance(col, np.memmap)
+        assert np.all(col == pos[field].nda)
+
+    with Path(f"{tmptestdir}/vtx_npy/attrs.json").open() as f:
+        attrs = json.load(f)
+    assert attrs["vtx/pos/xloc"]["units"] == "mm"
+
+    # the number of rows must be known
+    with pytest.raises(ValueError):
+        sinks.NumpySink(f"{tmptestdir}/vtx_npy_bad").open()
+
+    # the files are shrunk if fewer rows are written
+    pos = np.random.default_rng(1).uniform(size=(10, 3))
+    with sinks.NumpySink(f"{tmptestdir}/vtx_npy_short").open(n_rows=20) as sink:
+        sink.write(core.convert_output_pos(pos), "vtx/pos")
+
+    col = np.load(f"{tmptestdir}/vtx_npy_short/vtx/pos/yloc.npy")
+    assert np.all(col == pos[:, 1])
+
+
+def test_memory_sink():
+    sink = sinks.MemorySink()
+    core.write_remage_vtx(
+        1050, sink, seed=42, generator=uniform_box, chunk_size=100, length=10
+    )
+
+    pos = sink.read("vtx/pos")
+    assert len(pos) == 1050
+    assert pos["xloc"].attrs["units"] == "mm"
+
+    chunks = core.iter_vertices(uniform_box, 1050, seed=42, chunk_size=100, length=10)
+    assert np.all(pos["xloc"].nda == np.concatenate([c["xloc"].nda for c in chunks]))
+
+    # chunks written out of order
+    sink = sinks.MemorySink()
+    arr = np.arange(30, dtype=float).reshape(10, 3)
+    sink.write(core.convert_output_pos(arr[5:]), "vtx/pos", start_row=5)
+    sink.write(core.convert_output_pos(arr[:5]), "vtx/pos", start_row=0)
+    assert np.all(sink.read("vtx/pos")["zloc"].nda == arr[:, 2])
+
+    # a split output needs a path
+    with pytest.raises(ValueError):
+        core.write_remage_vtx(
+            10, sink, seed=1, generator=uniform_box, n_files=2, length=10
+        )
+
+    # other entry points accept sinks too
+    sink = sinks.MemorySink()
+    beta_file = Path(__file__).parent / "test_files/beta.csv"
+    beta.save_beta_spectrum(100, str(beta_file), sink, seed=1)
+    kin = sink.read("vtx/kin").view_as("ak")
+    assert len(kin) == 100
+    assert ak.all(kin["n_part"] == 1)
+
+
+def _read_pos(sink):
+    if isinstance(sink, sinks.MemorySink):
+        return sink.read("vtx/pos")["xloc"].nda
+    if isinstance(sink, sinks.NumpySink):
+        return np.load(sink.path / "vtx/pos/xloc.npy")
+    return lh5.read("vtx/pos", sink.path)["xloc"].nda
+
+
+@pytest.mark.parametrize("kind", ["lh5", "numpy", "memory"])
+def test_resume(tmptestdir, kind, monkeypatch):
+    def make_sink(name):
+        if kind == "lh5":
+            return sinks.LH5Sink(f"{tmptestdir}/{name}.lh5")
+        if kind == "numpy":
+            return sinks.NumpySink(f"{tmptestdir}/{name}_npy")
+        return sinks.MemorySink()
+
+    kwargs = {"generator": _interrupted_box, "chunk_size": 100, "length": 10}
+
+    full = make_sink("resume_full")
+    core.write_remage_vtx(1050, full, seed=42, **kwargs)
+    assert full.read_checkpoint()["n_chunks_done"] == 11
+
+    # stop after 4 chunks
+    sink = make_sink("resume")
+    monkeypatch.setitem(_N_CHUNKS_BEFORE_FAILURE, "n", 4)
+    with pytest.raises(KeyboardInterrupt):
+        core.write_remage_vtx(1050, sink, seed=42, **kwargs)
+
+    checkpoint = sink.read_checkpoint()
+    assert checkpoint["n_chunks_done"] == 4
+    assert checkpoint["n_rows_done"] == 400
+    assert checkpoint["chunk_size"] == 100
+
+    # a different configuration cannot be resumed
+    with pytest.raises(ValueError):
+        core.write_remage_vtx(
+            1050, sink, seed=42, resume=True, **{**kwargs, "length": 5}
+        )
+    with pytest.raises(ValueError):
+        core.write_remage_vtx(1050, sink, seed=43, resume=True, **kwargs)
+
+    # only the remaining 7 chunks are generated, the seed is taken from the checkpoint
+    monkeypatch.setitem(_N_CHUNKS_BEFORE_FAILURE, "n", 7)
+    core.write_remage_vtx(1050, sink, seed=None, resume=True, **kwargs)
+    assert sink.read_checkpoint()["n_chunks_done"] == 11
+
+    assert len(_read_pos(sink)) == 1050
+    assert np.all(_read_pos(sink) == _read_pos(full))
+
+    # nothing left to do
+    monkeypatch.setitem(_N_CHUNKS_BEFORE_FAILURE, "n", 0)
+    core.write_remage_vtx(1050, sink, seed=42, resume=True, **kwargs)
+
+
+def test_resume_shards(tmptestdir, monkeypatch):
+    kwargs = {
+        "generator": _interrupted_box,
+        "chunk_size": 100,
+        "n_files": 3,
+        "length": 10,
+    }
+    core.write_remage_vtx(1000, f"{tmptestdir}/shards_full.lh5", seed=42, **kwargs)
+
+    # stop in the middle of the second file
+    monkeypatch.setitem(_N_CHUNKS_BEFORE_FAILURE, "n", 6)
+    with pytest.raises(KeyboardInterrupt):
+        core.write_remage_vtx(1000, f"{tmptestdir}/shards.lh5", seed=42, **kwargs)
+
+    monkeypatch.setitem(_N_CHUNKS_BEFORE_FAILURE, "n", 6)
+    core.write_remage_vtx(
+        1000, f"{tmptestdir}/shards.lh5", seed=42, resume=True, **kwargs
+    )
+
+    for idx in range(3):
+        pos = lh5.read("vtx/pos", f"{tmptestdir}/shards_{idx:03d}.lh5")
+        full = lh5.read("vtx/pos", f"{tmptestdir}/shards_full_{idx:03d}.lh5")
+        assert np.all(pos["xloc"].nda == full["xloc"].nda)
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import numpy as np
 import pygeomhpges
+import pytest
 from pyg4ometry import geant4
 
 from revertex.generators.surface import (
@@ -49,3 +50,49 @@ def test_many_surface_gen(test_data_configs):
     coords = sample_hpge_surface(1000, seed=None, hpges=hpge_IC, positions=[0, 0, 0])
 
     assert np.shape(coords) == (1000, 3)
+
+
+def test_many_surface_gen_without_surfaces(test_data_configs):
+    hpge_IC = pygeomhpges.make_hpge(test_data_configs + "/V99000A.yaml", registry=None)
+    hpge_BG = pygeomhpges.make_hpge(test_data_configs + "/B99000A.yaml", registry=None)
+
+    # a detector without passive surfaces gets no vertices on them
+    hpge_BG.surfaces = ["nplus" if s == "passive" else s for s in hpge_BG.surfaces]
+    hpges = {"V99000A": hpge_IC, "B99000A": hpge_BG}
+
+    coords = sample_hpge_surface(
+        1000,
+        seed=1,
+        hpges=hpges,
+        positions={"V99000A": [0, 0, 0], "B99000A": [1000, 0, 0]},
+        surface_type="passive",
+    )
+    assert np.shape(coords) == (1000, 3)
+    assert np.all(coords[:, 0] < 500)
+
+    # but they cannot be sampled on it alone
+    with pytest.raises(ValueError, match="surface of type"):
+        sample_hpge_surface(
+            10,
+            seed=1,
+            hpges={"B99000A": hpge_BG},
+            positions={"B99000A": [0, 0, 0]},
+            surface_type="passive",
+        )
+    with pytest.raises(ValueError, match="surface of type"):
+        sample_hpge_surface(
+            10, seed=1, hpges=hpge_BG, positions=[0, 0, 0], surface_type="passive"
+        )
+
+
+def test_surface_gen_seed(test_data_configs):
+    hpge = pygeomhpges.make_hpge(test_data_configs + "/V99000A.yaml", registry=None)
+    hpges = {"V99000A": hpge, "V99000A_copy": hpge}
+    positions = {"V99000A": [0, 0, 0], "V99000A_copy": [0, 0, 0]}
+
+    coords = sample_hpge_surface(1000, seed=7, hpges=hpges, positions=positions)
+    coords_again = sample_hpge_surface(1000, seed=7, hpges=hpges, positions=positions)
+    assert np.all(coords == coords_again)
+
+    coords_other = sample_hpge_surface(1000, seed=8, hpges=hpges, positions=positions)
+    assert not np.all(coords == coords_other)
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
+import pickle
 from pathlib import Path
 
 import numpy as np
 import pyg4ometry
 import pygeomhpges
+import pytest
 from pyg4ometry import geant4
 
 from revertex import utils
@@ -60,6 +62,71 @@ def test_position():
     assert utils._get_position("V99000A", reg) == [50.0, 0.0, -30.0]
 
 
+def _rotated_registry(n_mothers=1):
+    reg = geant4.Registry()
+
+    world_s = geant4.solid.Orb("world_s", 1000, registry=reg)
+    world_l = geant4.LogicalVolume(world_s, "G4_Galactic", "world_l", registry=reg)
+    reg.setWorld(world_l)
+
+    mother_s = geant4.solid.Box("mother_s", 100, 100, 100, registry=reg)
+    mother_l = geant4.LogicalVolume(mother_s, "G4_lAr", "mother_l", registry=reg)
+    for idx in range(n_mothers):
+        # the frame is rotated by 90 deg around z
+        geant4.PhysicalVolume(
+            [0, 0, np.pi / 2],
+            [100, 200 * idx, 0],
+            mother_l,
+            f"mother_{idx}",
+            world_l,
+            registry=reg,
+        )
+
+    child_s = geant4.solid.Box("child_s", 10, 10, 10, registry=reg)
+    child_l = geant4.LogicalVolume(child_s, "G4_Ge", "child_l", registry=reg)
+    geant4.PhysicalVolume(
+        [0, 0, 0], [10, 0, 5], child_l, "child", mother_l, registry=reg
+    )
+
+    return reg
+
+
+def test_global_transforms():
+    reg = _rotated_registry()
+
+    index = utils.get_placement_index(reg)
+    assert [pv.name for pv in index["child"]] == ["mother_0"]
+    assert index["mother_0"] == []
+
+    transforms = utils.get_global_transforms(reg, ["child", "mother_0"], index)
+
+    # the volume is rotated by -90 deg (the inverse of the frame), as in Geant4
+    rotation = np.array([[0, 1, 0], [-1, 0, 0], [0, 0, 1]])
+    assert np.allclose(transforms["mother_0"][:3, :3], rotation)
+    assert np.allclose(transforms["child"][:3, :3], rotation)
+    assert np.allclose(transforms["child"][:3, 3], [100, -10, 5])
+    assert utils._get_position("child", reg) == pytest.approx([100, -10, 5])
+
+    # every mother is placed twice
+    with pytest.raises(RuntimeError):
+        utils.get_global_transforms(_rotated_registry(2), ["child"])
+
+
+def test_to_global():
+    local = np.random.default_rng(1).uniform(-10, 10, size=(100, 3))
+
+    # a translation
+    assert np.allclose(utils.to_global(local, [1, 2, 3]), local + np.array([1, 2, 3]))
+
+    transform = utils.get_global_transforms(_rotated_registry(), ["child"])["child"]
+    expected = (transform @ np.column_stack([local, np.ones(100)]).T).T[:, :3]
+    assert np.allclose(utils.to_global(local, transform), expected)
+
+    out = np.empty((100, 3), order="F")
+    utils.to_global(local, transform, out=out)
+    assert np.allclose(out, expected)
+
+
 def test_borehole(test_data_configs):
     reg = geant4.Registry()
     hpge_IC = pygeomhpges.make_hpge(test_data_configs + "/V99000A.yaml", registry=reg)
@@ -67,6 +134,18 @@ def test_borehole(test_data_configs):
     borehole_vol = utils.get_borehole_volume(hpge_IC)
     assert isinstance(borehole_vol, float)
 
+    # a cylinder of radius 5 mm between 25 and 80 mm
+    assert borehole_vol == pytest.approx(np.pi * 5**2 * 55)
+
+    # the Monte Carlo estimate agrees, with a relative error of about 3%
+    mc_vol = utils.get_borehole_volume(hpge_IC, size=100_000)
+    assert mc_vol == pytest.approx(borehole_vol, rel=0.2)
+
+    # a cone, by Pappus' theorem
+    assert utils._revolution_volume((0, 3, 0), (0, 0, 4)) == pytest.approx(
+        np.pi * 3**2 * 4 / 3
+    )
+
     assert utils.get_borehole_weights({"V99000A": hpge_IC})[0] == 1.0
 
 
@@ -113,3 +192,47 @@ def test_collect_isotopes_resolves_string_component_names():
 
     assert 25055 in isotopes
     assert np.isclose(sum(isotopes.values()), 1.0)
+
+
+def test_detector_sampling_cache(test_data_configs):
+    hpge_IC = pygeomhpges.make_hpge(test_data_configs + "/V99000A.yaml", registry=None)
+    hpge_BG = pygeomhpges.make_hpge(test_data_configs + "/B99000A.yaml", registry=None)
+
+    # computed once per detector and surface type
+    tables = utils.DetectorSamplingCache.get(hpge_IC, "nplus")
+    assert utils.DetectorSamplingCache.get(hpge_IC, "nplus") is tables
+    assert utils.DetectorSamplingCache.get(hpge_IC) is not tables
+
+    r, z = hpge_IC.get_profile()
+    assert tables.radius == max(r)
+    assert tables.height == max(z)
+    assert np.array_equal(
+        tables.surface_indices, utils.get_surface_indices(hpge_IC, "nplus")
+    )
+    assert tables.surface_area == pytest.approx(
+        np.sum(hpge_IC.surface_area(tables.surface_indices).magnitude)
+    )
+    assert tables.borehole_volume == utils.get_borehole_volume(hpge_IC)
+    assert tables.borehole_radius == 5
+    assert tables.borehole_z_range == (25, 80)
+
+    # the surfaces are drawn in proportion to their area
+    sides = tables.sample_sides(np.random.default_rng(1).random(100_000))
+    fractions = [np.mean(sides == idx) for idx in tables.surface_indices]
+    assert np.allclose(fractions, tables.areas / tables.surface_area, atol=0.01)
+
+    # no borehole
+    assert utils.DetectorSamplingCache.get(hpge_BG).borehole_volume is None
+
+    # no surfaces to sample on, so no vertices
+    empty = utils.DetectorSamplingCache(hpge_BG, "other")
+    assert empty.surface_area == 0
+    assert len(empty.sample_sides(np.empty(0))) == 0
+    with pytest.raises(ValueError, match="surface of type"):
+        empty.sample_sides(np.full(10, 0.5))
+    with pytest.raises(ValueError, match="surface of type"):
+        utils.get_surface_weights({"B99000A": hpge_BG}, "other")
+
+    # the tables do not depend on the detector object, e.g. for the workers
+    copy = pickle.loads(pickle.dumps(tables))
+    assert np.array_equal(copy.area_cdf, tables.area_cdf)
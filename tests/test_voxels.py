@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import hist
+import lh5
+import numpy as np
+import pytest
+
+from revertex import core
+from revertex.generators.voxels import sample_voxels
+from revertex.sampling import HistogramSampler
+
+
+def _activity_map():
+    edges = [np.linspace(0, 10, 11), np.linspace(-5, 5, 6), np.linspace(0, 2, 5)]
+
+    # two hot voxels and a weaker one
+    counts = np.zeros((10, 5, 4))
+    counts[1, 2, 3] = 10
+    counts[7, 0, 0] = 10
+    counts[4, 4, 1] = 5
+
+    return counts, edges
+
+
+def test_sample_voxels():
+    counts, edges = _activity_map()
+
+    sampler = HistogramSampler(counts, edges)
+    assert sampler.ndim == 3
+    assert len(sampler.index) == 3
+
+    coords = sample_voxels(100_000, seed=1, sampler=sampler)
+    assert coords.shape == (100_000, 3)
+
+    # every vertex is in a non-empty voxel, in proportion to its activity
+    observed, _ = np.histogramdd(coords, bins=edges)
+    assert np.sum(observed) == 100_000
+    assert np.all(observed[counts == 0] == 0)
+    expected = counts[counts > 0] / np.sum(counts) * 100_000
+    assert np.allclose(observed[counts > 0], expected, rtol=0.05)
+
+    # the same sampler from the histogram or the non-empty voxels
+    histo = hist.Hist(*(hist.axis.Variable(e) for e in edges))
+    histo[...] = counts
+    index = np.argwhere(counts)
+    reference = sample_voxels(100, seed=2, sampler=sampler)
+    for other in [
+        HistogramSampler(histo),
+        HistogramSampler.from_voxels(index, counts[tuple(index.T)], edges),
+    ]:
+        assert np.allclose(sample_voxels(100, seed=2, sampler=other), reference)
+
+    with pytest.raises(ValueError):
+        sample_voxels(10, sampler=HistogramSampler(counts[0], edges[1:]))
+
+    with pytest.raises(ValueError):
+        HistogramSampler(counts, edges[:2])
+
+    with pytest.raises(TypeError):
+        HistogramSampler(counts)
+
+
+def test_write_voxels(tmptestdir):
+    counts, edges = _activity_map()
+    sampler = HistogramSampler(counts, edges)
+
+    core.write_remage_vtx(
+        1050,
+        f"{tmptestdir}/vtx_voxels.lh5",
+        seed=42,
+        generator=sample_voxels,
+        chunk_size=100,
+        sampler=sampler,
+    )
+    pos = lh5.read("vtx/pos", f"{tmptestdir}/vtx_voxels.lh5").view_as("ak")
+    assert len(pos) == 1050
+
+    # the configuration, and so the checkpoint, only depends on the map
+    assert core.config_hash({"sampler": sampler}) == core.config_hash(
+        {"sampler": HistogramSampler(counts, edges)}
+    )
+    assert core.config_hash({"sampler": sampler}) != core.config_hash(
+        {"sampler": HistogramSampler(2 * counts, edges)}
+    )